@@ -0,0 +1,261 @@
+"""Micro-benchmarks of the hot paths of CRAG: road synthesis, the
+self-intersection check, seed matching, seed selection, the backend output
+parsers, and a whole CRAG.generate loop with the synthetic evaluator of the
+crag module. Every benchmark runs for all combinations of the given road
+section counts, parameter value counts and strengths, on test suites
+generated by the IPOG backend. Results are written as JSON, and a results
+file of an earlier commit can be given to print the ratios of the timings.
+
+Run from the crag_project folder as
+
+    python -m benchmarks.hot_paths --strengths 2 3 --output results.json
+    python -m benchmarks.hot_paths --strengths 2 3 --baseline results.json
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import math
+import platform
+import random
+import statistics
+import subprocess
+import time
+import numpy as np
+
+from crag import acts
+from crag import cagen
+from crag import crag
+from crag import ipog
+from crag import pict
+from crag import roadgeometry as rg
+from crag import utils
+
+MAP_SIZE = 200
+LANE_WIDTH = 10
+MIN_RADIUS = 15
+MIN_ROAD_SCALAR = 0.6
+MAX_ROAD_SCALAR = 1.2
+
+
+def setup_parser():
+    parser = argparse.ArgumentParser(description="CRAG hot path benchmarks")
+    parser.add_argument("--road-section-counts", type=int, nargs="+", default=[5],
+                        help="Road section counts to benchmark.")
+    parser.add_argument("--param-value-counts", type=int, nargs="+", default=[5],
+                        help="Parameter value counts to benchmark.")
+    parser.add_argument("--strengths", type=int, nargs="+", default=[2, 3],
+                        help="Strengths of the benchmarked test suites.")
+    parser.add_argument("--benchmarks", type=str, nargs="+", default=None,
+                        help="Names of the benchmarks to run. All if not given.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Number of timed repetitions of every benchmark.")
+    parser.add_argument("--generate-budget", type=int, default=200,
+                        help="Number of evaluations in the CRAG.generate benchmark.")
+    parser.add_argument("--best-ratio", type=float, default=0.1,
+                        help="Ratio of the test suite used as seeds.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the random number generators.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="File for the JSON results. Printed to standard output if not given.")
+    parser.add_argument("--baseline", type=str, default=None,
+                        help="JSON results of an earlier run to compare with.")
+    return parser
+
+
+def get_geometry_params(road_section_count, param_value_count):
+    return {"road_section_count": road_section_count, "param_value_count": param_value_count,
+            "max_road_scalar": MAX_ROAD_SCALAR, "min_road_scalar": MIN_ROAD_SCALAR,
+            "lane_width": LANE_WIDTH, "map_size": MAP_SIZE, "min_radius": MIN_RADIUS}
+
+
+def get_core_params(strength, best_ratio):
+    return {"use_seed": True, "seed_best": True, "best_ratio": best_ratio, "resample": True,
+            "fitness_aggregation_method": "average", "max_strength": max(strength, 2)}
+
+
+def synthetic_evaluate_function(road):
+    """The evaluate function of the __main__ block of the crag module."""
+    (road_points, is_in_map, is_reframable) = road
+    if (not is_in_map) and (not is_reframable):
+        return [100]
+    if rg.is_likely_self_intersecting(road_points, LANE_WIDTH):
+        return [100]
+    if not is_reframable:
+        return [100]
+    return [road_points[-1][0]]
+
+
+def create_crag(road_section_count, param_value_count, strength, best_ratio, budget):
+    """Creates CRAG with the IPOG backend and the synthetic evaluator that
+    stops after budget evaluations."""
+    evaluation_count = 0
+
+    def evaluate_function(road):
+        nonlocal evaluation_count
+        evaluation_count += 1
+        return synthetic_evaluate_function(road)
+
+    def budget_availability_function():
+        return evaluation_count < budget
+
+    return crag.CRAG(get_core_params(strength, best_ratio), get_geometry_params(road_section_count, param_value_count),
+                     ipog.IPOGTestSuiteGenerator(), evaluate_function, budget_availability_function)
+
+
+def measure(function, repeat):
+    """Returns the timings in seconds of repeat calls of function."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def get_benchmarks(road_section_count, param_value_count, strength, best_ratio, generate_budget):
+    """Returns a dictionary from benchmark names to (function, item count)
+    pairs for the given configuration. The item count is the number of
+    roads, tests, or evaluations a call of the function processes."""
+    crag1 = create_crag(road_section_count, param_value_count, strength, best_ratio, generate_budget)
+    test_suite = crag1.test_suite_generator.generate_test_suite(strength)
+    evaluations = [[value] for value in np.random.uniform(0, MAP_SIZE, len(test_suite)).tolist()]
+    seed_test_suite = crag1.best_tuples(test_suite, evaluations, update=False)
+    m = max(strength - 1, 1)
+    crag_args = (crag1.param_value_count, crag1.min_segment_count, crag1.max_segment_count,
+                 crag1.global_curvature_bound, crag1.ds, crag1.lane_width, crag1.map_size)
+    (points, point_counts, _, _) = rg.generate_roads_with_reframability_check(test_suite, *crag_args)
+    roads_points = [list(map(tuple, road_points[:point_count].tolist()))
+                    for (road_points, point_count) in zip(points, point_counts)]
+    road_kappas = [np.repeat(np.random.uniform(-crag1.global_curvature_bound, crag1.global_curvature_bound,
+                                               road_section_count),
+                             np.random.randint(crag1.min_segment_count, crag1.max_segment_count + 1,
+                                               road_section_count)).tolist()
+                   for _ in range(len(test_suite))]
+    tsg = crag1.test_suite_generator
+    pict_output = "\n".join(["pict output", tsg.get_seed_string(test_suite, "\t")])
+    acts_output = "\n".join(["# ACTS Test Suite Generation", tsg.get_seed_string(test_suite, ",")])
+    cagen_output = "\n".join(tsg.get_seed_string(test_suite, ",").splitlines()[1:])
+    possible_indices = [str(i) for i in range(param_value_count)]
+
+    def frenet_to_cartesian():
+        for kappas in road_kappas:
+            rg.frenet_to_cartesian_road_points_with_reframability_check(0, 0, random.uniform(0, 2 * math.pi),
+                                                                        crag1.ds, kappas, LANE_WIDTH, MAP_SIZE)
+
+    def generate_road():
+        half = road_section_count
+        for test in test_suite.tolist():
+            rg.generate_road_with_reframability_check(test[:half], test[half:], *crag_args)
+
+    def generate_roads():
+        rg.generate_roads_with_reframability_check(test_suite, *crag_args)
+
+    def is_likely_self_intersecting():
+        for road_points in roads_points:
+            rg.is_likely_self_intersecting(road_points, LANE_WIDTH)
+
+    def are_likely_self_intersecting():
+        rg.are_likely_self_intersecting(points, point_counts, LANE_WIDTH)
+
+    def has_m_match():
+        seeds = seed_test_suite.tolist()
+        for test in test_suite.tolist():
+            utils.has_m_match(test, seeds, m)
+
+    def m_match_mask():
+        utils.m_match_mask(test_suite, seed_test_suite, m)
+
+    def best_tuples():
+        crag1.best_tuples(test_suite, evaluations, update=False)
+
+    def generate():
+        create_crag(road_section_count, param_value_count, strength, best_ratio, generate_budget).generate()
+
+    return {"frenet_to_cartesian_road_points_with_reframability_check": (frenet_to_cartesian, len(road_kappas)),
+            "generate_road_with_reframability_check": (generate_road, len(test_suite)),
+            "generate_roads_with_reframability_check": (generate_roads, len(test_suite)),
+            "is_likely_self_intersecting": (is_likely_self_intersecting, len(roads_points)),
+            "are_likely_self_intersecting": (are_likely_self_intersecting, len(roads_points)),
+            "has_m_match": (has_m_match, len(test_suite)),
+            "m_match_mask": (m_match_mask, len(test_suite)),
+            "best_tuples": (best_tuples, len(test_suite)),
+            "parse_pict_command_result": (lambda: pict.parse_pict_command_result(pict_output), len(test_suite)),
+            "parse_acts_command_result": (lambda: acts.parse_acts_command_result(acts_output), len(test_suite)),
+            "parse_cagen_command_result": (lambda: cagen.parse_cagen_command_result(cagen_output, possible_indices),
+                                           len(test_suite)),
+            "generate": (generate, generate_budget)}
+
+
+def run(road_section_counts, param_value_counts, strengths, benchmark_names, repeat, generate_budget, best_ratio, seed):
+    results = []
+    for (road_section_count, param_value_count, strength) in itertools.product(road_section_counts,
+                                                                               param_value_counts, strengths):
+        random.seed(seed)
+        np.random.seed(seed)
+        benchmarks = get_benchmarks(road_section_count, param_value_count, strength, best_ratio, generate_budget)
+        for (name, (function, item_count)) in benchmarks.items():
+            if benchmark_names is not None and name not in benchmark_names:
+                continue
+            random.seed(seed)
+            np.random.seed(seed)
+            timings = measure(function, repeat)
+            results.append({"benchmark": name,
+                            "road_section_count": road_section_count,
+                            "param_value_count": param_value_count,
+                            "strength": strength,
+                            "item_count": item_count,
+                            "min_seconds": min(timings),
+                            "median_seconds": statistics.median(timings),
+                            "seconds_per_item": min(timings) / max(item_count, 1),
+                            "timings": timings})
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    return (result["benchmark"], result["road_section_count"], result["param_value_count"], result["strength"])
+
+
+def compare(results, baseline_results):
+    """Prints the ratio of the minimum timings of results to those of the
+    same benchmarks in baseline_results (above 1 means slower)."""
+    baseline = {result_key(result): result for result in baseline_results}
+    for result in results:
+        key = result_key(result)
+        if key in baseline:
+            ratio = result["min_seconds"] / baseline[key]["min_seconds"]
+            print(f"{key[0]} (sections={key[1]}, values={key[2]}, strength={key[3]}): {ratio:.3f}")
+
+
+def main():
+    args = setup_parser().parse_args()
+    results = run(args.road_section_counts, args.param_value_counts, args.strengths, args.benchmarks,
+                  args.repeat, args.generate_budget, args.best_ratio, args.seed)
+    report = {"commit": get_commit(),
+              "date": datetime.datetime.now().isoformat(),
+              "python": platform.python_version(),
+              "numpy": np.__version__,
+              "repeat": args.repeat,
+              "seed": args.seed,
+              "results": results}
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
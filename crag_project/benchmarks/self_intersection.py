@@ -0,0 +1,80 @@
+"""Benchmark comparing the batch self-intersection check of roadgeometry
+against the shapely-based check applied road by road.
+
+Run from the crag_project folder as
+
+    python -m benchmarks.self_intersection --road-count 10000
+"""
+
+import argparse
+import math
+import time
+import numpy as np
+
+from crag import roadgeometry as rg
+
+
+def setup_parser():
+    parser = argparse.ArgumentParser(description="Self-intersection check benchmark")
+    parser.add_argument("--road-count", type=int, default=10000,
+                        help="Number of roads in the benchmarked suite.")
+    parser.add_argument("--road-section-count", type=int, default=5,
+                        help="How many sections each generated road should have.")
+    parser.add_argument("--param-value-count", type=int, default=5,
+                        help="How many values length and kappa parameters in a section has.")
+    parser.add_argument("--lane-width", type=float, default=10,
+                        help="The width of lane in units consistent with map size.")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the random number generator.")
+    return parser
+
+
+def generate_suite_roads(road_count, road_section_count, param_value_count, lane_width, map_size=200,
+                         min_radius=15, min_road_scalar=0.6, max_road_scalar=1.2):
+    """Generates roads of a random test suite with the same geometry
+    derivations as the CRAG class."""
+    n = 70
+    ds = 2 * min_radius * math.sin(math.pi / n)
+    min_segment_count = int((map_size * min_road_scalar / road_section_count) / ds)
+    max_segment_count = int((map_size * max_road_scalar / road_section_count) / ds)
+    global_curvature_bound = 2 * math.pi / (n * ds)
+    test_suite = np.random.randint(0, param_value_count, (road_count, 2 * road_section_count))
+    return rg.generate_roads_with_reframability_check(test_suite, param_value_count,
+                                                      min_segment_count, max_segment_count,
+                                                      global_curvature_bound, ds, lane_width, map_size)
+
+
+def run(road_count, road_section_count, param_value_count, lane_width, seed):
+    np.random.seed(seed)
+    (points, point_counts, _, _) = generate_suite_roads(road_count, road_section_count,
+                                                        param_value_count, lane_width)
+    roads_points = [[tuple(point) for point in road_points[:point_count]]
+                    for (road_points, point_count) in zip(points.tolist(), point_counts)]
+
+    start = time.perf_counter()
+    batch_verdicts = rg.are_likely_self_intersecting(points, point_counts, lane_width)
+    batch_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    shapely_verdicts = np.array([rg.is_likely_self_intersecting(road_points, lane_width)
+                                 for road_points in roads_points])
+    shapely_time = time.perf_counter() - start
+
+    return {"road_count": road_count,
+            "batch_seconds": batch_time,
+            "shapely_seconds": shapely_time,
+            "speedup": shapely_time / batch_time,
+            "flagged_by_batch": int(batch_verdicts.sum()),
+            "flagged_by_shapely": int(shapely_verdicts.sum()),
+            "disagreements": int((batch_verdicts != shapely_verdicts).sum())}
+
+
+def main():
+    args = setup_parser().parse_args()
+    result = run(args.road_count, args.road_section_count, args.param_value_count, args.lane_width, args.seed)
+    for (key, value) in result.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
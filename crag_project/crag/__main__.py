@@ -2,8 +2,10 @@
 
 from . import roadgeometry as rg
 from . import crag
+from . import wire
 import argparse
-import json
+import math
+import os
 import sys
 
 def setup_parser():
@@ -23,6 +25,33 @@ def setup_parser():
                         help="When a test is rerun for evaluation, how to aggregate available fitness values.")
     parser.add_argument("--max-strength", type=int, default=5,
                         help="Maximum strength for combinatorial test generation.")
+    parser.add_argument("--random-seed", type=int, default=None,
+                        help="Seed of the random and numpy.random generators. Not seeded if not given.")
+    parser.add_argument("--prefetch", action="store_true",
+                        help="Generate the test suite of the next step in the background while roads are evaluated.")
+    parser.add_argument("--prefetch-ratio", type=float, default=0.5,
+                        help="Ratio of evaluated tests after which the next seeded test suite is requested in prefetch mode.")
+    parser.add_argument("--prioritize", action="store_true",
+                        help="Evaluate tests of a test suite in the order of fitness predicted from earlier evaluations.")
+    parser.add_argument("--prioritization-strength", type=int, default=2,
+                        help="Size of parameter tuples whose value combinations are used for predicting fitness.")
+    parser.add_argument("--screen-roads", action="store_true",
+                        help="Resample roads that cannot be reframed into the map or are self-intersecting before evaluation.")
+    parser.add_argument("--screening-retries", type=int, default=10,
+                        help="How many times an invalid road is resampled before its configuration is considered infeasible.")
+    parser.add_argument("--infeasible-fitness", type=float, default=1000,
+                        help="Fitness of configurations without a valid road. Such roads are not sent for evaluation.")
+    parser.add_argument("--search-strategy", choices=["sample", "repetition", "evolution"], default="sample",
+                        help="Evaluate one sampled road per test, the best of several sampled roads per test, "
+                             "or the best road found by a (1+lambda) evolution strategy per test.")
+    parser.add_argument("--repetition-count", type=int, default=5,
+                        help="Number of roads sampled and evaluated per test in repetition search.")
+    parser.add_argument("--repetition-early-stop", action="store_true",
+                        help="Stop the repetitions of a test once a road is better than the last seeds.")
+    parser.add_argument("--evolution-generation-count", type=int, default=5,
+                        help="Number of generations per test in evolution search.")
+    parser.add_argument("--evolution-mutant-count", type=int, default=1,
+                        help="Number of mutants (lambda) evaluated as one batch per generation in evolution search.")
 
     # ROAD GEOMETRY arguments
     parser.add_argument("--road-section-count", type=int, default=5,
@@ -40,10 +69,63 @@ def setup_parser():
     parser.add_argument("--min-radius", type=float, default=15,
                         help="Threshold in units consistent with map size for sharpness of generated roads.")
 
+    # PROTOCOL arguments
+    parser.add_argument("--protocol", choices=["sequential", "pipelined"], default="sequential",
+                        help="Communication protocol over standard input and output.")
+    parser.add_argument("--max-roads-in-flight", type=int, default=4,
+                        help="Number of roads that can wait for their evaluations in pipelined protocol.")
+    parser.add_argument("--wire-format", choices=["json", "float32", "float64"], default="json",
+                        help="Format of roads and evaluations. float32 and float64 select binary frames.")
+
+    # CHECKPOINT arguments
+    parser.add_argument("--checkpoint-filepath", type=str, default=None,
+                        help="File for saving the search state periodically. No checkpoints if not given.")
+    parser.add_argument("--checkpoint-interval", type=int, default=100,
+                        help="Number of evaluations between checkpoints (a checkpoint is also saved after every step).")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue from the checkpoint in checkpoint filepath if it exists.")
+
+    # EVALUATION CACHE arguments
+    parser.add_argument("--evaluation-cache-filepath", type=str, default=None,
+                        help="SQLite file for caching fitness values of roads across runs. No caching if not given.")
+    parser.add_argument("--evaluation-cache-max-size", type=int, default=1 << 20,
+                        help="Maximum number of cached fitness values. Least recently used ones are evicted.")
+    parser.add_argument("--evaluation-cache-kappa-resolution", type=float, default=0.0,
+                        help="Kappas of roads are rounded to multiples of this value in cache keys (exact if 0).")
+
+    # METRICS arguments
+    parser.add_argument("--metrics-json-filepath", type=str, default=None,
+                        help="File for a JSON snapshot of phase timers and counters. Metrics are collected if given.")
+    parser.add_argument("--metrics-prometheus-filepath", type=str, default=None,
+                        help="File for the metrics in Prometheus text format. Metrics are collected if given.")
+    parser.add_argument("--penalty-fitness", type=float, default=None,
+                        help="Evaluations with at least this fitness are counted as penalized in the metrics.")
+
+    # SURROGATE arguments
+    parser.add_argument("--surrogate-model", choices=["knn", "ridge"], default=None,
+                        help="Model predicting fitness of roads from their curvature features. No pre-screening if not given.")
+    parser.add_argument("--surrogate-min-sample-count", type=int, default=20,
+                        help="Number of evaluated roads the surrogate is trained on before roads are skipped.")
+    parser.add_argument("--surrogate-skip-quantile", type=float, default=0.5,
+                        help="Roads predicted to be worse than this quantile of evaluated fitness values are skipped.")
+    parser.add_argument("--surrogate-exploration-rate", type=float, default=0.1,
+                        help="Probability of evaluating a road that the surrogate would skip.")
+    parser.add_argument("--surrogate-neighbor-count", type=int, default=5,
+                        help="Number of nearest evaluated roads averaged by the knn surrogate.")
+    parser.add_argument("--surrogate-max-sample-count", type=int, default=4096,
+                        help="Number of most recent evaluated roads the surrogate is trained on.")
+    parser.add_argument("--surrogate-report-filepath", type=str, default=None,
+                        help="File for JSON lines of skipped roads and their predicted fitness. Not written if not given.")
+
     # BACKEND arguments
-    parser.add_argument("--backend", choices=["pict", "acts", "cagen"], default="pict",
+    parser.add_argument("--backend", choices=["pict", "acts", "cagen", "ipog"], default="pict",
                         help="Backend used for combinatorial test generation for given strength and seeds.")
 
+    parser.add_argument("--backend-cache-dirpath", type=str, default=None,
+                        help="Folder for caching test suites generated by the backend. No caching if not given.")
+    parser.add_argument("--backend-cache-max-bytes", type=int, default=100 * 1024 * 1024,
+                        help="Maximum total size of cached test suites. Least recently used ones are evicted.")
+
     # ACTS-specific arguments
     parser.add_argument("--acts-java-executable-filepath", type=str, default="java",
                         help="Java executable filepath as needed by ACTS.")
@@ -73,15 +155,25 @@ def setup_parser():
     return parser
 
 
-def get_evaluate_and_budget_availability_functions():
+def get_channel(wire_format, with_ids):
+    """Channel for sending roads and receiving evaluations in given format."""
+    if wire_format == "json":
+        return wire.JSONChannel(sys.stdin, sys.stdout, with_ids)
+    return wire.BinaryChannel(sys.stdin.buffer, sys.stdout.buffer, wire.POINT_DTYPES[wire_format])
+
+
+def get_evaluate_and_budget_availability_functions(channel):
     """Communication with CRAG cli is over standard input and output. """
-    crag_state = {"budget_available": True}
+    crag_state = {"budget_available": True, "next_road_id": 0}
 
     def evaluate_function(road):
-        road_str = json.dumps(road)
-        print(road_str, file=sys.stdout, flush=True)
-        line = sys.stdin.readline().strip()
-        arr = json.loads(line)
+        channel.send_road(crag_state["next_road_id"], road)
+        crag_state["next_road_id"] += 1
+        message = channel.receive()
+        if message is None:
+            crag_state["budget_available"] = False
+            return [math.inf]
+        arr = message["evaluation"]
         if len(arr) > 1:
             if arr[-1] == "EXIT":
                 crag_state["budget_available"] = False
@@ -93,13 +185,79 @@ def get_evaluate_and_budget_availability_functions():
     return evaluate_function, budget_availability_function
 
 
+def get_batch_evaluate_and_budget_availability_functions(channel, max_roads_in_flight):
+    """Pipelined communication with CRAG cli over standard input and output.
+    Each road is sent with an id and up to max_roads_in_flight roads are sent
+    before their evaluations arrive. Evaluations are received with the ids of
+    their roads in any order. A request message changes the number of roads in flight."""
+    crag_state = {"budget_available": True, "next_road_id": 0, "max_roads_in_flight": max_roads_in_flight}
+
+    def batch_evaluate_function(roads):
+        pending_indices = {}
+        next_index = 0
+        while next_index < len(roads) or pending_indices:
+            while (next_index < len(roads) and len(pending_indices) < crag_state["max_roads_in_flight"]
+                   and crag_state["budget_available"]):
+                road_id = crag_state["next_road_id"]
+                crag_state["next_road_id"] += 1
+                channel.send_road(road_id, roads[next_index])
+                pending_indices[road_id] = next_index
+                next_index += 1
+            if not pending_indices:
+                return
+            message = channel.receive()
+            if message is None:
+                crag_state["budget_available"] = False
+                return
+            if "request" in message:
+                crag_state["max_roads_in_flight"] = max(1, int(message["request"]))
+                continue
+            arr = message["evaluation"]
+            if len(arr) > 1:
+                if arr[-1] == "EXIT":
+                    crag_state["budget_available"] = False
+            yield (pending_indices.pop(message["id"]), arr)
+
+    def budget_availability_function():
+        return crag_state["budget_available"]
+
+    return batch_evaluate_function, budget_availability_function
+
+
 def main():
     parser = setup_parser()
     args = parser.parse_args()
+    if args.search_strategy == "repetition" and args.protocol == "pipelined":
+        parser.error("--search-strategy repetition requires the sequential protocol.")
 
     core_params = {"use_seed": args.use_seed, "seed_best": args.seed_best, "best_ratio": args.best_ratio,
                    "resample": args.resample, "fitness_aggregation_method": args.fitness_aggregation_method,
-                   "max_strength": args.max_strength}
+                   "max_strength": args.max_strength, "random_seed": args.random_seed, "prefetch": args.prefetch,
+                   "prefetch_ratio": args.prefetch_ratio, "prioritize": args.prioritize,
+                   "prioritization_strength": args.prioritization_strength, "screen_roads": args.screen_roads,
+                   "screening_retries": args.screening_retries, "infeasible_fitness": args.infeasible_fitness,
+                   "checkpoint_filepath": args.checkpoint_filepath, "checkpoint_interval": args.checkpoint_interval,
+                   "evaluation_cache_filepath": args.evaluation_cache_filepath,
+                   "evaluation_cache_max_size": args.evaluation_cache_max_size,
+                   "evaluation_cache_kappa_resolution": args.evaluation_cache_kappa_resolution,
+                   "collect_metrics": args.metrics_json_filepath is not None
+                                      or args.metrics_prometheus_filepath is not None,
+                   "metrics_json_filepath": args.metrics_json_filepath,
+                   "metrics_prometheus_filepath": args.metrics_prometheus_filepath,
+                   "penalty_fitness": args.penalty_fitness,
+                   "search_strategy": args.search_strategy, "repetition_count": args.repetition_count,
+                   "repetition_early_stop": args.repetition_early_stop,
+                   "evolution_generation_count": args.evolution_generation_count,
+                   "evolution_mutant_count": args.evolution_mutant_count,
+                   # Roads are sent one at a time over standard output
+                   "repetition_workers": 1,
+                   "surrogate_model": args.surrogate_model,
+                   "surrogate_min_sample_count": args.surrogate_min_sample_count,
+                   "surrogate_skip_quantile": args.surrogate_skip_quantile,
+                   "surrogate_exploration_rate": args.surrogate_exploration_rate,
+                   "surrogate_neighbor_count": args.surrogate_neighbor_count,
+                   "surrogate_max_sample_count": args.surrogate_max_sample_count,
+                   "surrogate_report_filepath": args.surrogate_report_filepath}
 
     geometry_params = {"road_section_count": args.road_section_count, "param_value_count": args.param_value_count,
                        "max_road_scalar": args.max_road_scalar, "min_road_scalar": args.min_road_scalar,
@@ -116,16 +274,37 @@ def main():
         tsg = cagen.CAgenTestSuiteGenerator(args.cagen_executable_filepath,
                                             args.cagen_input_filepath,
                                             args.cagen_output_filepath)
+    elif args.backend == "ipog":
+        from . import ipog
+        tsg = ipog.IPOGTestSuiteGenerator()
     else: # pict
         from . import pict
         tsg = pict.PictTestSuiteGenerator(args.pict_executable_filepath,
                                           args.pict_model_filepath,
                                           args.pict_seed_filepath)
 
-    evaluate_function, budget_availability_function = get_evaluate_and_budget_availability_functions()
+    if args.backend_cache_dirpath is not None:
+        from . import tscache
+        tsg = tscache.CachedTestSuiteGenerator(tsg, args.backend_cache_dirpath, args.backend_cache_max_bytes)
+
+    channel = get_channel(args.wire_format, with_ids=(args.protocol == "pipelined"))
+    if args.protocol == "pipelined":
+        evaluate_function = None
+        batch_evaluate_function, budget_availability_function = \
+            get_batch_evaluate_and_budget_availability_functions(channel, args.max_roads_in_flight)
+    else: # sequential
+        batch_evaluate_function = None
+        evaluate_function, budget_availability_function = get_evaluate_and_budget_availability_functions(channel)
 
-    crag1 = crag.CRAG(core_params, geometry_params, tsg, evaluate_function, budget_availability_function)
-    crag1.generate()
+    crag1 = crag.CRAG(core_params, geometry_params, tsg, evaluate_function, budget_availability_function,
+                      batch_evaluate_function)
+    # Evaluations are only sent to the client, so they are not kept in memory
+    if args.resume and args.checkpoint_filepath is not None and os.path.exists(args.checkpoint_filepath):
+        records = crag1.iter_resume()
+    else:
+        records = crag1.iter_generate()
+    for _ in records:
+        pass
 
 
 main()
@@ -3,16 +3,17 @@ This module provides CAgenTestSuiteGenerator to extend TestSuiteGenerator
 to be able to use CAgen tool as a backend.
 """
 
+import numpy as np
 from . import tsgenerator as tsgen
 from . import utils
 
 
 def parse_acts_command_result(acts_command_result):
-    """Parses acts command result string into a list of lists of ints.
+    """Parses acts command result string into a matrix of ints with a row for every test.
     Since the actual result starts after several lines, we first identify
     the starting point."""
     start_line = utils.line_index(acts_command_result, "Length0") + 1
-    return [[int(index_str) for index_str in line.split(",")] for line in acts_command_result.splitlines()[start_line:]]
+    return np.array([line.split(",") for line in acts_command_result.splitlines()[start_line:]], dtype=tsgen.TEST_DTYPE)
 
 
 """This class extends TestSuiteGenerator for ACTS backend."""
@@ -28,6 +29,9 @@ class ACTSTestSuiteGenerator(tsgen.TestSuiteGenerator):
         self.input_filepath = input_filepath
         self.output_filepath = output_filepath
 
+    def get_backend_identity(self):
+        return f"{super().get_backend_identity()}:{self.java_executable_filepath}:{self.acts_jar_filepath}"
+
     def call_with_seed(self, strength, seed_test_suite):
         """Calls ACTS with given strength and seed test suite. Notice
         that the model is described in the input file which includes
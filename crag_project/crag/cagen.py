@@ -3,21 +3,22 @@ This module provides CAgenTestSuiteGenerator to extend TestSuiteGenerator
 to be able to use CAgen tool as a backend.
 """
 
+import numpy as np
 from . import tsgenerator as tsgen
 from . import utils
-import random as ra
 
 def index_str_to_int(index_str, possible_indices):
     """Convert string to integer, while also taking account unspecified values."""
     if index_str in possible_indices:
         return int(index_str)
     else:
-        return int(ra.choice(possible_indices))
+        return int(tsgen.python_random().choice(possible_indices))
 
 def parse_cagen_command_result(cagen_command_result, possible_indices):
-    """Parses cagen command result string into a list of lists of ints."""
+    """Parses cagen command result string into a matrix of ints with a row for every test."""
     start_line = 0
-    return [[index_str_to_int(index_str, possible_indices) for index_str in line.split(",")] for line in cagen_command_result.splitlines()[start_line:]]
+    return np.array([[index_str_to_int(index_str, possible_indices) for index_str in line.split(",")]
+                     for line in cagen_command_result.splitlines()[start_line:]], dtype=tsgen.TEST_DTYPE)
 
 
 """This class extends TestSuiteGenerator for CAgen backend."""
@@ -31,6 +32,9 @@ class CAgenTestSuiteGenerator(tsgen.TestSuiteGenerator):
         self.input_filepath = input_filepath
         self.output_filepath = output_filepath
 
+    def get_backend_identity(self):
+        return f"{super().get_backend_identity()}:{self.cagen_executable_filepath}"
+
     def call_with_seed(self, strength, seed_test_suite):
         """Calls CAgen with given strength and seed test suite. Notice
         that the model is described in the input file which includes
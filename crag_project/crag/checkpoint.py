@@ -0,0 +1,99 @@
+"""
+This module provides saving and loading of checkpoints of the search state
+of CRAG. A checkpoint is a pickled dictionary in which roads are kept in
+numpy arrays (Frenet parameters of FrenetRoads, or points of other roads,
+concatenated, with their counts and flags) instead of lists of objects.
+Checkpoints are written atomically, so that an interrupted write leaves
+the previous checkpoint intact.
+"""
+
+import pickle
+import numpy as np
+from . import roadgeometry as rg
+from . import roadrecord
+from . import utils
+
+CHECKPOINT_VERSION = 2
+
+# Kinds of roads in the arrays of roads_to_arrays
+INFEASIBLE_ROAD = 0
+POINTS_ROAD = 1
+FRENET_ROAD = 2
+
+
+def roads_to_arrays(roads):
+    """Converts roads into a dictionary of arrays. A road is a FrenetRoad,
+    whose parameters are kept, rg.INFEASIBLE, or of the form
+    (road_points, is_in_map, is_reframable), whose points are kept."""
+    kinds = np.array([FRENET_ROAD if isinstance(road, roadrecord.FrenetRoad)
+                      else INFEASIBLE_ROAD if rg.is_infeasible(road) else POINTS_ROAD for road in roads], dtype=np.int8)
+    points_roads = [road for (road, kind) in zip(roads, kinds) if kind == POINTS_ROAD]
+    frenet_roads = [road for (road, kind) in zip(roads, kinds) if kind == FRENET_ROAD]
+    point_counts = np.array([len(road[0]) for road in points_roads], dtype=np.int64)
+    points = np.zeros((int(point_counts.sum()), 2), dtype=np.float64)
+    if len(points) > 0:
+        points[:] = np.concatenate([np.asarray(road[0], dtype=np.float64).reshape(-1, 2) for road in points_roads])
+    section_counts = np.array([len(road.segment_counts) for road in frenet_roads], dtype=np.int64)
+    is_in_map = np.zeros(len(roads), dtype=bool)
+    is_in_map[kinds != INFEASIBLE_ROAD] = [road[1] for road in roads if not rg.is_infeasible(road)]
+    is_reframable = np.zeros(len(roads), dtype=bool)
+    is_reframable[kinds != INFEASIBLE_ROAD] = [road[2] for road in roads if not rg.is_infeasible(road)]
+    return {"kinds": kinds, "points": points, "point_counts": point_counts,
+            "theta0s": np.array([road.theta0 for road in frenet_roads], dtype=np.float64),
+            "ds": np.array([road.ds for road in frenet_roads], dtype=np.float64),
+            "lane_widths": np.array([road.lane_width for road in frenet_roads], dtype=np.float64),
+            "reframe_origins": np.array([road.reframe_origin or (np.nan, np.nan) for road in frenet_roads],
+                                        dtype=np.float64).reshape(-1, 2),
+            "section_counts": section_counts,
+            "segment_counts": np.concatenate([road.segment_counts for road in frenet_roads]
+                                             + [np.zeros(0, dtype=np.int32)]),
+            "section_kappas": np.concatenate([road.section_kappas for road in frenet_roads] + [np.zeros(0)]),
+            "is_in_map": is_in_map, "is_reframable": is_reframable}
+
+
+def roads_from_arrays(arrays):
+    """Inverse of roads_to_arrays."""
+    point_ends = np.cumsum(arrays["point_counts"]).tolist()
+    section_ends = np.cumsum(arrays["section_counts"]).tolist()
+    xs = arrays["points"][:, 0].tolist()
+    ys = arrays["points"][:, 1].tolist()
+    roads = []
+    points_index = 0
+    frenet_index = 0
+    for (index, kind) in enumerate(arrays["kinds"].tolist()):
+        is_in_map = bool(arrays["is_in_map"][index])
+        is_reframable = bool(arrays["is_reframable"][index])
+        if kind == INFEASIBLE_ROAD:
+            roads.append(rg.INFEASIBLE)
+        elif kind == POINTS_ROAD:
+            end = point_ends[points_index]
+            begin = end - int(arrays["point_counts"][points_index])
+            roads.append((list(zip(xs[begin:end], ys[begin:end])), is_in_map, is_reframable))
+            points_index += 1
+        else:
+            end = section_ends[frenet_index]
+            begin = end - int(arrays["section_counts"][frenet_index])
+            reframe_origin = arrays["reframe_origins"][frenet_index]
+            roads.append(roadrecord.FrenetRoad(arrays["theta0s"][frenet_index], arrays["ds"][frenet_index],
+                                               arrays["segment_counts"][begin:end],
+                                               arrays["section_kappas"][begin:end],
+                                               arrays["lane_widths"][frenet_index],
+                                               reframe_origin if is_reframable else None,
+                                               is_in_map, is_reframable))
+            frenet_index += 1
+    return roads
+
+
+def save_checkpoint(filepath, state):
+    """Writes the state dictionary into filepath atomically."""
+    utils.write_atomically(filepath, lambda f: pickle.dump({"version": CHECKPOINT_VERSION, "state": state}, f,
+                                                           protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def load_checkpoint(filepath):
+    """Reads the state dictionary written by save_checkpoint."""
+    with open(filepath, "rb") as f:
+        checkpoint = pickle.load(f)
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {checkpoint.get('version')} in {filepath}.")
+    return checkpoint["state"]
@@ -2,22 +2,89 @@
 This module provides the main class for CRAG.
 """
 
+import contextlib
+import heapq
 import math
+import random
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from . import checkpoint
+from . import evalcache
+from . import evolution
+from . import fidelity
+from . import fitnesstable
+from . import metrics
+from . import parallel
+from . import prioritizer
+from . import repetition
 from . import roadgeometry as rg
+from . import roadrecord
+from . import surrogate
+from . import tsgenerator as tsgen
 from . import utils
 
+# Marker returned by search_roads for tests without a valid road
+INFEASIBLE = rg.INFEASIBLE
+
+# Strategies of finding roads for the tests of a test suite
+SEARCH_STRATEGIES = ["sample", "repetition", "evolution"]
+
+# Record yielded by iter_generate for every evaluation. fitness is evaluation[0]
+EvaluationRecord = namedtuple("EvaluationRecord", ["strength", "test", "road", "fitness", "evaluation"])
+
 
 class CRAG:
     """Combinatorial testing-based RoAd Generator"""
 
     def __init__(self, core_params, geometry_params, test_suite_generator,
-                 evaluate_function, budget_availability_function):
+                 evaluate_function, budget_availability_function, batch_evaluate_function=None,
+                 fidelity_levels=None):
         self.use_seed = core_params["use_seed"] # True/False
         self.seed_best = core_params["seed_best"] # True/False (Seed whole if False)
         self.best_ratio = core_params["best_ratio"] # [0,1]
         self.resample = core_params["resample"] # True/False
         self.fitness_aggregation_method = core_params["fitness_aggregation_method"]
         self.max_strength = core_params["max_strength"]
+        self.random_seed = core_params.get("random_seed", None) # Seed of random and np.random, not seeded if None
+        self.prefetch = core_params.get("prefetch", False) # True/False
+        self.prefetch_ratio = core_params.get("prefetch_ratio", 0.5) # [0,1]
+        self.evaluation_workers = core_params.get("evaluation_workers", 1) # Serial evaluation if 1
+        self.evaluation_chunk_size = core_params.get("evaluation_chunk_size", 4)
+        self.fitness_table_max_size = core_params.get("fitness_table_max_size", 1 << 20) # None for no bound
+        self.fitness_table_eviction_policy = core_params.get("fitness_table_eviction_policy", "least_recently_used")
+        self.prioritize = core_params.get("prioritize", False) # True/False
+        self.prioritization_strength = core_params.get("prioritization_strength", 2)
+        self.screen_roads = core_params.get("screen_roads", False) # True/False
+        self.screening_retries = core_params.get("screening_retries", 10)
+        self.infeasible_fitness = core_params.get("infeasible_fitness", 1000)
+        self.checkpoint_filepath = core_params.get("checkpoint_filepath", None) # No checkpoints if None
+        self.checkpoint_interval = core_params.get("checkpoint_interval", 100) # Evaluations between checkpoints
+        self.evaluation_cache_filepath = core_params.get("evaluation_cache_filepath", None) # No caching if None
+        self.evaluation_cache_max_size = core_params.get("evaluation_cache_max_size", 1 << 20) # None for no bound
+        self.evaluation_cache_kappa_resolution = core_params.get("evaluation_cache_kappa_resolution", 0.0) # Exact if 0
+        self.collect_metrics = core_params.get("collect_metrics", False) # True/False
+        self.metrics_json_filepath = core_params.get("metrics_json_filepath", None) # Not written if None
+        self.metrics_prometheus_filepath = core_params.get("metrics_prometheus_filepath", None) # Not written if None
+        self.penalty_fitness = core_params.get("penalty_fitness", None) # Fitness values from which roads are penalized
+        self.surrogate_model = core_params.get("surrogate_model", None) # "knn"/"ridge", no pre-screening if None
+        self.surrogate_min_sample_count = core_params.get("surrogate_min_sample_count", 20) # Evaluations before skipping
+        self.surrogate_skip_quantile = core_params.get("surrogate_skip_quantile", 0.5) # [0,1]
+        self.surrogate_exploration_rate = core_params.get("surrogate_exploration_rate", 0.1) # [0,1]
+        self.surrogate_neighbor_count = core_params.get("surrogate_neighbor_count", 5)
+        self.surrogate_max_sample_count = core_params.get("surrogate_max_sample_count", 4096)
+        self.surrogate_report_filepath = core_params.get("surrogate_report_filepath", None) # Not written if None
+        self.fidelity_promotion_ratio = core_params.get("fidelity_promotion_ratio", 0.2) # [0,1] or {strength: [0,1]}
+        self.search_strategy = core_params.get("search_strategy", "sample") # "sample"/"repetition"/"evolution"
+        self.repetition_count = core_params.get("repetition_count", 5) # Roads evaluated per test
+        self.repetition_workers = core_params.get("repetition_workers", 5) # Evaluations of repetitions in flight
+        self.repetition_batch_size = core_params.get("repetition_batch_size", 1) # Tests whose repetitions run together
+        self.repetition_early_stop = core_params.get("repetition_early_stop", False) # True/False
+        self.repetition_executor = core_params.get("repetition_executor", None) # Thread pool if None
+        self.evolution_generation_count = core_params.get("evolution_generation_count", 5)
+        self.evolution_mutant_count = core_params.get("evolution_mutant_count", 1) # Lambda of the (1+lambda)-ES
+        if self.search_strategy not in SEARCH_STRATEGIES:
+            raise ValueError(f"Unknown search strategy {self.search_strategy}.")
 
         self.road_section_count = geometry_params["road_section_count"]
         self.param_value_count = geometry_params["param_value_count"]
@@ -64,100 +131,875 @@ class CRAG:
         # Function that indicates availability of budget in execution of crag
         self.budget_availability_function = budget_availability_function
 
-        self.fitness_dictionary = {}
+        # Optional function that takes a list of roads and yields (index, evaluation)
+        # pairs in any order, as evaluations of the roads become available
+        self.batch_evaluate_function = batch_evaluate_function
+
+        # Optional FidelityLevels, from the cheapest, that evaluate roads before the evaluate function.
+        # Only the best roads of every level are promoted to the next one
+        self.fidelity_levels = list(fidelity_levels or [])
+
+        # Timers of phases and counters of roads (if collect_metrics)
+        self.metrics = metrics.Metrics() if self.collect_metrics else metrics.NullMetrics()
+
+        # Aggregated fitness values of tests, used for choosing seeds
+        self.fitness_table = self.create_fitness_table()
+        # Aggregated fitness values of every lower fidelity level, and numbers of evaluated and promoted roads
+        self.low_fidelity_tables = [self.create_fitness_table() for _ in self.fidelity_levels]
+        self.fidelity_statistics = [{"evaluated_count": 0, "promoted_count": 0} for _ in self.fidelity_levels]
+
+        # Statistics of invalid road samples (if screen_roads). The table keeps the
+        # ratio of invalid samples and the number of samples of every test
+        self.screening_statistics = {"sample_count": 0, "invalid_sample_count": 0, "infeasible_count": 0}
+        self.invalid_cell_table = self.create_fitness_table() if self.screen_roads else None
+
+        # Statistics of evaluations for ordering tests of a test suite (if prioritize)
+        self.prioritizer = None
+        if self.prioritize:
+            self.prioritizer = prioritizer.InteractionPrioritizer(2 * self.road_section_count, self.param_value_count,
+                                                                  self.prioritization_strength)
+
+        # Fitness values of roads from earlier evaluations, also of earlier runs (if evaluation_cache_filepath)
+        self.evaluation_cache = None
+        if self.evaluation_cache_filepath is not None:
+            self.evaluation_cache = evalcache.EvaluationCache(self.evaluation_cache_filepath,
+                                                              self.evaluation_cache_max_size)
+
+        # Model predicting the fitness of roads, trained on evaluations (if surrogate_model)
+        self.surrogate = None
+        self.surrogate_statistics = {"prediction_count": 0, "skipped_count": 0, "explored_count": 0}
+        if self.surrogate_model is not None:
+            self.surrogate = surrogate.create_surrogate(self.surrogate_model, self.surrogate_neighbor_count,
+                                                        self.surrogate_max_sample_count)
+
+        # Process pool for evaluating roads while generate runs (if evaluation_workers > 1)
+        self.evaluation_pool = None
+        # Thread pool for evaluating repetitions (if search_strategy is "repetition" without repetition_executor)
+        self.repetition_pool = None
+
+        # State of the search in generate, which is saved in checkpoints
+        self.reset_search_state()
+
+    def reset_search_state(self):
+        # Roads are sampled with np.random and backends may use random, so both are seeded
+        if self.random_seed is not None:
+            random.seed(self.random_seed)
+            np.random.seed(self.random_seed)
+        # Roads and evaluations kept by generate: all of them, or the top_k best ones in a heap
+        self.all_roads_and_evaluations = []
+        self.top_k = None
+        self.top_roads_and_evaluations = []
+        self.record_count = 0
+        # Last fitness values of tests for reusing them when resample is false
+        self.evaluation_table = self.create_fitness_table()
+        # Strength, test suite, roads (None until sampled), and evaluations so far of the current step
+        self.strength = 2
+        # Largest aggregated fitness of the last seeds, below which repetitions stop early
+        self.seed_threshold = None
+        self.test_suite = None
+        # Seed of the random generators of the backend for the next test suite in prefetch mode (None until drawn)
+        self.next_test_suite_random_seed = None
+        self.roads = None
+        # Evaluation cache keys of the roads of the current step (None without an evaluation cache)
+        self.road_keys = None
+        # Predicted fitness of the roads of the current step skipped by the surrogate (None without a surrogate)
+        self.surrogate_skipped = None
+        # Evaluations of the roads of the current step that were not promoted to the evaluate function
+        self.low_fidelity_evaluations = None
+        self.step_evaluated_indices = []
+        self.step_evaluations = []
+        # Roads already converted to arrays for checkpoints, in chunks, and roads of the current step
+        self.checkpoint_road_chunks = []
+        self.checkpoint_road_count = 0
+        self.checkpoint_step_roads = None
+        self.evaluations_since_checkpoint = 0
+
+    def sample_roads(self, test_suite):
+        """Samples a road for every test of a test suite. Roads of the whole
+        test suite are synthesized at once with the batch road generation of
+        roadgeometry. Returns the roads as FrenetRoads, the arrays of their
+        points (in the format of frenet_to_cartesian_roads_with_reframability_check),
+        and their evaluation cache keys (None without an evaluation cache)."""
+        (theta0s, segment_counts, section_kappas) = rg.sample_frenet_parameters(test_suite, self.param_value_count,
+                                                                                self.min_segment_count,
+                                                                                self.max_segment_count,
+                                                                                self.global_curvature_bound)
+        return self.synthesize_roads(theta0s, segment_counts, section_kappas)
+
+    def synthesize_roads(self, theta0s, segment_counts, section_kappas):
+        """Synthesizes roads from their Frenet parameters. Returns the same as sample_roads."""
+        (points, point_counts) = rg.frenet_to_cartesian_roads(theta0s, self.ds, segment_counts, section_kappas)
+        (points, is_in_map, is_reframable, reframe_origins) = rg.reframe_roads(points, self.lane_width, self.map_size)
+        roads = roadrecord.frenet_roads(theta0s, self.ds, segment_counts, section_kappas, self.lane_width,
+                                        reframe_origins, is_in_map, is_reframable)
+        road_keys = None
+        if self.evaluation_cache is not None:
+            road_keys = evalcache.canonical_road_keys(self.ds, segment_counts, section_kappas, is_reframable,
+                                                      self.evaluation_cache_kappa_resolution)
+        return (roads, (points, point_counts, is_in_map, is_reframable), road_keys)
+
+    def are_valid_roads(self, road_arrays):
+        """Roads are valid if they can be reframed into the map and
+        are not likely to be self-intersecting."""
+        (points, point_counts, _, is_reframable) = road_arrays
+        is_valid = is_reframable.copy()
+        is_valid[is_valid] = ~rg.are_likely_self_intersecting(points[is_valid], point_counts[is_valid],
+                                                              self.lane_width)
+        return is_valid
 
     def search_roads(self, test_suite):
         """Given a test suite, this method provides concrete road geometries
         by random sampling. It can be extended to allow different search strategies
-        (e.g. evolutionary approaches)."""
+        (e.g. evolutionary approaches).
 
-        roads = []
-        for test in test_suite:
-            lengths_indices = test[:self.road_section_count]
-            kappas_indices = test[self.road_section_count:]
+        If screen_roads is set, invalid roads are sampled again in the same
+        configuration cell up to screening_retries times, and INFEASIBLE is
+        returned for tests without a valid road.
 
-            road = rg.generate_road_with_reframability_check(lengths_indices, kappas_indices,
-                                                             self.param_value_count,
-                                                             self.min_segment_count, self.max_segment_count,
-                                                             self.global_curvature_bound, self.ds,
-                                                             self.lane_width, self.map_size)
-
-            roads.append(road)
+        Evaluation cache keys of the roads are kept in road_keys."""
 
+        test_suite = np.asarray(test_suite, dtype=int).reshape(-1, 2 * self.road_section_count)
+        (roads, self.road_keys) = self.sample_valid_roads(test_suite)
         return roads
 
-    def best_tuples(self, test_suite, evaluations):
-        fitness_values = []
-        for index, test in enumerate(test_suite):
-            if self.fitness_aggregation_method == "minimum":
-                utils.update_minimum(self.fitness_dictionary, test, evaluations[index][0])
-            elif self.fitness_aggregation_method == "maximum":
-                utils.update_maximum(self.fitness_dictionary, test, evaluations[index][0])
-            else: # if self.fitness_aggregation_method == "average":
-                utils.update_average(self.fitness_dictionary, test, evaluations[index][0])
-            fitness_values.append(self.fitness_dictionary[tuple(test)])
+    def sample_valid_roads(self, test_suite):
+        """Samples a road for every test of a test suite, with the screening
+        of search_roads. Returns the roads and their evaluation cache keys
+        (None without an evaluation cache)."""
+        with self.metrics.time("road_synthesis"):
+            (sampled_roads, road_arrays, road_keys) = self.sample_roads(test_suite)
+        self.metrics.increment("roads_generated", len(test_suite))
+        if not self.screen_roads:
+            return (sampled_roads, road_keys)
+
+        roads = [INFEASIBLE] * len(test_suite)
+        valid_road_keys = [None] * len(test_suite) if road_keys is not None else None
+        keys = self.invalid_cell_table.encode(test_suite)
+        indices = np.arange(len(test_suite))
+        for retry in range(self.screening_retries + 1):
+            with self.metrics.time("validity_check"):
+                is_valid = self.are_valid_roads(road_arrays)
+            self.metrics.increment("invalid_roads", int((~is_valid).sum()))
+            self.invalid_cell_table.aggregate(keys[indices], ~is_valid, "average")
+            self.screening_statistics["sample_count"] += len(indices)
+            self.screening_statistics["invalid_sample_count"] += int((~is_valid).sum())
+            for (index, road, valid) in zip(indices.tolist(), sampled_roads, is_valid.tolist()):
+                if valid:
+                    roads[index] = road
+            if road_keys is not None:
+                for (index, key) in zip(indices.tolist(), road_keys):
+                    valid_road_keys[index] = key if not rg.is_infeasible(roads[index]) else None
+            indices = indices[~is_valid]
+            if len(indices) == 0 or retry == self.screening_retries:
+                break
+            with self.metrics.time("road_synthesis"):
+                (sampled_roads, road_arrays, road_keys) = self.sample_roads(test_suite[indices])
+            self.metrics.increment("roads_generated", len(indices))
+        self.screening_statistics["infeasible_count"] += len(indices)
+        self.metrics.increment("infeasible_tests", len(indices))
+        return (roads, valid_road_keys)
+
+    def screen_with_surrogate(self, roads):
+        """Returns a dictionary from indices of roads predicted by the surrogate
+        to be worse than surrogate_skip_quantile of the evaluated roads to their
+        predicted fitness. Each of these roads is still evaluated with
+        probability surrogate_exploration_rate. Nothing is skipped until the
+        surrogate has surrogate_min_sample_count samples."""
+        if self.surrogate is None or self.surrogate.sample_count < max(self.surrogate_min_sample_count, 1):
+            return {}
+        with self.metrics.time("surrogate"):
+            (features, has_features) = surrogate.road_features(roads)
+            indices = np.flatnonzero(has_features)
+            if len(indices) == 0:
+                return {}
+            predicted_fitness_values = self.surrogate.predict(features[indices])
+            is_poor = predicted_fitness_values > self.surrogate.fitness_quantile(self.surrogate_skip_quantile)
+            is_explored = is_poor & (np.random.random(len(indices)) < self.surrogate_exploration_rate)
+        self.surrogate_statistics["prediction_count"] += len(indices)
+        self.surrogate_statistics["explored_count"] += int(is_explored.sum())
+        self.surrogate_statistics["skipped_count"] += int((is_poor & ~is_explored).sum())
+        return {index: predicted_fitness for (index, predicted_fitness, skipped)
+                in zip(indices.tolist(), predicted_fitness_values.tolist(), (is_poor & ~is_explored).tolist())
+                if skipped}
+
+    def create_fitness_table(self):
+        return fitnesstable.FitnessTable(2 * self.road_section_count, self.param_value_count,
+                                         self.fitness_table_max_size, self.fitness_table_eviction_policy)
+
+    def best_tuples(self, test_suite, evaluations, update=True):
+        """Aggregates the evaluations of the tests into the fitness table
+        and returns the tests to be used as seeds. Seeds can be selected
+        without modifying the fitness table by passing update as False.
+        Tests skipped by the surrogate were not evaluated, so they are
+        not aggregated, and not selected as best tests."""
+        test_suite = np.asarray(test_suite).reshape(-1, 2 * self.road_section_count)
+        is_evaluated = np.array([not surrogate.is_skipped(evaluation) for evaluation in evaluations], dtype=bool)
+        evaluated_tests = test_suite[is_evaluated]
+        evaluations = [evaluation for (evaluation, evaluated) in zip(evaluations, is_evaluated) if evaluated]
+        fitness_values = [evaluation[0] for evaluation in evaluations]
+        if self.fidelity_levels:
+            (values, counts, levels) = self.aggregate_fidelity_levels(evaluated_tests, evaluations, update)
+        else:
+            (values, counts) = self.fitness_table.aggregate(self.fitness_table.encode(evaluated_tests),
+                                                            fitness_values, self.fitness_aggregation_method, update)
+            levels = np.zeros(len(evaluated_tests), dtype=np.int64)
 
         if self.seed_best:
-            return utils.take_best(test_suite, lambda i: fitness_values[i], int(len(test_suite) * self.best_ratio))
+            # Sort by fidelity (highest first), aggregated fitness, evaluation count (fewer first, as the
+            # original ranking of (fitness, count) pairs), and index
+            order = np.lexsort((np.arange(len(values)), counts, values, -levels))
+            seed_count = min(int(len(test_suite) * self.best_ratio), len(evaluated_tests))
+            if update and seed_count > 0:
+                self.seed_threshold = float(values[order[:seed_count]].max())
+            return evaluated_tests[order[:seed_count]]
         else:
             return test_suite
 
+    def aggregate_fidelity_levels(self, test_suite, evaluations, update=True):
+        """Aggregates the evaluations of every fidelity level into the fitness
+        table of the level, and returns for every test the aggregated value and
+        evaluation count of the highest level that evaluated the test, and that level."""
+        top_level = len(self.fidelity_levels)
+        keys = self.fitness_table.encode(test_suite)
+        fitness_values = np.array([evaluation[0] for evaluation in evaluations], dtype=np.float64)
+        evaluation_levels = np.array([fidelity.evaluation_level(evaluation, top_level) for evaluation in evaluations],
+                                     dtype=np.int64)
+        values = np.full(len(keys), np.nan)
+        counts = np.zeros(len(keys), dtype=np.int64)
+        levels = np.full(len(keys), -1, dtype=np.int64)
+        for level in range(top_level, -1, -1):
+            table = self.fitness_table if level == top_level else self.low_fidelity_tables[level]
+            (level_values, level_counts) = table.lookup(keys)
+            is_level = evaluation_levels == level
+            if is_level.any():
+                (level_values[is_level], level_counts[is_level]) = table.aggregate(keys[is_level],
+                                                                                   fitness_values[is_level],
+                                                                                   self.fitness_aggregation_method,
+                                                                                   update)
+            is_chosen = (levels < 0) & (level_counts > 0)
+            (values[is_chosen], counts[is_chosen], levels[is_chosen]) = (level_values[is_chosen],
+                                                                         level_counts[is_chosen], level)
+        return (values, counts, levels)
+
+    def get_promotion_ratio(self, strength):
+        if isinstance(self.fidelity_promotion_ratio, dict):
+            return self.fidelity_promotion_ratio.get(strength, 1.0)
+        return self.fidelity_promotion_ratio
+
     def filter(self, test_suite, strength, seed_test_suite):
-        test_suite = [test for test in test_suite if utils.has_m_match(test, seed_test_suite, strength - 1)]
+        """Keeps the tests that have at least strength - 1 same
+        Length and Kappa indices with one of the seeds."""
+        return test_suite[utils.m_match_mask(test_suite, seed_test_suite, strength - 1)]
+
+    def evaluate_roads(self, roads):
+        """Yields (index, evaluation) pairs for given roads. Roads are evaluated
+        lazily, i.e., as the evaluations are consumed. A batch evaluate
+        function may yield the pairs in any order; otherwise they follow the
+        order of roads. If a process pool is available, roads are evaluated
+        there in chunks, and the evaluate function has to be picklable."""
+        if self.batch_evaluate_function is not None:
+            yield from self.batch_evaluate_function(roads)
+        elif self.evaluation_pool is None:
+            for (index, road) in enumerate(roads):
+                yield (index, self.evaluate_function(road))
+        else:
+            yield from enumerate(parallel.evaluate_roads_in_pool(self.evaluation_pool, self.evaluate_function, roads,
+                                                                 self.evaluation_chunk_size,
+                                                                 2 * self.evaluation_workers))
+
+    def evaluate_repetitions(self, roads, tests, indices):
+        """Evaluates repetition_count roads for each test at indices: its road
+        in roads and others sampled from the test. Yields (position in indices,
+        evaluation) pairs with the evaluation of the best road of each test,
+        which replaces the road in roads. Tests are taken repetition_batch_size
+        at a time, and the evaluations of all their roads are dispatched to the
+        executor, with repetition_workers of them in flight. With
+        repetition_early_stop, the rest of the roads of a test are not
+        evaluated once a road has a smaller fitness than the last seeds.
+        Roads are sampled with the screening of search_roads, and samples
+        without a valid road are dropped. The budget is checked once before
+        every evaluation. Tests whose roads are not all evaluated when the
+        budget is over are not yielded, and the random state is restored to
+        that before their batch, so that they are searched again in the same
+        way when resuming from a checkpoint."""
+        stop_threshold = self.seed_threshold if self.repetition_early_stop else None
+        executor = self.repetition_executor or self.repetition_pool
+        for start in range(0, len(indices), self.repetition_batch_size):
+            batch_indices = indices[start:start + self.repetition_batch_size]
+            random_state = (np.random.get_state(), random.getstate())
+            samples = [self.sample_valid_roads(tests[batch_indices]) for _ in range(self.repetition_count - 1)]
+            repetition_roads = []
+            repetition_keys = []
+            for (i, index) in enumerate(batch_indices):
+                repetition_roads.append([roads[index]])
+                repetition_keys.append([self.road_keys[index] if self.road_keys is not None else None])
+                for (sampled_roads, sampled_keys) in samples:
+                    if not rg.is_infeasible(sampled_roads[i]):
+                        repetition_roads[-1].append(sampled_roads[i])
+                        repetition_keys[-1].append(sampled_keys[i] if sampled_keys is not None else None)
+            evaluations = repetition.evaluate_repetitions(executor, self.evaluate_function, repetition_roads,
+                                                          self.repetition_workers, self.budget_availability_function,
+                                                          stop_threshold)
+            yielded_count = 0
+            try:
+                for (i, best_repetition, evaluation, evaluated_count) in evaluations:
+                    self.metrics.increment("repetition_evaluations", evaluated_count)
+                    index = batch_indices[i]
+                    if best_repetition > 0:
+                        roads[index] = repetition_roads[i][best_repetition]
+                        if self.road_keys is not None:
+                            self.road_keys[index] = repetition_keys[i][best_repetition]
+                        self.checkpoint_step_roads = None
+                    yielded_count += 1
+                    yield (start + i, evaluation)
+            finally:
+                evaluations.close()
+            if yielded_count < len(batch_indices):
+                np.random.set_state(random_state[0])
+                random.setstate(random_state[1])
+                return
+
+    def evaluate_batch(self, roads):
+        """Evaluates roads with evaluate_roads while the budget is available.
+        The budget is checked once before every evaluation. Returns a
+        dictionary from indices of the evaluated roads to their evaluations."""
+        evaluations = {}
+        new_evaluations = self.evaluate_roads(roads)
+        try:
+            for _ in range(len(roads)):
+                if not self.budget_availability_function():
+                    break
+                (index, evaluation) = next(new_evaluations)
+                evaluations[index] = evaluation
+        finally:
+            new_evaluations.close()
+        self.metrics.increment("evolution_evaluations", len(evaluations))
+        return evaluations
+
+    def evaluate_evolution(self, roads, tests, indices):
+        """Searches a road for each test at indices with a (1+lambda) evolution
+        strategy, starting from its road in roads. In every one of
+        evolution_generation_count generations, evolution_mutant_count mutants
+        of the current road are evaluated as one batch (see evaluate_roads), and
+        the best of them replaces the current road if it has a smaller fitness.
+        A mutant resamples the length and kappa of one section within the
+        intervals of the test. Yields (position in indices, evaluation) pairs
+        with the evaluation of the final road of each test, which replaces the
+        road in roads. The search stops when the budget is over. A test whose
+        evolution is cut short is not yielded, its road is kept, and the random
+        state is restored to that before its evolution, so that it is searched
+        again in the same way when resuming from a checkpoint."""
+        for (position, index) in enumerate(indices):
+            random_state = (np.random.get_state(), random.getstate())
+            parent = roads[index]
+            evaluations = self.evaluate_batch([parent])
+            if not evaluations:
+                return
+            parent_evaluation = evaluations[0]
+            parent_key = self.road_keys[index] if self.road_keys is not None else None
+            is_budget_over = False
+            generation = 0
+            while (isinstance(parent, roadrecord.FrenetRoad) and not is_budget_over
+                   and generation < self.evolution_generation_count):
+                with self.metrics.time("road_synthesis"):
+                    (segment_counts, section_kappas) = evolution.mutate_frenet_parameters(
+                        tests[index], parent.segment_counts, parent.section_kappas, self.evolution_mutant_count,
+                        self.param_value_count, self.min_segment_count, self.max_segment_count,
+                        self.global_curvature_bound)
+                    (mutants, mutant_arrays, mutant_keys) = self.synthesize_roads(
+                        np.full(len(segment_counts), parent.theta0), segment_counts, section_kappas)
+                    # Mutants are evaluated right away, so their points are not computed again
+                    roadrecord.cache_road_points(mutants, mutant_arrays[0], mutant_arrays[1])
+                self.metrics.increment("roads_generated", len(mutants))
+                valid_indices = list(range(len(mutants)))
+                if self.screen_roads:
+                    # Invalid mutants are not evaluated
+                    is_valid = self.are_valid_roads(mutant_arrays)
+                    self.metrics.increment("invalid_roads", int((~is_valid).sum()))
+                    valid_indices = np.flatnonzero(is_valid).tolist()
+                evaluations = self.evaluate_batch([mutants[i] for i in valid_indices])
+                is_budget_over = len(evaluations) < len(valid_indices)
+                evaluations = {valid_indices[i]: evaluation for (i, evaluation) in evaluations.items()}
+                if evaluations:
+                    best = min(evaluations, key=lambda i: (utils.fitness_key(evaluations[i][0]), i))
+                    if utils.fitness_key(evaluations[best][0]) < utils.fitness_key(parent_evaluation[0]):
+                        parent = mutants[best]
+                        parent_evaluation = evaluations[best]
+                        parent_key = mutant_keys[best] if mutant_keys is not None else None
+                generation += 1
+            if is_budget_over:
+                np.random.set_state(random_state[0])
+                random.setstate(random_state[1])
+                return
+            if parent is not roads[index]:
+                roads[index] = parent
+                if self.road_keys is not None:
+                    self.road_keys[index] = parent_key
+                self.checkpoint_step_roads = None
+            yield (position, parent_evaluation)
+
+    def evaluate_test_suite(self, roads, known_evaluations, first_indices, evaluated=None, tests=None):
+        """Yields (index, evaluation) pairs for all tests of a test suite. Roads
+        of reused tests are not evaluated. known_evaluations maps indices of
+        tests to evaluations known without evaluating their roads (e.g. from
+        earlier steps), and first_indices maps indices of repeated tests to the
+        index of their first occurrence in the test suite. A reused evaluation
+        is yielded just before the next evaluated test with a larger index,
+        once its source is available (so in test suite order when roads are
+        evaluated in order). Tests in evaluated (a dictionary from indices to
+        evaluations, e.g. restored from a checkpoint) are not yielded again.
+        With the repetition and evolution search strategies, the tests of the
+        roads are needed, and reused evaluations after the last evaluated test
+        are not yielded when they stop before evaluating all the roads."""
+        evaluated = evaluated if evaluated is not None else {}
+        indices = [index for index in range(len(roads))
+                   if index not in known_evaluations and index not in first_indices and index not in evaluated]
+        reused_indices = deque(sorted(index for index in list(known_evaluations) + list(first_indices)
+                                      if index not in evaluated))
+        first_evaluations = dict(evaluated)
+        waiting_indices = []
+
+        def reused_evaluation(reused_index):
+            if reused_index in known_evaluations:
+                return known_evaluations[reused_index]
+            first_index = first_indices[reused_index]
+            return known_evaluations.get(first_index, first_evaluations.get(first_index))
+
+        if tests is not None and self.search_strategy == "repetition":
+            new_evaluations = self.evaluate_repetitions(roads, tests, indices)
+        elif tests is not None and self.search_strategy == "evolution":
+            new_evaluations = self.evaluate_evolution(roads, tests, indices)
+        else:
+            new_evaluations = self.evaluate_roads([roads[index] for index in indices])
+        try:
+            for (new_index, evaluation) in new_evaluations:
+                index = indices[new_index]
+                first_evaluations[index] = evaluation
+                while reused_indices and reused_indices[0] < index:
+                    waiting_indices.append(reused_indices.popleft())
+                for reused_index in list(waiting_indices):
+                    if reused_evaluation(reused_index) is not None:
+                        waiting_indices.remove(reused_index)
+                        yield (reused_index, reused_evaluation(reused_index))
+                yield (index, evaluation)
+            if len(first_evaluations) - len(evaluated) < len(indices):
+                # Search strategies stop when the budget is over, and the rest is yielded when resuming
+                return
+            for reused_index in waiting_indices + list(reused_indices):
+                yield (reused_index, reused_evaluation(reused_index))
+        finally:
+            new_evaluations.close()
+
+    def next_strength(self, strength):
+        """Strength of the step after a step with given strength. After the
+        maximum strength, CRAG starts again from strength 2."""
+        return strength + 1 if strength < self.max_strength else 2
+
+    def is_seeded(self, strength):
+        """Whether the step with given strength uses the best tests
+        of the previous step as seeds."""
+        return self.use_seed and strength > 2
+
+    def generate_step_test_suite(self, strength, seed_test_suite=None, random_seed=None):
+        """Generates the test suite of a step by calling the backend. Tests of
+        seeded steps are filtered to those close to the seed test suite. If
+        random_seed is given, the backend draws random numbers from its own
+        generators seeded with it (see tsgenerator.seeded_random)."""
+        random_context = tsgen.seeded_random(random_seed) if random_seed is not None else contextlib.nullcontext()
+        if seed_test_suite is None:
+            with self.metrics.time("backend"), random_context:
+                test_suite = self.test_suite_generator.generate_test_suite(strength)
+        else:
+            with self.metrics.time("backend"), random_context:
+                test_suite = self.test_suite_generator.generate_test_suite(strength, seed_test_suite)
+            with self.metrics.time("seed_filtering"):
+                test_suite = self.filter(test_suite, strength, seed_test_suite)
+        self.metrics.observe_test_suite(strength, len(test_suite))
         return test_suite
 
-    def generate(self):
+    def get_state(self):
+        """Returns the search state of generate as a dictionary. Roads
+        converted to arrays in earlier calls are not converted again."""
+        new_roads = [road for (road, _) in self.all_roads_and_evaluations[self.checkpoint_road_count:]]
+        if new_roads:
+            self.checkpoint_road_chunks.append(checkpoint.roads_to_arrays(new_roads))
+            self.checkpoint_road_count = len(self.all_roads_and_evaluations)
+        if self.checkpoint_step_roads is None and self.roads is not None:
+            self.checkpoint_step_roads = checkpoint.roads_to_arrays(self.roads)
+        return {"road_chunks": self.checkpoint_road_chunks,
+                "evaluations": [evaluation for (_, evaluation) in self.all_roads_and_evaluations],
+                "top_k": self.top_k,
+                "top_entries": [(key, order, evaluation) for (key, order, _, evaluation)
+                                in self.top_roads_and_evaluations],
+                "top_roads": checkpoint.roads_to_arrays([road for (_, _, road, _)
+                                                         in self.top_roads_and_evaluations]),
+                "record_count": self.record_count,
+                "strength": self.strength,
+                "seed_threshold": self.seed_threshold,
+                "test_suite": self.test_suite,
+                "next_test_suite_random_seed": self.next_test_suite_random_seed,
+                "roads": self.checkpoint_step_roads,
+                "road_keys": self.road_keys,
+                "surrogate_skipped": self.surrogate_skipped,
+                "low_fidelity_evaluations": self.low_fidelity_evaluations,
+                "step_evaluated_indices": self.step_evaluated_indices,
+                "step_evaluations": self.step_evaluations,
+                "fitness_table": self.fitness_table,
+                "evaluation_table": self.evaluation_table,
+                "prioritizer": self.prioritizer,
+                "surrogate": self.surrogate,
+                "surrogate_statistics": self.surrogate_statistics,
+                "low_fidelity_tables": self.low_fidelity_tables,
+                "fidelity_statistics": self.fidelity_statistics,
+                "invalid_cell_table": self.invalid_cell_table,
+                "screening_statistics": self.screening_statistics,
+                "numpy_random_state": np.random.get_state(),
+                "random_state": random.getstate()}
+
+    def set_state(self, state):
+        """Restores a search state returned by get_state."""
+        roads = [road for chunk in state["road_chunks"] for road in checkpoint.roads_from_arrays(chunk)]
+        self.all_roads_and_evaluations = list(zip(roads, state["evaluations"]))
+        self.checkpoint_road_chunks = list(state["road_chunks"])
+        self.checkpoint_road_count = len(self.all_roads_and_evaluations)
+        self.top_k = state["top_k"]
+        self.top_roads_and_evaluations = [(key, order, road, evaluation) for ((key, order, evaluation), road)
+                                          in zip(state["top_entries"], checkpoint.roads_from_arrays(state["top_roads"]))]
+        self.record_count = state["record_count"]
+        self.evaluations_since_checkpoint = 0
+        self.strength = state["strength"]
+        self.seed_threshold = state.get("seed_threshold")
+        self.test_suite = state["test_suite"]
+        self.next_test_suite_random_seed = state.get("next_test_suite_random_seed")
+        self.roads = checkpoint.roads_from_arrays(state["roads"]) if state["roads"] is not None else None
+        self.checkpoint_step_roads = state["roads"]
+        self.road_keys = state.get("road_keys")
+        self.surrogate_skipped = state.get("surrogate_skipped")
+        self.low_fidelity_evaluations = state.get("low_fidelity_evaluations")
+        self.step_evaluated_indices = list(state["step_evaluated_indices"])
+        self.step_evaluations = list(state["step_evaluations"])
+        self.fitness_table = state["fitness_table"]
+        self.evaluation_table = state["evaluation_table"]
+        self.prioritizer = state["prioritizer"]
+        self.surrogate = state.get("surrogate", self.surrogate)
+        self.surrogate_statistics = state.get("surrogate_statistics", self.surrogate_statistics)
+        self.low_fidelity_tables = state.get("low_fidelity_tables", self.low_fidelity_tables)
+        self.fidelity_statistics = state.get("fidelity_statistics", self.fidelity_statistics)
+        self.invalid_cell_table = state["invalid_cell_table"]
+        self.screening_statistics = state["screening_statistics"]
+        np.random.set_state(state["numpy_random_state"])
+        random.setstate(state["random_state"])
+
+    def save_checkpoint(self):
+        """Writes the search state into checkpoint_filepath (if given)."""
+        if self.checkpoint_filepath is not None:
+            with self.metrics.time("checkpoint"):
+                checkpoint.save_checkpoint(self.checkpoint_filepath, self.get_state())
+            self.evaluations_since_checkpoint = 0
+
+    def export_metrics(self):
+        """Writes the metrics into metrics_json_filepath and
+        metrics_prometheus_filepath (if given and metrics are collected)."""
+        if not self.collect_metrics:
+            return
+        if self.metrics_json_filepath is not None:
+            self.metrics.write_json(self.metrics_json_filepath)
+        if self.metrics_prometheus_filepath is not None:
+            self.metrics.write_prometheus(self.metrics_prometheus_filepath)
+
+    def keep_record(self, record):
+        """Keeps the road and evaluation of a record for generate. With top_k,
+        only the top_k roads with the smallest fitness are kept (earlier ones
+        for equal fitness values), in a heap whose root is the worst of them.
+        Roads whose fitness is only estimated (by a lower fidelity level or
+        the surrogate) are not kept with top_k."""
+        if self.top_k is None:
+            self.all_roads_and_evaluations.append((record.road, record.evaluation))
+        elif not fidelity.is_low_fidelity(record.evaluation) and not surrogate.is_skipped(record.evaluation):
+            entry = (-utils.fitness_key(record.fitness), -self.record_count, record.road, record.evaluation)
+            if len(self.top_roads_and_evaluations) < self.top_k:
+                heapq.heappush(self.top_roads_and_evaluations, entry)
+            elif self.top_k > 0:
+                heapq.heappushpop(self.top_roads_and_evaluations, entry)
+        self.record_count += 1
+
+    def kept_roads_and_evaluations(self):
+        """Returns the roads and evaluations kept by keep_record, the top_k
+        ones sorted from the smallest fitness."""
+        if self.top_k is None:
+            return self.all_roads_and_evaluations
+        return [(road, evaluation) for (_, _, road, evaluation)
+                in sorted(self.top_roads_and_evaluations, key=lambda entry: (-entry[0], -entry[1]))]
+
+    def generate(self, top_k=None):
         """This method generates roads while there is available budget by using
         CRAG algorithm. It returns all generated roads and their evaluation scores
-        when budget is no longer available."""
-
-        all_roads_and_evaluations = []
-        evaluation_dict = {}
-        while True:
-            strength = 2
-            test_suite = self.test_suite_generator.generate_test_suite(strength)
-            roads = self.search_roads(test_suite)
-            # Evaluate
-            evaluations = []
-            budget_over = False
-            for (test, road) in zip(test_suite, roads):
-                evaluation = self.evaluate_function(road)
-                if not self.budget_availability_function():
-                    budget_over = True
-                    break
-                evaluations.append(evaluation)
-                evaluation_dict[tuple(test)] = evaluation
-                all_roads_and_evaluations.append((road, evaluation))
-            if budget_over:
-                break
-            for strength in range(3, self.max_strength + 1):
-                if self.use_seed:
-                    seed_test_suite = self.best_tuples(test_suite, evaluations)
-                    test_suite = self.test_suite_generator.generate_test_suite(strength, seed_test_suite)
-                    test_suite = self.filter(test_suite, strength, seed_test_suite)
-                else:
-                    test_suite = self.test_suite_generator.generate_test_suite(strength)
-                roads = self.search_roads(test_suite)
-                # Evaluate
-                evaluations = []
-                for (test, road) in zip(test_suite, roads):
-                    if (not self.resample) and self.use_seed and (tuple(test) in evaluation_dict):
-                        evaluation = evaluation_dict[tuple(test)]
-                    else: # if resample is true, then road is evaluated
-                        evaluation = self.evaluate_function(road)
-                    if not self.budget_availability_function():
+        when budget is no longer available. If top_k is given, only the top_k
+        roads with the smallest fitness are kept and returned (sorted), so that
+        memory does not grow with the number of evaluations.
+
+        If checkpoint_filepath is given, the search state is saved there
+        after every checkpoint_interval evaluations, after every step, and when
+        the budget is over. See resume for continuing from a checkpoint."""
+        self.reset_search_state()
+        self.top_k = top_k
+        self.test_suite = self.generate_step_test_suite(self.strength)
+        for record in self.iter_continue_generation():
+            self.keep_record(record)
+        return self.kept_roads_and_evaluations()
+
+    def resume(self, checkpoint_filepath=None):
+        """Continues generate from the state saved in a checkpoint (by default,
+        in checkpoint_filepath). Roads evaluated before the checkpoint was
+        saved are not evaluated again, and the returned list includes them
+        (or the top_k best ones, if generate was called with top_k)."""
+        self.set_state(checkpoint.load_checkpoint(checkpoint_filepath or self.checkpoint_filepath))
+        for record in self.iter_continue_generation():
+            self.keep_record(record)
+        return self.kept_roads_and_evaluations()
+
+    def iter_generate(self):
+        """Generator version of generate, which yields an EvaluationRecord
+        for every evaluation as soon as it is available and keeps no roads or
+        evaluations. Closing the generator stops generation."""
+        self.reset_search_state()
+        self.test_suite = self.generate_step_test_suite(self.strength)
+        yield from self.iter_continue_generation()
+
+    def iter_resume(self, checkpoint_filepath=None):
+        """Generator version of resume, which yields the records of the
+        evaluations after the checkpoint."""
+        self.set_state(checkpoint.load_checkpoint(checkpoint_filepath or self.checkpoint_filepath))
+        yield from self.iter_continue_generation()
+
+    def iter_continue_generation(self):
+        """Runs the steps of generate from the current search state, and yields
+        an EvaluationRecord for every evaluation.
+
+        In prefetch mode, the test suite of the next step is generated in a
+        background thread while roads of the current step are evaluated.
+        Unseeded test suites are requested when a step starts. Seeded ones are
+        requested once prefetch_ratio of the current test suite is evaluated,
+        with seeds speculatively chosen from the evaluations completed so far.
+        If that is no test, they are requested after the step as without prefetching."""
+
+        if not self.use_seed:
+            # Every step uses an unseeded test suite that backends may prepare in advance
+            self.test_suite_generator.precompute(range(2, self.max_strength + 1))
+        prefetcher = ThreadPoolExecutor(max_workers=1) if self.prefetch else None
+        suite_evaluations = None
+        surrogate_report = open(self.surrogate_report_filepath, "a") if self.surrogate_report_filepath else None
+        if self.evaluation_workers > 1:
+            self.evaluation_pool = ProcessPoolExecutor(max_workers=self.evaluation_workers)
+        if self.search_strategy == "repetition" and self.repetition_executor is None:
+            self.repetition_pool = ThreadPoolExecutor(max_workers=self.repetition_workers)
+        if self.evaluation_cache is not None:
+            self.evaluation_cache.connect() # Closed when the generation ends
+        try:
+            while True:
+                strength = self.strength
+                next_strength = self.next_strength(strength)
+                next_test_suite_future = None
+                if prefetcher is not None and self.next_test_suite_random_seed is None:
+                    # The next test suite is generated with its own random generators, seeded here at a fixed
+                    # point of the random sequence, so that it does not depend on when the prefetcher runs
+                    self.next_test_suite_random_seed = int(np.random.randint(1 << 31))
+                if prefetcher is not None and not self.is_seeded(next_strength):
+                    next_test_suite_future = prefetcher.submit(self.generate_step_test_suite, next_strength,
+                                                               None, self.next_test_suite_random_seed)
+                speculation_count = math.ceil(len(self.test_suite) * self.prefetch_ratio)
+                if speculation_count == 0 or speculation_count >= len(self.test_suite):
+                    # Seeds are chosen after the whole test suite is evaluated (there are none before)
+                    speculation_count = None
+
+                if self.roads is None:
+                    if self.prioritizer is not None:
+                        # Tests with the best predicted fitness are evaluated first
+                        with self.metrics.time("prioritization"):
+                            self.test_suite = self.test_suite[self.prioritizer.prioritize(self.test_suite)]
+                    self.roads = self.search_roads(self.test_suite)
+                    if self.surrogate is not None:
+                        self.surrogate_skipped = self.screen_with_surrogate(self.roads)
+                test_suite = self.test_suite
+                roads = self.roads
+                # Tests evaluated before (or earlier in this test suite) are not evaluated again if resample is false,
+                # and roads of infeasible tests are not evaluated
+                test_keys = self.evaluation_table.encode(test_suite)
+                known_evaluations = {}
+                first_indices = {}
+                if self.is_seeded(strength) and not self.resample:
+                    (previous_fitness_values, previous_counts) = self.evaluation_table.lookup(test_keys)
+                    for index in np.flatnonzero(previous_counts > 0).tolist():
+                        known_evaluations[index] = [previous_fitness_values[index].item()]
+                    (_, unique_indices, inverse) = np.unique(test_keys, return_index=True, return_inverse=True)
+                    for index in np.flatnonzero(unique_indices[inverse.reshape(-1)] != np.arange(len(test_keys))).tolist():
+                        if index not in known_evaluations:
+                            first_indices[index] = unique_indices[inverse[index]].item()
+                for (index, road) in enumerate(roads):
+                    if rg.is_infeasible(road) and index not in known_evaluations and index not in first_indices:
+                        known_evaluations[index] = [self.infeasible_fitness, INFEASIBLE]
+                # Roads evaluated before (also in earlier runs) are not evaluated again if an evaluation cache is used
+                cached_indices = set()
+                if self.evaluation_cache is not None and self.road_keys is not None:
+                    step_evaluated_indices = set(self.step_evaluated_indices)
+                    cache_indices = [index for index in range(len(roads))
+                                     if self.road_keys[index] is not None and index not in known_evaluations
+                                     and index not in first_indices and index not in step_evaluated_indices]
+                    with self.metrics.time("evaluation_cache"):
+                        cached_fitness_values = self.evaluation_cache.lookup([self.road_keys[index]
+                                                                              for index in cache_indices])
+                    for (index, fitness) in zip(cache_indices, cached_fitness_values):
+                        if fitness is not None:
+                            known_evaluations[index] = [fitness]
+                            cached_indices.add(index)
+                # Roads predicted to be poor are not evaluated, and their predicted fitness is used instead
+                road_features = None
+                if self.surrogate is not None:
+                    (road_features, has_features) = surrogate.road_features(roads)
+                    for (index, predicted_fitness) in (self.surrogate_skipped or {}).items():
+                        if index not in known_evaluations and index not in first_indices:
+                            known_evaluations[index] = [predicted_fitness, surrogate.SKIPPED]
+                # Roads are evaluated on the lower fidelity levels first, and only the best ones are promoted
+                if self.fidelity_levels:
+                    if self.low_fidelity_evaluations is None:
+                        step_evaluated_indices = set(self.step_evaluated_indices)
+                        ladder_indices = [index for index in range(len(roads))
+                                          if index not in known_evaluations and index not in first_indices
+                                          and index not in step_evaluated_indices]
+                        with self.metrics.time("fidelity_ladder"):
+                            (self.low_fidelity_evaluations, level_counts) = fidelity.evaluate_ladder(
+                                self.fidelity_levels, roads, ladder_indices, self.get_promotion_ratio(strength))
+                        for (statistics, (evaluated_count, promoted_count)) in zip(self.fidelity_statistics,
+                                                                                   level_counts):
+                            statistics["evaluated_count"] += evaluated_count
+                            statistics["promoted_count"] += promoted_count
+                            self.metrics.increment("ladder_evaluations", evaluated_count)
+                    for (index, evaluation) in self.low_fidelity_evaluations.items():
+                        if index not in known_evaluations and index not in first_indices:
+                            known_evaluations[index] = evaluation
+                # Evaluate (tests evaluated before resuming from a checkpoint are skipped)
+                evaluated_indices = self.step_evaluated_indices
+                evaluations = self.step_evaluations
+                budget_over = False
+                suite_evaluations = self.evaluate_test_suite(roads, known_evaluations, first_indices,
+                                                             dict(zip(evaluated_indices, evaluations)), test_suite)
+                # Repetition and evolution strategies check the budget before each of their evaluations
+                is_budget_checked_here = self.search_strategy == "sample"
+                check_budget = is_budget_checked_here
+                while True:
+                    # Budget is checked before a road is evaluated, so no evaluation is dropped. Reused
+                    # evaluations yielded just before an evaluated road do not need budget (the road
+                    # is already evaluated then), so the budget is checked again after a new evaluation
+                    if check_budget and not self.budget_availability_function():
                         budget_over = True
                         break
+                    with self.metrics.time("evaluation"):
+                        next_evaluation = next(suite_evaluations, None)
+                    if next_evaluation is None:
+                        # Search strategies stop before all tests are evaluated when the budget is over
+                        budget_over = len(evaluated_indices) < len(test_suite)
+                        break
+                    (index, evaluation) = next_evaluation
+                    evaluated_indices.append(index)
                     evaluations.append(evaluation)
-                    evaluation_dict[tuple(test)] = evaluation
-                    all_roads_and_evaluations.append((road, evaluation))
-
+                    is_new_evaluation = index not in known_evaluations and index not in first_indices
+                    check_budget = is_new_evaluation and is_budget_checked_here
+                    if is_new_evaluation:
+                        self.metrics.increment("roads_evaluated")
+                        if self.penalty_fitness is not None and evaluation[0] >= self.penalty_fitness:
+                            self.metrics.increment("penalized_evaluations")
+                    elif index in cached_indices:
+                        self.metrics.increment("cached_evaluations")
+                    elif len(evaluation) > 1 and rg.is_infeasible(evaluation[1]):
+                        self.metrics.increment("infeasible_evaluations")
+                    elif fidelity.is_low_fidelity(evaluation):
+                        self.metrics.increment("low_fidelity_evaluations")
+                    elif surrogate.is_skipped(evaluation):
+                        self.metrics.increment("skipped_evaluations")
+                        if surrogate_report is not None:
+                            surrogate.write_skipped_road(surrogate_report, strength, test_suite[index], roads[index],
+                                                         evaluation[0])
+                    else:
+                        self.metrics.increment("reused_evaluations")
+                    if self.prioritizer is not None and (is_new_evaluation or index in cached_indices):
+                        with self.metrics.time("prioritization"):
+                            self.prioritizer.update(test_suite[index], [evaluation[0]])
+                    if road_features is not None and has_features[index] and (is_new_evaluation
+                                                                              or index in cached_indices):
+                        self.surrogate.update(road_features[index], evaluation[0])
+                    if self.evaluation_cache is not None and is_new_evaluation and self.road_keys is not None \
+                            and self.road_keys[index] is not None:
+                        self.evaluation_cache.store(self.road_keys[index], evaluation[0])
+                    yield EvaluationRecord(strength, test_suite[index].copy(), roads[index], evaluation[0], evaluation)
+                    if (prefetcher is not None and next_test_suite_future is None
+                            and len(evaluations) == speculation_count and self.is_seeded(next_strength)):
+                        with self.metrics.time("seed_selection"):
+                            speculative_seed_test_suite = self.best_tuples(test_suite[evaluated_indices],
+                                                                           evaluations, update=False)
+                        next_test_suite_future = prefetcher.submit(self.generate_step_test_suite, next_strength,
+                                                                   speculative_seed_test_suite,
+                                                                   self.next_test_suite_random_seed)
+                    self.evaluations_since_checkpoint += 1
+                    if self.evaluations_since_checkpoint >= self.checkpoint_interval:
+                        self.save_checkpoint()
+                suite_evaluations.close()
                 if budget_over:
+                    self.save_checkpoint()
                     break
-            if budget_over:
-                break
-        return all_roads_and_evaluations
+                # Low fidelity evaluations are not reused, so that tests can be promoted later, and
+                # fitness values predicted by the surrogate are not reused as evaluations
+                is_reusable = [not fidelity.is_low_fidelity(evaluation) and not surrogate.is_skipped(evaluation)
+                               for evaluation in evaluations]
+                self.evaluation_table.aggregate(test_keys[evaluated_indices][is_reusable],
+                                                [evaluation[0] for (evaluation, reusable) in zip(evaluations, is_reusable)
+                                                 if reusable], "last")
 
+                if (prefetcher is not None and next_test_suite_future is None and speculation_count is not None
+                        and self.is_seeded(next_strength)):
+                    # Resumed after the seeds were speculatively chosen, so they are chosen again in the same way
+                    with self.metrics.time("seed_selection"):
+                        speculative_seed_test_suite = self.best_tuples(
+                            test_suite[evaluated_indices[:speculation_count]], evaluations[:speculation_count],
+                            update=False)
+                    next_test_suite_future = prefetcher.submit(self.generate_step_test_suite, next_strength,
+                                                               speculative_seed_test_suite,
+                                                               self.next_test_suite_random_seed)
+                seed_test_suite = None
+                if self.is_seeded(next_strength):
+                    with self.metrics.time("seed_selection"):
+                        seed_test_suite = self.best_tuples(test_suite[evaluated_indices], evaluations)
+                if next_test_suite_future is not None:
+                    self.test_suite = next_test_suite_future.result()
+                else:
+                    self.test_suite = self.generate_step_test_suite(next_strength, seed_test_suite,
+                                                                    self.next_test_suite_random_seed)
+                self.strength = next_strength
+                self.next_test_suite_random_seed = None
+                self.roads = None
+                self.road_keys = None
+                self.surrogate_skipped = None
+                self.low_fidelity_evaluations = None
+                self.checkpoint_step_roads = None
+                self.step_evaluated_indices = []
+                self.step_evaluations = []
+                self.save_checkpoint()
+                self.export_metrics()
+        finally:
+            if suite_evaluations is not None:
+                suite_evaluations.close()
+            self.export_metrics()
+            if surrogate_report is not None:
+                surrogate_report.close()
+            if prefetcher is not None:
+                prefetcher.shutdown(wait=False)
+            if self.evaluation_pool is not None:
+                self.evaluation_pool.shutdown()
+                self.evaluation_pool = None
+            if self.repetition_pool is not None:
+                self.repetition_pool.shutdown()
+                self.repetition_pool = None
+            if self.evaluation_cache is not None:
+                self.evaluation_cache.close()
 
 if __name__ == "__main__":
     core_params = {}
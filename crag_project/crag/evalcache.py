@@ -0,0 +1,123 @@
+"""
+This module provides EvaluationCache that keeps fitness values of roads in
+a single SQLite file, so that a deterministic evaluator is not called again
+for a road evaluated earlier (also in an earlier run). A road is identified
+by its Frenet parameters, i.e. ds and the segment counts and kappas of its
+sections, without its initial position and heading. The key is therefore
+the same for all translations and rotations of a road.
+"""
+
+import hashlib
+import sqlite3
+import numpy as np
+
+
+def canonical_road_keys(ds, segment_counts, section_kappas, is_reframable, kappa_resolution=0.0):
+    """Returns a key (bytes) for every road given by the segment counts and
+    kappas of its sections. Sections without segments are dropped and
+    consecutive sections with the same kappa are merged, so that roads with
+    the same curvature profile get the same key. If kappa_resolution is
+    positive, kappas are rounded to its multiples before comparing them.
+    is_reframable is part of the key since evaluators penalize roads that
+    do not fit into the map."""
+    segment_counts = np.asarray(segment_counts, dtype=np.int64)
+    section_kappas = np.asarray(section_kappas, dtype=np.float64)
+    if kappa_resolution > 0:
+        section_kappas = np.round(section_kappas / kappa_resolution).astype(np.int64)
+    else:
+        section_kappas = section_kappas + 0.0 # -0.0 becomes 0.0
+    keys = []
+    for (counts, kappas, reframable) in zip(segment_counts, section_kappas, is_reframable):
+        (counts, kappas) = (counts[counts > 0], kappas[counts > 0])
+        is_start = np.concatenate([[True], kappas[1:] != kappas[:-1]])
+        run_counts = np.add.reduceat(counts, np.flatnonzero(is_start)) if len(counts) > 0 else counts
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.float64(ds).tobytes())
+        digest.update(np.float64(kappa_resolution).tobytes())
+        digest.update(b"\x01" if reframable else b"\x00")
+        digest.update(run_counts.tobytes())
+        digest.update(kappas[is_start].tobytes())
+        keys.append(digest.digest())
+    return keys
+
+
+class EvaluationCache:
+    """Persistent map from road keys to fitness values in an SQLite file.
+    The file keeps at most max_size entries (no bound if None); the least
+    recently used ones are evicted first. hit_count and miss_count count
+    the lookups of this instance. The file is opened on creation and kept
+    open until close; connect opens it again after close. The cache can
+    also be used as a context manager that closes it on exit."""
+
+    def __init__(self, filepath, max_size=None):
+        self.filepath = filepath
+        self.max_size = max_size
+        self.hit_count = 0
+        self.miss_count = 0
+        self.eviction_count = 0
+        self.connection = None
+        self.connect()
+
+    def connect(self):
+        """Opens the file, unless it is already open."""
+        if self.connection is not None:
+            return
+        self.connection = sqlite3.connect(self.filepath)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS evaluations "
+                                "(key BLOB PRIMARY KEY, fitness REAL NOT NULL, last_used INTEGER NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS evaluations_last_used ON evaluations (last_used)")
+        self.connection.commit()
+        self.time = self.connection.execute("SELECT COALESCE(MAX(last_used), 0) FROM evaluations").fetchone()[0]
+        # Entries are counted once, and the count is then kept up to date by store
+        self.size = self.connection.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+
+    def __len__(self):
+        return self.size
+
+    def lookup(self, keys):
+        """Returns the fitness value of every key, or None for keys not in the cache."""
+        fitness_values = []
+        for key in keys:
+            row = self.connection.execute("SELECT fitness FROM evaluations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.miss_count += 1
+                fitness_values.append(None)
+            else:
+                self.hit_count += 1
+                self.time += 1
+                self.connection.execute("UPDATE evaluations SET last_used = ? WHERE key = ?", (self.time, key))
+                fitness_values.append(row[0])
+        self.connection.commit()
+        return fitness_values
+
+    def store(self, key, fitness):
+        """Stores the fitness value of a key and evicts the least recently
+        used entries beyond max_size. Non-finite values are not stored."""
+        if not np.isfinite(fitness):
+            return
+        self.time += 1
+        cursor = self.connection.execute("UPDATE evaluations SET fitness = ?, last_used = ? WHERE key = ?",
+                                         (float(fitness), self.time, key))
+        if cursor.rowcount == 0:
+            self.connection.execute("INSERT INTO evaluations (key, fitness, last_used) VALUES (?, ?, ?)",
+                                    (key, float(fitness), self.time))
+            self.size += 1
+        if self.max_size is not None:
+            excess = self.size - self.max_size
+            if excess > 0:
+                self.connection.execute("DELETE FROM evaluations WHERE key IN "
+                                        "(SELECT key FROM evaluations ORDER BY last_used LIMIT ?)", (excess,))
+                self.eviction_count += excess
+                self.size -= excess
+        self.connection.commit()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
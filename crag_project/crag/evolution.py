@@ -0,0 +1,29 @@
+"""
+This module provides the mutation of the (1+lambda) evolution strategy
+of CRAG. A road is kept by the segment counts and kappas of its sections
+(see roadrecord.FrenetRoad), and a mutant resamples both parameters of one
+randomly chosen section within the Length and Kappa intervals that the
+test assigns to that section, so that mutants stay in the configuration.
+"""
+
+import numpy as np
+from . import utils
+
+
+def mutate_frenet_parameters(test, segment_counts, section_kappas, mutant_count, param_value_count,
+                             min_segment_count, max_segment_count, global_curvature_bound):
+    """Returns the segment counts and kappas (arrays of shape (mutant_count,
+    section count)) of mutant_count mutants of a road of given test."""
+    test = np.asarray(test, dtype=int)
+    road_section_count = len(test) // 2
+    mutant_segment_counts = np.tile(np.asarray(segment_counts, dtype=int), (mutant_count, 1))
+    mutant_section_kappas = np.tile(np.asarray(section_kappas, dtype=np.float64), (mutant_count, 1))
+    mutants = np.arange(mutant_count)
+    sections = np.random.randint(road_section_count, size=mutant_count)
+    mutant_segment_counts[mutants, sections] = utils.divide_and_sample_array(min_segment_count, max_segment_count + 1,
+                                                                             param_value_count,
+                                                                             test[sections]).astype(int)
+    mutant_section_kappas[mutants, sections] = utils.divide_and_sample_array(-global_curvature_bound,
+                                                                             global_curvature_bound, param_value_count,
+                                                                             test[road_section_count + sections])
+    return (mutant_segment_counts, mutant_section_kappas)
@@ -0,0 +1,72 @@
+"""
+This module provides the ladder of evaluators used by CRAG for
+multi-fidelity evaluation. The roads of a test suite are evaluated on the
+cheapest level first, and only the best promotion_ratio of them are
+evaluated on the next level, up to the evaluate function of CRAG, which is
+the highest fidelity. Roads that are not promoted keep the evaluation of
+the last level they reached, marked with LOW_FIDELITY and the level.
+"""
+
+import math
+from collections import namedtuple
+from .utils import fitness_key
+
+# Second element of the evaluation of a road that was not promoted, followed by its level
+LOW_FIDELITY = "LOW_FIDELITY"
+
+# A level of the ladder. evaluate_function takes a road and returns its evaluation, or
+# batch_evaluate_function takes a list of roads and yields (index, evaluation) pairs in any
+# order. Roads are evaluated while budget_availability_function returns True (always if None)
+FidelityLevel = namedtuple("FidelityLevel", ["evaluate_function", "budget_availability_function",
+                                             "batch_evaluate_function"], defaults=(None, None))
+
+
+def is_low_fidelity(evaluation):
+    return len(evaluation) > 2 and isinstance(evaluation[1], str) and evaluation[1] == LOW_FIDELITY
+
+
+def evaluation_level(evaluation, top_level):
+    """Level of the evaluator that gave an evaluation; top_level for the evaluate function of CRAG."""
+    return evaluation[2] if is_low_fidelity(evaluation) else top_level
+
+
+def level_evaluations(level, roads):
+    """Yields (index, evaluation) pairs of roads evaluated on a level. The
+    budget of the level is checked before every evaluation."""
+    if level.batch_evaluate_function is not None:
+        evaluations = iter(level.batch_evaluate_function(roads))
+    else:
+        evaluations = ((index, level.evaluate_function(road)) for (index, road) in enumerate(roads))
+    try:
+        while level.budget_availability_function is None or level.budget_availability_function():
+            next_evaluation = next(evaluations, None)
+            if next_evaluation is None:
+                break
+            yield next_evaluation
+    finally:
+        if hasattr(evaluations, "close"):
+            evaluations.close()
+
+
+def evaluate_ladder(levels, roads, indices, promotion_ratio):
+    """Evaluates the roads at indices on the levels in order. On every level,
+    the ceil(promotion_ratio * n) roads with the smallest fitness among the n
+    evaluated ones are promoted to the next level. Roads a level could not
+    evaluate for lack of budget are promoted as well. Returns a dictionary
+    from indices of roads that were not promoted to their low-fidelity
+    evaluation, and the numbers of evaluated and promoted roads per level."""
+    low_fidelity_evaluations = {}
+    level_counts = []
+    candidates = list(indices)
+    for (level_index, level) in enumerate(levels):
+        evaluations = {}
+        if candidates:
+            for (index, evaluation) in level_evaluations(level, [roads[candidate] for candidate in candidates]):
+                evaluations[candidates[index]] = evaluation
+        ranked = sorted(evaluations, key=lambda index: (fitness_key(evaluations[index][0]), index))
+        promoted_count = math.ceil(len(ranked) * promotion_ratio)
+        for index in ranked[promoted_count:]:
+            low_fidelity_evaluations[index] = [evaluations[index][0], LOW_FIDELITY, level_index]
+        level_counts.append((len(evaluations), len(candidates) - len(ranked) + promoted_count))
+        candidates = [candidate for candidate in candidates if candidate not in low_fidelity_evaluations]
+    return (low_fidelity_evaluations, level_counts)
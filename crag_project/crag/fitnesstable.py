@@ -0,0 +1,221 @@
+"""
+This module provides FitnessTable that keeps aggregated fitness values
+of road configurations (tests). A test is encoded as a single integer by
+reading its Length and Kappa indices as the digits of a number in base
+param_value_count, or by hashing them when that number does not fit into
+64 bits. Keys, aggregated values, evaluation counts, and last
+use times are kept in arrays with open addressing (linear probing), and
+all updates are done for a batch of tests at once.
+"""
+
+import numpy as np
+
+EMPTY = -1
+AGGREGATION_METHODS = ["average", "minimum", "maximum", "last"]
+EVICTION_POLICIES = ["least_recently_used", "least_evaluated"]
+
+# Multiplier of Fibonacci hashing (2**64 divided by the golden ratio)
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# Offset basis and prime of 64-bit FNV-1a hashing
+FNV_OFFSET_BASIS = np.uint64(0xCBF29CE484222325)
+FNV_PRIME = np.uint64(0x100000001B3)
+
+
+def encode_tests(test_suite, parameter_count, value_count):
+    """Encodes every test of a test suite as an integer in base value_count."""
+    weights = value_count ** np.arange(parameter_count - 1, -1, -1, dtype=np.int64)
+    test_suite = np.asarray(test_suite, dtype=np.int64).reshape(-1, parameter_count)
+    return test_suite @ weights
+
+
+def hash_tests(test_suite, parameter_count):
+    """Hashes every test of a test suite into a nonnegative 63-bit integer
+    with FNV-1a over the bytes of its indices. Different tests get the same
+    key with negligible probability."""
+    test_suite = np.asarray(test_suite, dtype=np.int64).reshape(-1, parameter_count)
+    row_bytes = test_suite.astype("<i8").view(np.uint8).reshape(len(test_suite), -1)
+    hashes = np.full(len(test_suite), FNV_OFFSET_BASIS, dtype=np.uint64)
+    for column in row_bytes.T:
+        hashes = (hashes ^ column) * FNV_PRIME
+    return (hashes >> np.uint64(1)).astype(np.int64)
+
+
+def aggregate_batch(keys, new_values, method):
+    """Aggregates the values of a batch per key. Returns the unique keys,
+    the index of the unique key of every entry, the aggregated values, and
+    the number of values of every unique key."""
+    (unique_keys, inverse, counts) = np.unique(keys, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    if method == "minimum":
+        values = np.full(len(unique_keys), np.inf)
+        np.minimum.at(values, inverse, new_values)
+    elif method == "maximum":
+        values = np.full(len(unique_keys), -np.inf)
+        np.maximum.at(values, inverse, new_values)
+    elif method == "last":
+        last_positions = np.zeros(len(unique_keys), dtype=np.int64)
+        np.maximum.at(last_positions, inverse, np.arange(len(keys)))
+        values = new_values[last_positions]
+    else: # if method == "average":
+        values = np.bincount(inverse, weights=new_values, minlength=len(unique_keys)) / counts
+    return (unique_keys, inverse, values, counts)
+
+
+class FitnessTable:
+    """Open addressing hash table from encoded tests to (aggregated fitness
+    value, evaluation count). The table grows as needed up to max_size
+    entries. When an update would exceed max_size, entries not in the update
+    are evicted following eviction_policy ("least_recently_used" or
+    "least_evaluated") and the remaining entries are rehashed. Entries of
+    an update are never evicted, so a single update with more than max_size
+    keys is kept whole."""
+
+    def __init__(self, parameter_count, value_count, max_size=None,
+                 eviction_policy="least_recently_used", initial_capacity=1024):
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy {eviction_policy}.")
+        self.parameter_count = parameter_count
+        self.value_count = value_count
+        self.max_size = max_size
+        self.eviction_policy = eviction_policy
+        self.size = 0
+        self.eviction_count = 0
+        self.time = 0
+        self.allocate(max(2, 1 << (int(initial_capacity) - 1).bit_length()))
+
+    def allocate(self, capacity):
+        self.capacity = capacity
+        self.keys = np.full(capacity, EMPTY, dtype=np.int64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self):
+        return self.size
+
+    def encode(self, test_suite):
+        if self.value_count ** self.parameter_count > np.iinfo(np.int64).max:
+            # Tests cannot be encoded as 64-bit integers
+            return hash_tests(test_suite, self.parameter_count)
+        return encode_tests(test_suite, self.parameter_count, self.value_count)
+
+    def home_slots(self, keys):
+        shift = np.uint64(64 - (self.capacity.bit_length() - 1))
+        return ((keys.astype(np.uint64) * HASH_MULTIPLIER) >> shift).astype(np.int64)
+
+    def find_slots(self, keys):
+        """Returns the slots of given keys, or EMPTY for keys not in the table."""
+        keys = np.asarray(keys, dtype=np.int64)
+        slots = np.full(len(keys), EMPTY, dtype=np.int64)
+        probes = self.home_slots(keys)
+        active = np.arange(len(keys))
+        mask = self.capacity - 1
+        while len(active) > 0:
+            slot_keys = self.keys[probes[active]]
+            is_found = slot_keys == keys[active]
+            slots[active[is_found]] = probes[active[is_found]]
+            active = active[~is_found & (slot_keys != EMPTY)]
+            probes[active] = (probes[active] + 1) & mask
+        return slots
+
+    def insert(self, keys):
+        """Inserts keys that are not in the table and returns their slots.
+        Keys competing for the same empty slot are placed one at a time."""
+        slots = np.full(len(keys), EMPTY, dtype=np.int64)
+        probes = self.home_slots(keys)
+        active = np.arange(len(keys))
+        mask = self.capacity - 1
+        while len(active) > 0:
+            is_free = self.keys[probes[active]] == EMPTY
+            (_, first) = np.unique(probes[active[is_free]], return_index=True)
+            winners = active[is_free][first]
+            self.keys[probes[winners]] = keys[winners]
+            slots[winners] = probes[winners]
+            is_waiting = np.ones(len(active), dtype=bool)
+            is_waiting[np.flatnonzero(is_free)[first]] = False
+            active = active[is_waiting]
+            probes[active] = (probes[active] + 1) & mask
+        self.size += len(keys)
+        return slots
+
+    def rehash(self, capacity, keep=None):
+        """Moves the entries (those in keep, if given) into new arrays of given capacity."""
+        is_used = self.keys != EMPTY
+        if keep is not None:
+            is_used &= keep
+        (keys, values, counts, last_used) = (self.keys[is_used], self.values[is_used],
+                                             self.counts[is_used], self.last_used[is_used])
+        self.allocate(capacity)
+        self.size = 0
+        slots = self.insert(keys)
+        self.values[slots] = values
+        self.counts[slots] = counts
+        self.last_used[slots] = last_used
+
+    def make_room(self, new_key_count, protected_slots):
+        """Evicts entries so that new_key_count keys fit into max_size entries,
+        and grows the arrays to keep the load factor at most one half. Entries
+        in protected_slots are not evicted. A quarter of max_size is freed at
+        once so that evictions do not happen at every update."""
+        if self.max_size is not None and self.size + new_key_count > self.max_size:
+            is_candidate = self.keys != EMPTY
+            is_candidate[protected_slots] = False
+            candidate_slots = np.flatnonzero(is_candidate)
+            if self.eviction_policy == "least_evaluated":
+                order = np.lexsort((self.last_used[candidate_slots], self.counts[candidate_slots]))
+            else: # if self.eviction_policy == "least_recently_used":
+                order = np.argsort(self.last_used[candidate_slots], kind="stable")
+            target_size = max(0, self.max_size - new_key_count - self.max_size // 4)
+            eviction_count = min(len(candidate_slots), self.size - target_size)
+            keep = np.ones(self.capacity, dtype=bool)
+            keep[candidate_slots[order[:eviction_count]]] = False
+            self.eviction_count += eviction_count
+            self.rehash(self.capacity, keep)
+        capacity = self.capacity
+        while 2 * (self.size + new_key_count) > capacity:
+            capacity *= 2
+        if capacity != self.capacity:
+            self.rehash(capacity)
+
+    def lookup(self, keys):
+        """Returns the aggregated values and evaluation counts of keys.
+        Keys not in the table have value nan and count 0."""
+        slots = self.find_slots(keys)
+        is_found = slots != EMPTY
+        values = np.where(is_found, self.values[slots], np.nan)
+        counts = np.where(is_found, self.counts[slots], 0)
+        return (values, counts)
+
+    def aggregate(self, keys, new_values, method, update=True):
+        """Aggregates a batch of new fitness values of keys (which may repeat)
+        with the values in the table by the given method. Returns the
+        aggregated value and evaluation count for every entry of keys. The
+        table is left unchanged if update is False."""
+        if method not in AGGREGATION_METHODS:
+            raise ValueError(f"Unknown aggregation method {method}.")
+        keys = np.asarray(keys, dtype=np.int64)
+        new_values = np.asarray(new_values, dtype=np.float64)
+        (unique_keys, inverse, values, counts) = aggregate_batch(keys, new_values, method)
+        slots = self.find_slots(unique_keys)
+        is_found = slots != EMPTY
+        old_values = self.values[slots[is_found]]
+        old_counts = self.counts[slots[is_found]]
+        if method == "minimum":
+            values[is_found] = np.minimum(old_values, values[is_found])
+        elif method == "maximum":
+            values[is_found] = np.maximum(old_values, values[is_found])
+        elif method == "average":
+            values[is_found] = (old_values * old_counts + values[is_found] * counts[is_found]) \
+                / (old_counts + counts[is_found])
+        counts[is_found] += old_counts
+
+        if update:
+            self.time += 1
+            self.make_room(int((~is_found).sum()), self.find_slots(unique_keys[is_found]))
+            slots = self.find_slots(unique_keys)
+            is_new = slots == EMPTY
+            slots[is_new] = self.insert(unique_keys[is_new])
+            self.values[slots] = values
+            self.counts[slots] = counts
+            self.last_used[slots] = self.time
+        return (values[inverse], counts[inverse])
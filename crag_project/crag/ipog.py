@@ -0,0 +1,142 @@
+"""
+This module provides IPOGTestSuiteGenerator to extend TestSuiteGenerator
+with a backend that runs inside the Python process. Test suites are
+generated with the IPOG strategy described in
+Lei, Kacker, Kuhn, Okun, Lawrence,
+'IPOG: A General Strategy for T-Way Software Testing',
+ECBS '07: Proceedings of the 14th Annual IEEE International Conference
+and Workshops on the Engineering of Computer-Based Systems, pp. 549-556, 2007
+"""
+
+import itertools
+import numpy as np
+from . import tsgenerator as tsgen
+
+DONT_CARE = -1
+
+
+class CoveringArrayBuilder:
+    """Builds a covering array row by row. Unassigned (don't care) entries
+    are marked with DONT_CARE until they are fixed at the end."""
+
+    def __init__(self, parameter_count, initial_rows=None):
+        self.parameter_count = parameter_count
+        self.rows = np.full((64, parameter_count), DONT_CARE, dtype=np.int64)
+        self.row_count = 0
+        if initial_rows is not None:
+            for row in initial_rows:
+                self.add_row(row)
+
+    def add_row(self, row):
+        if self.row_count == len(self.rows):
+            grown_rows = np.full((2 * len(self.rows), self.parameter_count), DONT_CARE, dtype=np.int64)
+            grown_rows[:self.row_count] = self.rows
+            self.rows = grown_rows
+        self.rows[self.row_count] = row
+        self.row_count += 1
+        return self.row_count - 1
+
+    def array(self):
+        return self.rows[:self.row_count]
+
+
+def extend_horizontally(builder, parameter, uncovered):
+    """Assigns a value of the given parameter to every row that has none,
+    greedily picking the value that covers the most uncovered t-tuples.
+    The t-tuples covered by all rows are marked in uncovered."""
+    (combinations, weights) = uncovered["combinations"], uncovered["weights"]
+    table = uncovered["table"]
+    rows = builder.array()
+    for r in range(len(rows)):
+        values = rows[r, combinations]
+        is_assigned = (values != DONT_CARE).all(axis=1)
+        indices = (values[is_assigned] * weights).sum(axis=1)
+        assigned_combinations = np.flatnonzero(is_assigned)
+        if rows[r, parameter] == DONT_CARE:
+            gains = table[assigned_combinations, indices].sum(axis=0)
+            rows[r, parameter] = int(np.argmax(gains))
+        table[assigned_combinations, indices, rows[r, parameter]] = False
+
+
+def extend_vertically(builder, parameter, value_count, uncovered):
+    """Covers the remaining t-tuples by filling don't care entries of
+    existing rows when possible and adding new rows otherwise."""
+    (combinations, weights) = uncovered["combinations"], uncovered["weights"]
+    table = uncovered["table"]
+    for (c, index, value) in np.argwhere(table):
+        columns = list(combinations[c]) + [parameter]
+        values = [(index // weight) % value_count for weight in weights] + [value]
+        rows = builder.array()
+        sub_rows = rows[:, columns]
+        is_compatible = ((sub_rows == values) | (sub_rows == DONT_CARE)).all(axis=1)
+        compatible_rows = np.flatnonzero(is_compatible)
+        if len(compatible_rows) > 0:
+            rows[compatible_rows[0], columns] = values
+        else:
+            row = np.full(builder.parameter_count, DONT_CARE, dtype=np.int64)
+            row[columns] = values
+            builder.add_row(row)
+    table[:] = False
+
+
+def uncovered_tuples(parameter, strength, value_count):
+    """Tracks t-tuples involving the given parameter and (t - 1) parameters
+    before it. Values of the earlier parameters are encoded in base value_count."""
+    combinations = np.array(list(itertools.combinations(range(parameter), strength - 1)), dtype=np.int64)
+    combinations = combinations.reshape(-1, strength - 1)
+    weights = value_count ** np.arange(strength - 2, -1, -1, dtype=np.int64)
+    table = np.ones((len(combinations), value_count ** (strength - 1), value_count), dtype=bool)
+    return {"combinations": combinations, "weights": weights, "table": table}
+
+
+def generate_covering_array(parameter_count, value_count, strength, seed_test_suite=None):
+    """Generates a test suite in which every combination of values of every
+    strength parameters appears in at least one test. Tests of seed_test_suite
+    are kept as the first tests of the result. Returns an array of shape
+    (test count, parameter_count)."""
+    strength = max(1, min(strength, parameter_count))
+    seeds = np.asarray(seed_test_suite if seed_test_suite is not None else [], dtype=np.int64)
+    seeds = seeds.reshape(-1, parameter_count)
+    builder = CoveringArrayBuilder(parameter_count, seeds)
+
+    # All value combinations of the first strength parameters not given by seeds
+    seeded_prefixes = set(map(tuple, seeds[:, :strength].tolist()))
+    for prefix in itertools.product(range(value_count), repeat=strength):
+        if prefix not in seeded_prefixes:
+            row = np.full(parameter_count, DONT_CARE, dtype=np.int64)
+            row[:strength] = prefix
+            builder.add_row(row)
+
+    for parameter in range(strength, parameter_count):
+        uncovered = uncovered_tuples(parameter, strength, value_count)
+        extend_horizontally(builder, parameter, uncovered)
+        extend_vertically(builder, parameter, value_count, uncovered)
+
+    rows = builder.array()
+    is_dont_care = rows == DONT_CARE
+    rows[is_dont_care] = tsgen.numpy_random().randint(0, value_count, int(is_dont_care.sum()))
+    return rows.copy()
+
+
+"""This class extends TestSuiteGenerator for the in-process IPOG backend."""
+class IPOGTestSuiteGenerator(tsgen.TestSuiteGenerator):
+    supports_concurrent_calls = True
+
+    def __init__(self):
+        super().__init__()
+
+    def call_with_seed(self, strength, seed_test_suite):
+        """Generates a test suite of given strength that extends the
+        seed test suite. No files or external processes are involved."""
+        return generate_covering_array(2 * self.road_section_count, self.param_value_count,
+                                       strength, seed_test_suite)
+
+    def call(self, strength):
+        """Generates a test suite of given strength."""
+        return generate_covering_array(2 * self.road_section_count, self.param_value_count, strength)
+
+
+if __name__ == "__main__":
+    itsg = IPOGTestSuiteGenerator()
+    itsg.set_model(5, 5)
+    print(len(itsg.call(2)))
@@ -0,0 +1,118 @@
+"""
+This module provides Metrics that keeps the wall time spent in phases of
+CRAG (e.g. backend calls, road synthesis, evaluation), counters of roads
+and evaluations, and the sizes of test suites per strength. Metrics can be
+exported as a JSON snapshot or as a text file in Prometheus exposition
+format. NullMetrics has the same interface and ignores everything, so that
+instrumentation costs next to nothing when metrics are not collected.
+"""
+
+import contextlib
+import json
+import threading
+import time
+from . import utils
+
+PROMETHEUS_PREFIX = "crag"
+
+
+class Metrics:
+    """Timers and counters of a CRAG run. Timers use the monotonic
+    performance counter. Updates may come from several threads (e.g. the
+    prefetch thread calling the backend)."""
+
+    def __init__(self):
+        self.phase_seconds = {}
+        self.phase_counts = {}
+        self.counters = {}
+        self.test_suite_sizes = {}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def time(self, phase):
+        """Context manager adding the time spent in its body to phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def add_time(self, phase, seconds):
+        with self.lock:
+            self.phase_seconds[phase] = self.phase_seconds.get(phase, 0.0) + seconds
+            self.phase_counts[phase] = self.phase_counts.get(phase, 0) + 1
+
+    def increment(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def observe_test_suite(self, strength, size):
+        """Records the size of a test suite generated for given strength."""
+        with self.lock:
+            sizes = self.test_suite_sizes.setdefault(strength, {"count": 0, "total": 0, "last": 0})
+            sizes["count"] += 1
+            sizes["total"] += size
+            sizes["last"] = size
+
+    def snapshot(self):
+        """Returns a copy of the metrics as a dictionary of plain values."""
+        with self.lock:
+            return {"phases": {phase: {"seconds": seconds, "count": self.phase_counts[phase]}
+                               for (phase, seconds) in self.phase_seconds.items()},
+                    "counters": dict(self.counters),
+                    "test_suite_sizes": {str(strength): dict(sizes)
+                                         for (strength, sizes) in sorted(self.test_suite_sizes.items())}}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """Returns the metrics in Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [f"# HELP {PROMETHEUS_PREFIX}_phase_seconds_total Wall time spent in a phase of CRAG.",
+                 f"# TYPE {PROMETHEUS_PREFIX}_phase_seconds_total counter"]
+        for (phase, phase_metrics) in sorted(snapshot["phases"].items()):
+            lines.append(f'{PROMETHEUS_PREFIX}_phase_seconds_total{{phase="{phase}"}} {phase_metrics["seconds"]!r}')
+        lines += [f"# HELP {PROMETHEUS_PREFIX}_phase_calls_total Number of times a phase of CRAG was entered.",
+                  f"# TYPE {PROMETHEUS_PREFIX}_phase_calls_total counter"]
+        for (phase, phase_metrics) in sorted(snapshot["phases"].items()):
+            lines.append(f'{PROMETHEUS_PREFIX}_phase_calls_total{{phase="{phase}"}} {phase_metrics["count"]}')
+        for (counter, value) in sorted(snapshot["counters"].items()):
+            lines += [f"# TYPE {PROMETHEUS_PREFIX}_{counter}_total counter",
+                      f"{PROMETHEUS_PREFIX}_{counter}_total {value}"]
+        for (name, key, kind) in [("test_suites_total", "count", "counter"),
+                                  ("test_suite_tests_total", "total", "counter"),
+                                  ("test_suite_size", "last", "gauge")]:
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+            for (strength, sizes) in snapshot["test_suite_sizes"].items():
+                lines.append(f'{PROMETHEUS_PREFIX}_{name}{{strength="{strength}"}} {sizes[key]}')
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, filepath):
+        text = self.to_json()
+        utils.write_atomically(filepath, lambda f: f.write(text), "w")
+
+    def write_prometheus(self, filepath):
+        text = self.to_prometheus()
+        utils.write_atomically(filepath, lambda f: f.write(text), "w")
+
+
+class NullMetrics:
+    """Metrics that ignores all updates."""
+
+    NULL_CONTEXT = contextlib.nullcontext()
+
+    def time(self, phase):
+        return self.NULL_CONTEXT
+
+    def add_time(self, phase, seconds):
+        pass
+
+    def increment(self, counter, value=1):
+        pass
+
+    def observe_test_suite(self, strength, size):
+        pass
+
+    def snapshot(self):
+        return {"phases": {}, "counters": {}, "test_suite_sizes": {}}
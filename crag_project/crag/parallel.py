@@ -0,0 +1,71 @@
+"""
+This module provides evaluation of roads in a pool of processes. Points of
+all roads of a test suite are placed once in shared memory, and worker
+processes receive only the location of their roads in it. The evaluate
+function has to be picklable (e.g. defined at the top level of a module).
+"""
+
+from collections import deque
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from . import roadrecord
+
+
+def evaluate_chunk(evaluate_function, shared_memory_name, shape, chunk):
+    """Evaluates roads of a chunk in a worker process. Each entry of chunk
+    is (begin, end, is_in_map, is_reframable) where begin and end locate
+    the points of a road in the shared points array."""
+    shared_memory = SharedMemory(name=shared_memory_name)
+    try:
+        points = np.ndarray(shape, dtype=np.float64, buffer=shared_memory.buf)
+        evaluations = []
+        for (begin, end, is_in_map, is_reframable) in chunk:
+            road_points = list(zip(points[begin:end, 0].tolist(), points[begin:end, 1].tolist()))
+            evaluations.append(evaluate_function((road_points, is_in_map, is_reframable)))
+        del points
+    finally:
+        shared_memory.close()
+    return evaluations
+
+
+def evaluate_roads_in_pool(executor, evaluate_function, roads, chunk_size, max_chunks_in_flight):
+    """Evaluates roads (FrenetRoads or of the form (road_points, is_in_map, is_reframable))
+    in chunks on a concurrent.futures executor and yields their evaluations
+    in the order of roads. New chunks are handed out only as earlier
+    evaluations are consumed, and chunks not yet started are cancelled when
+    the consumer stops iterating (e.g. because the budget is over)."""
+    if len(roads) == 0:
+        return
+    roads_points = [roadrecord.road_points_array(road) for road in roads]
+    point_counts = [len(road_points) for road_points in roads_points]
+    ends = np.cumsum(point_counts)
+    shape = (int(ends[-1]), 2)
+    shared_memory = SharedMemory(create=True, size=max(shape[0] * 2 * 8, 1))
+    futures = deque()
+    try:
+        points = np.ndarray(shape, dtype=np.float64, buffer=shared_memory.buf)
+        points[:] = np.concatenate(roads_points)
+        del points
+        chunks = [[(int(end - count), int(end), road[1], road[2])
+                   for (road, count, end) in zip(roads[i:i + chunk_size], point_counts[i:i + chunk_size],
+                                                 ends[i:i + chunk_size])]
+                  for i in range(0, len(roads), chunk_size)]
+        next_chunk = 0
+        while next_chunk < len(chunks) or futures:
+            while next_chunk < len(chunks) and len(futures) < max_chunks_in_flight:
+                futures.append(executor.submit(evaluate_chunk, evaluate_function, shared_memory.name,
+                                               shape, chunks[next_chunk]))
+                next_chunk += 1
+            for evaluation in futures.popleft().result():
+                yield evaluation
+    finally:
+        for future in futures:
+            future.cancel()
+        for future in futures:
+            if not future.cancelled():
+                try:
+                    future.result()
+                except Exception:
+                    pass
+        shared_memory.close()
+        shared_memory.unlink()
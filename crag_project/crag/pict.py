@@ -3,20 +3,24 @@ This module provides PICTTestSuiteGenerator to extend TestSuiteGenerator
 to be able to use PICT tool as a backend.
 """
 
+import numpy as np
 from . import tsgenerator as tsgen
 from . import utils
 
 
 def parse_pict_command_result(pict_command_result):
-    """Parses pict command result string into a list of lists of ints.
-    The main result of pict starts after several lines. Therefore, this
-    method first figures out the start_line."""
+    """Parses pict command result string into a matrix of ints with a row
+    for every test. The main result of pict starts after several lines.
+    Therefore, this method first figures out the start_line."""
     start_line = utils.line_index(pict_command_result, "Length0") + 1
-    return [[int(index_str) for index_str in line.split()] for line in pict_command_result.splitlines()[start_line:]]
+    return np.array([line.split() for line in pict_command_result.splitlines()[start_line:]], dtype=tsgen.TEST_DTYPE)
 
 
 """This class extends TestSuiteGenerator for PICT backend."""
 class PictTestSuiteGenerator(tsgen.TestSuiteGenerator):
+    # Unseeded calls only read the model file and print the result
+    supports_concurrent_calls = True
+
     def __init__(self,
                  pict_executable_filepath,
                  model_filepath,
@@ -32,6 +36,9 @@ class PictTestSuiteGenerator(tsgen.TestSuiteGenerator):
         super().set_model(road_section_count, param_value_count)
         self.create_model()
 
+    def get_backend_identity(self):
+        return f"{super().get_backend_identity()}:{self.pict_executable_filepath}"
+
     def call_with_seed(self, strength, seed_test_suite):
         """Calls PICT with given strength and seed test suite.
         Notice that the model is described in the model file and
@@ -0,0 +1,62 @@
+"""
+This module provides InteractionPrioritizer that orders the tests of a
+test suite by their predicted fitness. For every t-tuple of parameters
+(e.g. every (Length_i, Kappa_j) pair for t = 2) and every combination of
+their values, the sum and count of the fitness values of evaluated tests
+having these values are kept. The predicted fitness of a test is the mean
+over its t-tuples of these averages, smoothed towards the average of all
+evaluations for rarely seen value combinations.
+"""
+
+import itertools
+import numpy as np
+
+
+class InteractionPrioritizer:
+    """Keeps fitness statistics of value combinations of t-tuples of
+    parameters. Updating with an evaluation touches one entry per t-tuple,
+    so it costs the same regardless of how many tests were evaluated."""
+
+    def __init__(self, parameter_count, value_count, strength=2, prior_weight=1.0):
+        strength = max(1, min(strength, parameter_count))
+        self.parameter_count = parameter_count
+        self.combinations = np.array(list(itertools.combinations(range(parameter_count), strength)), dtype=np.int64)
+        self.weights = value_count ** np.arange(strength - 1, -1, -1, dtype=np.int64)
+        self.prior_weight = prior_weight
+        self.sums = np.zeros((len(self.combinations), value_count ** strength))
+        self.counts = np.zeros((len(self.combinations), value_count ** strength))
+        self.total = 0.0
+        self.total_count = 0
+
+    def value_codes(self, test_suite):
+        """Returns a matrix with the code of the values of every t-tuple
+        (column) in every test (row), in base value_count."""
+        test_suite = np.asarray(test_suite, dtype=np.int64).reshape(-1, self.parameter_count)
+        return (test_suite[:, self.combinations] * self.weights).sum(axis=2)
+
+    def update(self, test_suite, fitness_values):
+        """Adds evaluations of tests to the statistics. Non-finite fitness
+        values (e.g. of interrupted evaluations) are ignored."""
+        fitness_values = np.asarray(fitness_values, dtype=np.float64).reshape(-1)
+        is_finite = np.isfinite(fitness_values)
+        codes = self.value_codes(test_suite)[is_finite]
+        fitness_values = fitness_values[is_finite]
+        columns = np.broadcast_to(np.arange(len(self.combinations)), codes.shape)
+        np.add.at(self.sums, (columns, codes), fitness_values[:, None])
+        np.add.at(self.counts, (columns, codes), 1)
+        self.total += fitness_values.sum()
+        self.total_count += len(fitness_values)
+
+    def predict(self, test_suite):
+        """Predicts the fitness of every test of a test suite."""
+        codes = self.value_codes(test_suite)
+        columns = np.arange(len(self.combinations))
+        prior = self.total / self.total_count if self.total_count > 0 else 0.0
+        means = (self.sums[columns, codes] + self.prior_weight * prior) \
+            / (self.counts[columns, codes] + self.prior_weight)
+        return means.mean(axis=1)
+
+    def prioritize(self, test_suite):
+        """Returns the order of the tests from the smallest (most promising)
+        predicted fitness. Tests with equal predictions keep their order."""
+        return np.argsort(self.predict(test_suite), kind="stable")
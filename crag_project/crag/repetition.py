@@ -0,0 +1,69 @@
+"""
+This module provides the evaluation of the repetition-based road search:
+several roads are sampled for a road configuration, all of them are
+evaluated, and the configuration gets the evaluation of its best road.
+Repetitions are evaluated through a concurrent.futures.Executor, with a
+bounded number of evaluations in flight, so that the repetitions of one
+or several configurations run concurrently and the remaining repetitions
+of a configuration can be dropped once one of them is good enough.
+"""
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from .utils import fitness_key
+
+
+def evaluate_repetitions(executor, evaluate_function, repetition_roads, max_in_flight,
+                         budget_availability_function=None, stop_threshold=None):
+    """Evaluates the roads of every configuration (repetition_roads is a list
+    with a list of roads per configuration) and yields (configuration index,
+    index of the best road, its evaluation, number of evaluated roads) as
+    soon as all evaluations of a configuration are done, in any order.
+
+    At most max_in_flight evaluations are submitted to the executor at once,
+    in configuration order. The budget is checked once before every
+    submission, and no evaluation is submitted once it is over;
+    configurations whose evaluations are not all done are then not
+    yielded, so that they can be evaluated again. If stop_threshold is
+    given, the repetitions of a configuration that are not yet submitted
+    are dropped once one of its roads has a smaller fitness."""
+    queue = deque((configuration, repetition) for (configuration, roads) in enumerate(repetition_roads)
+                  for repetition in range(len(roads)))
+    remaining_counts = [len(roads) for roads in repetition_roads]
+    best_repetitions = [None] * len(repetition_roads)
+    best_evaluations = [None] * len(repetition_roads)
+    evaluated_counts = [0] * len(repetition_roads)
+    is_stopped = [False] * len(repetition_roads)
+    in_flight = {}
+    try:
+        while queue or in_flight:
+            while queue and len(in_flight) < max_in_flight:
+                (configuration, repetition) = queue.popleft()
+                if is_stopped[configuration]:
+                    continue
+                if budget_availability_function is not None and not budget_availability_function():
+                    queue.clear()
+                    break
+                future = executor.submit(evaluate_function, repetition_roads[configuration][repetition])
+                in_flight[future] = (configuration, repetition)
+            if not in_flight:
+                break
+            (done, _) = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=lambda future: in_flight[future]):
+                (configuration, repetition) = in_flight.pop(future)
+                evaluation = future.result()
+                evaluated_counts[configuration] += 1
+                remaining_counts[configuration] -= 1
+                best_evaluation = best_evaluations[configuration]
+                if best_evaluation is None or fitness_key(evaluation[0]) < fitness_key(best_evaluation[0]):
+                    best_repetitions[configuration] = repetition
+                    best_evaluations[configuration] = evaluation
+                if stop_threshold is not None and fitness_key(evaluation[0]) < stop_threshold:
+                    is_stopped[configuration] = True
+                if remaining_counts[configuration] == 0 or (is_stopped[configuration] and not any(
+                        flight_configuration == configuration for (flight_configuration, _) in in_flight.values())):
+                    yield (configuration, best_repetitions[configuration], best_evaluations[configuration],
+                           evaluated_counts[configuration])
+    finally:
+        for future in in_flight:
+            future.cancel()
@@ -5,9 +5,18 @@ can fit into given map sizes and fitting them if they can."""
 
 import math
 import random as ra
+import numpy as np
 from shapely import geometry
 from . import utils
 
+# Marker used in place of a road for configurations without a valid road
+INFEASIBLE = "INFEASIBLE"
+
+
+def is_infeasible(road):
+    """Whether a road (or the marker of an evaluation) is INFEASIBLE."""
+    return isinstance(road, str) and road == INFEASIBLE
+
 
 def frenet_to_cartesian_road_points_with_reframability_check(x0, y0, theta0, ds, kappas, lane_width, map_size):
     """Converts a set of curvatures into a set of points in Cartesian
@@ -66,6 +75,132 @@ def is_likely_self_intersecting(road_points, lane_width):
     return any(drop_road_checks.values())
 
 
+def are_likely_self_intersecting(points, point_counts, lane_width, chunk_size=1000):
+    """Batch version of is_likely_self_intersecting for roads given in the
+    array format of frenet_to_cartesian_roads_with_reframability_check.
+    It flags a road if its center line is not simple or if its left and
+    right offset curves at distance lane_width intersect. Instead of shapely
+    geometries, segments of all three curves are placed in a uniform grid
+    and only segments sharing a grid cell are tested against each other.
+    Roads are processed chunk_size at a time to bound memory use.
+
+    The offset curves of shapely are trimmed where they come closer than
+    lane_width to the center line, so they can only meet at trimming points.
+    Whether shapely reports such touching curves as intersecting depends on
+    rounding errors; in these rare cases this function flags the road."""
+    points = np.asarray(points, dtype=float)
+    point_counts = np.asarray(point_counts, dtype=int)
+    result = np.zeros(len(points), dtype=bool)
+    for begin in range(0, len(points), chunk_size):
+        end = begin + chunk_size
+        result[begin:end] = _are_likely_self_intersecting(points[begin:end], point_counts[begin:end], lane_width)
+    return result
+
+
+def _are_likely_self_intersecting(points, point_counts, lane_width):
+    road_count, max_point_count = points.shape[:2]
+    if road_count == 0 or max_point_count < 2:
+        return np.zeros(road_count, dtype=bool)
+
+    # Offset curves are built from miter vectors at the vertices, which is
+    # how the offset curves of shapely join segments on their inner side
+    # (on the outer side the small arcs of round joins are cut by a chord).
+    directions = points[:, 1:] - points[:, :-1]
+    lengths = np.hypot(directions[..., 0], directions[..., 1])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        normals = np.where(lengths[..., None] > 0,
+                           np.stack([-directions[..., 1], directions[..., 0]], axis=2) / lengths[..., None], 0.0)
+    vertex_indices = np.arange(max_point_count)[None, :]
+    previous_normals = np.concatenate([normals[:, :1], normals], axis=1)
+    next_normals = np.concatenate([normals, normals[:, -1:]], axis=1)
+    next_normals = np.where((vertex_indices >= point_counts[:, None] - 1)[..., None], previous_normals, next_normals)
+    previous_normals = np.where((vertex_indices == 0)[..., None], next_normals, previous_normals)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        miters = (previous_normals + next_normals) / (1 + np.sum(previous_normals * next_normals, axis=2))[..., None]
+    miters = np.nan_to_num(miters, nan=0.0, posinf=0.0, neginf=0.0)
+    left_points = points + lane_width * miters
+    right_points = points - lane_width * miters
+
+    # Segments of the center line (curve 0), the left (1) and the right (2) offset curves
+    segment_indices = np.broadcast_to(np.arange(max_point_count - 1)[None, :], (road_count, max_point_count - 1))
+    is_segment = segment_indices < point_counts[:, None] - 1
+    roads = np.broadcast_to(np.arange(road_count)[:, None], is_segment.shape)[is_segment]
+    indices = segment_indices[is_segment]
+    starts = np.concatenate([curve[:, :-1][is_segment] for curve in (points, left_points, right_points)])
+    ends = np.concatenate([curve[:, 1:][is_segment] for curve in (points, left_points, right_points)])
+    curves = np.repeat(np.arange(3), len(roads))
+    roads = np.tile(roads, 3)
+    indices = np.tile(indices, 3)
+
+    (firsts, seconds) = _segment_pairs_sharing_grid_cell(starts, ends, roads)
+    first_curves = curves[firsts]
+    second_curves = curves[seconds]
+    is_center_pair = (first_curves == 0) & (second_curves == 0) & (np.abs(indices[firsts] - indices[seconds]) >= 2)
+    is_left_right_pair = (first_curves != 0) & (second_curves != 0) & (first_curves != second_curves)
+    is_relevant = is_center_pair | is_left_right_pair
+    firsts = firsts[is_relevant]
+    seconds = seconds[is_relevant]
+
+    is_intersecting = _segments_intersect(starts[firsts], ends[firsts], starts[seconds], ends[seconds])
+    result = np.zeros(road_count, dtype=bool)
+    result[roads[firsts[is_intersecting]]] = True
+    return result
+
+
+def _segment_pairs_sharing_grid_cell(starts, ends, roads):
+    """Places segments into a uniform grid whose cells are at least as large
+    as the longest segment, so that every segment touches at most 2x2 cells.
+    Returns index arrays of segment pairs of the same road that share a cell."""
+    if len(starts) == 0:
+        return (np.zeros(0, dtype=int), np.zeros(0, dtype=int))
+    cell_size = max(float(np.max(np.hypot(*(ends - starts).T))), 1e-9)
+    origin = np.minimum(starts, ends).min(axis=0)
+    min_cells = np.floor((np.minimum(starts, ends) - origin) / cell_size).astype(np.int64)
+    max_cells = np.floor((np.maximum(starts, ends) - origin) / cell_size).astype(np.int64)
+    grid_width = int(max_cells[:, 0].max()) + 2
+    grid_height = int(max_cells[:, 1].max()) + 2
+
+    keys = []
+    segments = []
+    for (dx, dy) in ((0, 0), (1, 0), (0, 1), (1, 1)):
+        cells = min_cells + [dx, dy]
+        is_touched = (cells[:, 0] <= max_cells[:, 0]) & (cells[:, 1] <= max_cells[:, 1])
+        keys.append(((roads[is_touched] * grid_width) + cells[is_touched, 0]) * grid_height + cells[is_touched, 1])
+        segments.append(np.flatnonzero(is_touched))
+    keys = np.concatenate(keys)
+    segments = np.concatenate(segments)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    segments = segments[order]
+
+    firsts = []
+    seconds = []
+    offset = 1
+    while offset < len(keys):
+        is_same_cell = keys[:-offset] == keys[offset:]
+        if not is_same_cell.any():
+            break
+        firsts.append(segments[:-offset][is_same_cell])
+        seconds.append(segments[offset:][is_same_cell])
+        offset += 1
+    if not firsts:
+        return (np.zeros(0, dtype=int), np.zeros(0, dtype=int))
+    return (np.concatenate(firsts), np.concatenate(seconds))
+
+
+def _segments_intersect(a0, a1, b0, b1):
+    """Elementwise test of whether closed segments [a0, a1] and [b0, b1] intersect."""
+    def orientation(p, q, r):
+        return (q[:, 0] - p[:, 0]) * (r[:, 1] - p[:, 1]) - (q[:, 1] - p[:, 1]) * (r[:, 0] - p[:, 0])
+
+    o1 = orientation(a0, a1, b0)
+    o2 = orientation(a0, a1, b1)
+    o3 = orientation(b0, b1, a0)
+    o4 = orientation(b0, b1, a1)
+    boxes_overlap = ((np.minimum(a0, a1) <= np.maximum(b0, b1)) & (np.minimum(b0, b1) <= np.maximum(a0, a1))).all(axis=1)
+    return (o1 * o2 <= 0) & (o3 * o4 <= 0) & boxes_overlap
+
+
 def reframe_road(road_points, min_x, min_y, lane_width):
     """Road reframing based on the idea from
     Castellano, Cetinkaya, Ho Thanh, Klikovits, Zhang, Arcaini,
@@ -90,3 +225,129 @@ def generate_road_with_reframability_check(lengths_indices, kappas_indices, para
                                         param_value_count, kappas_indices[i])
         kappas += [kappa for j in range(segment_count)]
     return frenet_to_cartesian_road_points_with_reframability_check(x0, y0, theta0, ds, kappas, lane_width, map_size)
+
+
+def frenet_to_cartesian_roads(theta0s, ds, segment_counts, section_kappas, x0=0, y0=0):
+    """Batch conversion of roads in Frenet frame into Cartesian coordinates.
+    Road i starts at (x0, y0) with heading theta0s[i] and its jth section
+    consists of segment_counts[i][j] segments with curvature section_kappas[i][j].
+    Headings and points of all roads are computed at once by cumulative sums.
+
+    Returns a tuple (points, point_counts) of arrays. points has shape
+    (road count, maximum point count, 2). Points of road i are
+    points[i, :point_counts[i]]; the remaining rows repeat its last point.
+    The points of a road do not depend on the other roads of the batch."""
+    theta0s = np.asarray(theta0s, dtype=float)
+    segment_counts = np.asarray(segment_counts, dtype=int)
+    section_kappas = np.asarray(section_kappas, dtype=float)
+    road_count = len(theta0s)
+    kappa_counts = segment_counts.sum(axis=1)
+    max_kappa_count = int(kappa_counts.max(initial=0))
+
+    # Per-segment curvatures of all roads, padded with zeros after each road ends
+    kappas = np.zeros((road_count, max_kappa_count))
+    flat_kappas = np.repeat(section_kappas.ravel(), segment_counts.ravel())
+    rows = np.repeat(np.arange(road_count), kappa_counts)
+    columns = np.arange(len(flat_kappas)) - np.repeat(np.cumsum(kappa_counts) - kappa_counts, kappa_counts)
+    kappas[rows, columns] = flat_kappas
+
+    # Headings are accumulated in the same order as in the single road version
+    thetas = np.cumsum(np.concatenate([theta0s[:, None], kappas * ds], axis=1), axis=1)
+    is_step = np.arange(max_kappa_count + 1)[None, :] <= kappa_counts[:, None]
+    dxs = np.where(is_step, ds * np.cos(thetas), 0.0)
+    dys = np.where(is_step, ds * np.sin(thetas), 0.0)
+    xs = np.cumsum(np.concatenate([np.full((road_count, 1), float(x0)), dxs], axis=1), axis=1)
+    ys = np.cumsum(np.concatenate([np.full((road_count, 1), float(y0)), dys], axis=1), axis=1)
+    return (np.stack([xs, ys], axis=2), kappa_counts + 2)
+
+
+def reframe_roads(points, lane_width, map_size):
+    """Batch version of the reframability check and reframing of
+    frenet_to_cartesian_road_points_with_reframability_check for points in
+    the format of frenet_to_cartesian_roads. Reframable roads are translated
+    in place so that their minimum coordinates become lane_width.
+
+    Returns a tuple (points, is_in_map, is_reframable, reframe_origins) of
+    arrays, where reframe_origins holds the minimum coordinates of every road
+    before reframing."""
+    xs = points[:, :, 0]
+    ys = points[:, :, 1]
+    min_xs = xs.min(axis=1, initial=np.inf)
+    min_ys = ys.min(axis=1, initial=np.inf)
+    max_xs = xs.max(axis=1, initial=-np.inf)
+    max_ys = ys.max(axis=1, initial=-np.inf)
+
+    is_reframable = (max_xs - min_xs <= map_size - 2 * lane_width) & (max_ys - min_ys <= map_size - 2 * lane_width)
+    is_in_map = (max_xs < map_size - lane_width) & (min_xs > lane_width) & (max_ys < map_size - lane_width) & (min_ys > lane_width)
+    reframe_origins = np.stack([min_xs, min_ys], axis=1)
+    points[is_reframable] = points[is_reframable] - reframe_origins[is_reframable, None, :] + lane_width
+    is_in_map = is_in_map | is_reframable
+    return (points, is_in_map, is_reframable, reframe_origins)
+
+
+def frenet_to_cartesian_roads_with_reframability_check(theta0s, ds, segment_counts, section_kappas,
+                                                       lane_width, map_size, x0=0, y0=0):
+    """Batch version of frenet_to_cartesian_road_points_with_reframability_check
+    (see frenet_to_cartesian_roads and reframe_roads).
+
+    Returns a tuple (points, point_counts, is_in_map, is_reframable) of arrays.
+    points has shape (road count, maximum point count, 2). Points of road i are
+    points[i, :point_counts[i]]; the remaining rows repeat its last point."""
+    (points, point_counts) = frenet_to_cartesian_roads(theta0s, ds, segment_counts, section_kappas, x0, y0)
+    (points, is_in_map, is_reframable, _) = reframe_roads(points, lane_width, map_size)
+    return (points, point_counts, is_in_map, is_reframable)
+
+
+def generate_roads_with_reframability_check(test_suite, param_value_count,
+                                            min_segment_count, max_segment_count,
+                                            global_curvature_bound, ds, lane_width, map_size):
+    """Batch version of generate_road_with_reframability_check. The test suite
+    is given as a matrix whose rows hold the length indices followed by the
+    kappa indices of a road configuration (i.e., an array of shape
+    (test count, 2 * road section count)). All random samples are drawn at once.
+    The result is in the format of frenet_to_cartesian_roads_with_reframability_check."""
+    (theta0s, segment_counts, section_kappas) = sample_frenet_parameters(test_suite, param_value_count,
+                                                                        min_segment_count, max_segment_count,
+                                                                        global_curvature_bound)
+    return frenet_to_cartesian_roads_with_reframability_check(theta0s, ds, segment_counts, section_kappas,
+                                                              lane_width, map_size)
+
+
+def sample_frenet_parameters(test_suite, param_value_count, min_segment_count, max_segment_count,
+                             global_curvature_bound):
+    """Samples the initial headings, segment counts of sections, and kappas of
+    sections of roads for the tests of a test suite (see
+    generate_roads_with_reframability_check). Returns a tuple of arrays
+    (theta0s, segment_counts, section_kappas)."""
+    test_suite = np.asarray(test_suite, dtype=int)
+    road_section_count = test_suite.shape[1] // 2
+    lengths_indices = test_suite[:, :road_section_count]
+    kappas_indices = test_suite[:, road_section_count:]
+
+    theta0s = np.random.uniform(0, 2 * math.pi, len(test_suite))
+    segment_counts = utils.divide_and_sample_array(min_segment_count, max_segment_count + 1,
+                                                   param_value_count, lengths_indices).astype(int)
+    section_kappas = utils.divide_and_sample_array(-global_curvature_bound, global_curvature_bound,
+                                                   param_value_count, kappas_indices)
+    return (theta0s, segment_counts, section_kappas)
+
+
+def roads_from_arrays(points, point_counts, is_in_map, is_reframable):
+    """Converts the arrays returned by the batch road generation functions
+    into a list of roads of the form (road_points, is_in_map, is_reframable)
+    as returned by frenet_to_cartesian_road_points_with_reframability_check."""
+    return [(list(zip(road_points[:point_count, 0].tolist(), road_points[:point_count, 1].tolist())),
+             bool(in_map), bool(reframable))
+            for (road_points, point_count, in_map, reframable)
+            in zip(points, point_counts.tolist(), is_in_map, is_reframable)]
+
+
+def road_points_to_arrays(roads_points):
+    """Converts a list of road point lists into the padded (points, point_counts)
+    array format of frenet_to_cartesian_roads_with_reframability_check."""
+    point_counts = np.array([len(road_points) for road_points in roads_points], dtype=int)
+    points = np.zeros((len(roads_points), int(point_counts.max(initial=0)), 2))
+    for (i, road_points) in enumerate(roads_points):
+        points[i, :point_counts[i]] = road_points
+        points[i, point_counts[i]:] = road_points[-1]
+    return (points, point_counts)
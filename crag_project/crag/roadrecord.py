@@ -0,0 +1,177 @@
+"""
+This module provides FrenetRoad that keeps a road by its Frenet frame
+parameters (initial heading, segment counts and kappas of its sections,
+ds, and reframing origin) instead of its points. Points are computed when
+they are asked for and the most recently used ones are cached. A FrenetRoad
+also behaves as the tuple (road_points, is_in_map, is_reframable) used for
+roads elsewhere, so it can be passed to existing evaluate functions, but
+it is equal only to FrenetRoads with the same parameters.
+"""
+
+import threading
+from collections import OrderedDict
+import numpy as np
+from . import roadgeometry as rg
+
+
+class PointsCache:
+    """Bounded LRU cache from (road, dtype) to points arrays. It can be used
+    from several threads (e.g. the evaluations of the repetition strategy)."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hit_count = 0
+        self.miss_count = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            points = self.entries.get(key)
+            if points is None:
+                self.miss_count += 1
+                return None
+            self.hit_count += 1
+            self.entries.move_to_end(key)
+            return points
+
+    def put(self, key, points):
+        with self.lock:
+            self.entries[key] = points
+            self.entries.move_to_end(key)
+            self.evict()
+
+    def evict(self):
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def resize(self, max_size):
+        with self.lock:
+            self.max_size = max_size
+            self.evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# Points of the most recently used roads, shared by all FrenetRoads
+points_cache = PointsCache(256)
+
+
+def set_points_cache_size(max_size):
+    points_cache.resize(max_size)
+
+
+class FrenetRoad:
+    """A road starting at the origin with heading theta0, whose jth section
+    consists of segment_counts[j] segments of length ds with curvature
+    section_kappas[j]. If the road is reframable, its points are translated
+    by lane_width - reframe_origin, as in
+    frenet_to_cartesian_roads_with_reframability_check, whose points for
+    the same parameters are reproduced exactly."""
+
+    __slots__ = ("theta0", "ds", "segment_counts", "section_kappas", "lane_width", "reframe_origin",
+                 "is_in_map", "is_reframable")
+
+    def __init__(self, theta0, ds, segment_counts, section_kappas, lane_width, reframe_origin,
+                 is_in_map, is_reframable):
+        self.theta0 = float(theta0)
+        self.ds = float(ds)
+        self.segment_counts = np.asarray(segment_counts, dtype=np.int32)
+        self.section_kappas = np.asarray(section_kappas, dtype=np.float64)
+        self.lane_width = float(lane_width)
+        self.reframe_origin = None if reframe_origin is None else (float(reframe_origin[0]), float(reframe_origin[1]))
+        self.is_in_map = bool(is_in_map)
+        self.is_reframable = bool(is_reframable)
+
+    def point_count(self):
+        return int(self.segment_counts.sum()) + 2
+
+    def compute_points(self):
+        (points, _) = rg.frenet_to_cartesian_roads([self.theta0], self.ds, [self.segment_counts],
+                                                   [self.section_kappas])
+        points = points[0]
+        if self.is_reframable:
+            points = points - np.array(self.reframe_origin) + self.lane_width
+        return points
+
+    def points(self, dtype=np.float64):
+        """Returns the points of the road as a read-only array of shape
+        (point count, 2) with given dtype."""
+        dtype = np.dtype(dtype)
+        key = (self, dtype.str)
+        points = points_cache.get(key)
+        if points is None:
+            points = self.compute_points().astype(dtype, copy=False)
+            points.flags.writeable = False
+            points_cache.put(key, points)
+        return points
+
+    def point_list(self):
+        """Returns the points of the road as a list of (x, y) tuples."""
+        points = self.points()
+        return list(zip(points[:, 0].tolist(), points[:, 1].tolist()))
+
+    def to_tuple(self):
+        return (self.point_list(), self.is_in_map, self.is_reframable)
+
+    def __len__(self):
+        return 3
+
+    def __iter__(self):
+        return iter(self.to_tuple())
+
+    def __getitem__(self, index):
+        if index in (1, -2):
+            return self.is_in_map
+        if index in (2, -1):
+            return self.is_reframable
+        return self.to_tuple()[index]
+
+    def parameters(self):
+        return (self.theta0, self.ds, self.segment_counts.tobytes(), self.section_kappas.tobytes(), self.lane_width,
+                self.reframe_origin, self.is_in_map, self.is_reframable)
+
+    def __eq__(self, other):
+        if isinstance(other, FrenetRoad):
+            return self.parameters() == other.parameters()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.parameters())
+
+    def __repr__(self):
+        return (f"FrenetRoad(theta0={self.theta0!r}, ds={self.ds!r}, segment_counts={self.segment_counts.tolist()!r}, "
+                f"section_kappas={self.section_kappas.tolist()!r}, lane_width={self.lane_width!r}, "
+                f"reframe_origin={self.reframe_origin!r}, is_in_map={self.is_in_map!r}, "
+                f"is_reframable={self.is_reframable!r})")
+
+
+def frenet_roads(theta0s, ds, segment_counts, section_kappas, lane_width, reframe_origins, is_in_map, is_reframable):
+    """Creates a FrenetRoad for every road of a batch, e.g. from the
+    parameters of frenet_to_cartesian_roads and the results of reframe_roads."""
+    return [FrenetRoad(theta0, ds, counts, kappas, lane_width, tuple(origin) if reframable else None,
+                       in_map, reframable)
+            for (theta0, counts, kappas, origin, in_map, reframable)
+            in zip(np.asarray(theta0s).tolist(), segment_counts, section_kappas, np.asarray(reframe_origins).tolist(),
+                   is_in_map, is_reframable)]
+
+
+def cache_road_points(roads, points, point_counts):
+    """Puts the points of FrenetRoads of a batch, already computed in the
+    format of frenet_to_cartesian_roads and reframed by reframe_roads, into
+    the points cache so that they are not computed again."""
+    dtype = np.dtype(np.float64)
+    for (road, road_points, point_count) in zip(roads, points, np.asarray(point_counts).tolist()):
+        road_points = road_points[:point_count].astype(dtype, copy=True)
+        road_points.flags.writeable = False
+        points_cache.put((road, dtype.str), road_points)
+
+
+def road_points_array(road, dtype=np.float64):
+    """Returns the points of a FrenetRoad, or of a road of the form
+    (road_points, is_in_map, is_reframable), as an array of shape (point count, 2)."""
+    if isinstance(road, FrenetRoad):
+        return road.points(dtype)
+    return np.asarray(road[0], dtype=dtype).reshape(-1, 2)
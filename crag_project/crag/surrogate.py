@@ -0,0 +1,178 @@
+"""
+This module provides surrogate models that predict the fitness of a road
+from a few features of its Frenet parameters (length, total and net
+turning, peak curvature, and sign changes of curvature), so that roads
+predicted to be poor can be skipped instead of being sent to the
+evaluator. Models are trained online on the fitness values of evaluated
+roads and keep at most max_sample_count of the most recent samples.
+"""
+
+from abc import ABC, abstractmethod
+import json
+import numpy as np
+from . import roadrecord
+
+# Second element of the evaluation of a road skipped by the surrogate, after its predicted fitness
+SKIPPED = "SKIPPED"
+
+FEATURE_NAMES = ["length", "total_turning", "net_turning", "peak_curvature", "peak_section_turning",
+                 "sign_changes", "is_in_map"]
+
+
+def is_skipped(evaluation):
+    return len(evaluation) > 1 and isinstance(evaluation[1], str) and evaluation[1] == SKIPPED
+
+
+def road_features(roads):
+    """Returns an array with a row of features for every road, and a mask
+    of the roads that have features (only FrenetRoads do)."""
+    features = np.zeros((len(roads), len(FEATURE_NAMES)))
+    has_features = np.array([isinstance(road, roadrecord.FrenetRoad) for road in roads], dtype=bool)
+    frenet_roads = [road for (road, has) in zip(roads, has_features) if has]
+    if not frenet_roads:
+        return (features, has_features)
+    section_count = max(len(road.segment_counts) for road in frenet_roads)
+    counts = np.zeros((len(frenet_roads), section_count))
+    kappas = np.zeros((len(frenet_roads), section_count))
+    for (i, road) in enumerate(frenet_roads):
+        counts[i, :len(road.segment_counts)] = road.segment_counts
+        kappas[i, :len(road.section_kappas)] = road.section_kappas
+    ds = np.array([road.ds for road in frenet_roads])
+    section_turnings = kappas * counts * ds[:, None]
+    # Signs of kappas of sections with segments, compared with the previous nonzero sign
+    signs = np.where(counts > 0, np.sign(kappas), 0)
+    sign_changes = np.zeros(len(frenet_roads))
+    previous_signs = np.zeros(len(frenet_roads))
+    for j in range(section_count):
+        is_signed = signs[:, j] != 0
+        sign_changes += is_signed & (previous_signs != 0) & (signs[:, j] != previous_signs)
+        previous_signs = np.where(is_signed, signs[:, j], previous_signs)
+    features[has_features] = np.column_stack([
+        counts.sum(axis=1) * ds,
+        np.abs(section_turnings).sum(axis=1),
+        np.abs(section_turnings.sum(axis=1)),
+        np.where(counts > 0, np.abs(kappas), 0).max(axis=1),
+        np.abs(section_turnings).max(axis=1),
+        sign_changes,
+        [road.is_in_map for road in frenet_roads],
+    ])
+    return (features, has_features)
+
+
+class SampleBuffer:
+    """Ring buffer of the most recent (features, fitness) samples."""
+
+    def __init__(self, feature_count, max_sample_count):
+        self.features = np.zeros((max_sample_count, feature_count))
+        self.fitness_values = np.zeros(max_sample_count)
+        self.sample_count = 0
+        self.next_index = 0
+
+    def add(self, features, fitness):
+        self.features[self.next_index] = features
+        self.fitness_values[self.next_index] = fitness
+        self.next_index = (self.next_index + 1) % len(self.fitness_values)
+        self.sample_count = min(self.sample_count + 1, len(self.fitness_values))
+
+    def samples(self):
+        return (self.features[:self.sample_count], self.fitness_values[:self.sample_count])
+
+
+class Surrogate(ABC):
+    """Abstract base class of the surrogate models. Features are standardized with
+    the mean and standard deviation of the samples."""
+
+    def __init__(self, max_sample_count=4096):
+        self.buffer = SampleBuffer(len(FEATURE_NAMES), max_sample_count)
+        self.fitted = False
+
+    @property
+    def sample_count(self):
+        return self.buffer.sample_count
+
+    def update(self, features, fitness):
+        """Adds the features and fitness of an evaluated road. Non-finite
+        fitness values are ignored."""
+        if np.isfinite(fitness):
+            self.buffer.add(features, fitness)
+            self.fitted = False
+
+    def fitness_quantile(self, quantile):
+        return float(np.quantile(self.buffer.samples()[1], quantile))
+
+    def standardize(self, features):
+        (sample_features, _) = self.buffer.samples()
+        mean = sample_features.mean(axis=0)
+        std = sample_features.std(axis=0)
+        return (features - mean) / np.where(std > 0, std, 1.0)
+
+    @abstractmethod
+    def predict(self, features):
+        """Returns the predicted fitness of every row of features."""
+        pass
+
+
+class KNNSurrogate(Surrogate):
+    """Predicts the average fitness of the neighbor_count nearest samples.
+    Squared distances are computed as |a|^2 + |b|^2 - 2 a.b with a matrix
+    product, for chunks of roads so that at most max_chunk_elements
+    distances are kept at once."""
+
+    def __init__(self, neighbor_count=5, max_sample_count=4096):
+        super().__init__(max_sample_count)
+        self.neighbor_count = neighbor_count
+
+    def predict(self, features, max_chunk_elements=1 << 20):
+        (sample_features, fitness_values) = self.buffer.samples()
+        standardized_samples = self.standardize(sample_features)
+        standardized_features = self.standardize(np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURE_NAMES)))
+        sample_norms = (standardized_samples ** 2).sum(axis=1)
+        k = min(self.neighbor_count, len(fitness_values))
+        predicted_fitness_values = np.zeros(len(standardized_features))
+        chunk_size = max(1, max_chunk_elements // max(1, len(fitness_values)))
+        for begin in range(0, len(standardized_features), chunk_size):
+            chunk = standardized_features[begin:begin + chunk_size]
+            distances = (chunk ** 2).sum(axis=1)[:, None] + sample_norms[None, :] - 2 * chunk @ standardized_samples.T
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            predicted_fitness_values[begin:begin + len(chunk)] = fitness_values[nearest].mean(axis=1)
+        return predicted_fitness_values
+
+
+class RidgeSurrogate(Surrogate):
+    """Predicts the fitness by ridge regression on the standardized features,
+    refitted lazily after updates."""
+
+    def __init__(self, alpha=1.0, max_sample_count=4096):
+        super().__init__(max_sample_count)
+        self.alpha = alpha
+        self.coefficients = None
+
+    def fit(self):
+        (sample_features, fitness_values) = self.buffer.samples()
+        x = np.column_stack([self.standardize(sample_features), np.ones(len(fitness_values))])
+        regularization = self.alpha * np.eye(x.shape[1])
+        regularization[-1, -1] = 0.0 # Intercept is not regularized
+        self.coefficients = np.linalg.solve(x.T @ x + regularization, x.T @ fitness_values)
+        self.fitted = True
+
+    def predict(self, features):
+        if not self.fitted:
+            self.fit()
+        standardized_features = self.standardize(np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURE_NAMES)))
+        return standardized_features @ self.coefficients[:-1] + self.coefficients[-1]
+
+
+def create_surrogate(model, neighbor_count=5, max_sample_count=4096):
+    """Creates the surrogate model named "knn" or "ridge"."""
+    if model == "knn":
+        return KNNSurrogate(neighbor_count, max_sample_count)
+    elif model == "ridge":
+        return RidgeSurrogate(max_sample_count=max_sample_count)
+    raise ValueError(f"Unknown surrogate model: {model}")
+
+
+def write_skipped_road(f, strength, test, road, predicted_fitness):
+    """Writes a skipped road and its predicted fitness as a line of JSON."""
+    f.write(json.dumps({"strength": strength, "test": np.asarray(test).tolist(), "road": tuple(road),
+                        "predicted_fitness": predicted_fitness}) + "\n")
+    f.flush()
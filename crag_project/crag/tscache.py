@@ -0,0 +1,132 @@
+"""
+This module provides CachedTestSuiteGenerator that wraps any TestSuiteGenerator
+and keeps the test suites it generates in a directory on disk. A test suite
+is identified by the model, the strength, the backend identity, and the
+seed test suite, so later calls (also from later runs) with the same
+arguments are served from the disk instead of calling the backend.
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from . import tsgenerator as tsgen
+from . import utils
+
+
+def hash_test_suite(test_suite):
+    """Returns a hexadecimal digest of the tests in a test suite."""
+    if test_suite is None:
+        return "none"
+    array = np.ascontiguousarray(np.asarray(test_suite, dtype=np.int64))
+    digest = hashlib.sha256(str(array.shape).encode())
+    digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+"""This class extends TestSuiteGenerator with a persistent cache around another backend."""
+class CachedTestSuiteGenerator(tsgen.TestSuiteGenerator):
+    def __init__(self, test_suite_generator, cache_dirpath, max_cache_bytes=100 * 1024 * 1024):
+        super().__init__()
+        self.test_suite_generator = test_suite_generator
+        self.cache_dirpath = cache_dirpath
+        self.max_cache_bytes = max_cache_bytes
+        self.supports_concurrent_calls = test_suite_generator.supports_concurrent_calls
+        self.hit_count = 0
+        self.miss_count = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dirpath, exist_ok=True)
+
+    def set_model(self, road_section_count, param_value_count):
+        """Sets the model of this generator and of the wrapped backend."""
+        super().set_model(road_section_count, param_value_count)
+        self.test_suite_generator.set_model(road_section_count, param_value_count)
+
+    def get_backend_identity(self):
+        return self.test_suite_generator.get_backend_identity()
+
+    def get_cache_key(self, strength, seed_test_suite=None):
+        """Content address of a test suite generated with given arguments."""
+        digest = hashlib.sha256()
+        for part in [self.model_string, str(strength), self.get_backend_identity(), hash_test_suite(seed_test_suite)]:
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get_cache_filepath(self, key):
+        return os.path.join(self.cache_dirpath, f"{key}.npy")
+
+    def load(self, key):
+        """Returns the cached test suite for key or None. The modification
+        time of a cache file records its last use for LRU eviction."""
+        filepath = self.get_cache_filepath(key)
+        try:
+            test_suite = np.load(filepath)
+            os.utime(filepath)
+        except (OSError, ValueError):
+            return None
+        return test_suite
+
+    def store(self, key, test_suite):
+        """Writes a test suite into the cache atomically and evicts the least
+        recently used test suites when the cache exceeds max_cache_bytes."""
+        test_suite = tsgen.to_test_suite_array(test_suite, 2 * self.road_section_count)
+        utils.write_atomically(self.get_cache_filepath(key), lambda f: np.save(f, test_suite))
+        with self.lock:
+            self.evict()
+        return test_suite
+
+    def evict(self):
+        entries = []
+        for filename in os.listdir(self.cache_dirpath):
+            if filename.endswith(".npy"):
+                filepath = os.path.join(self.cache_dirpath, filename)
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, filepath))
+        total_bytes = sum(size for (_, size, _) in entries)
+        # Most recently used entry is kept even if it alone exceeds the limit
+        for (_, size, filepath) in sorted(entries)[:-1]:
+            if total_bytes <= self.max_cache_bytes:
+                break
+            try:
+                os.remove(filepath)
+            except OSError:
+                pass
+            total_bytes -= size
+
+    def cached_call(self, strength, seed_test_suite=None):
+        key = self.get_cache_key(strength, seed_test_suite)
+        test_suite = self.load(key)
+        if test_suite is not None:
+            self.hit_count += 1
+            return test_suite
+        self.miss_count += 1
+        if seed_test_suite is None:
+            test_suite = self.test_suite_generator.call(strength)
+        else:
+            test_suite = self.test_suite_generator.call_with_seed(strength, seed_test_suite)
+        return self.store(key, test_suite)
+
+    def call_with_seed(self, strength, seed_test_suite):
+        """Returns the cached test suite or calls the wrapped backend."""
+        return self.cached_call(strength, seed_test_suite)
+
+    def call(self, strength):
+        """Returns the cached test suite or calls the wrapped backend."""
+        return self.cached_call(strength)
+
+    def precompute(self, strengths):
+        """Generates the unseeded test suites of all given strengths once
+        and stores them in the cache. Backends supporting concurrent calls
+        are called concurrently for the different strengths."""
+        strengths = [strength for strength in strengths if self.load(self.get_cache_key(strength)) is None]
+        if self.supports_concurrent_calls and len(strengths) > 1:
+            with ThreadPoolExecutor(max_workers=len(strengths)) as executor:
+                list(executor.map(self.cached_call, strengths))
+        else:
+            for strength in strengths:
+                self.cached_call(strength)
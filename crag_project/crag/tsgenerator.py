@@ -2,11 +2,57 @@
 that characterizes the use of backend tools. It is extended
 to accomodate specific needs of individual backends."""
 
+import contextlib
+import random
+import threading
 from abc import abstractmethod
+import numpy as np
 from . import utils
 
+# Tests are rows of Length and Kappa indices in small-integer matrices
+TEST_DTYPE = np.int16
+
+
+# Random generators of backends in the current thread, set by seeded_random
+thread_random = threading.local()
+
+
+def numpy_random():
+    """Returns np.random, or the RandomState set by seeded_random in this thread.
+    Backends draw their numpy random numbers from it."""
+    return getattr(thread_random, "numpy_random", np.random)
+
+
+def python_random():
+    """Returns the random module, or the Random set by seeded_random in this
+    thread. Backends draw their Python random numbers from it."""
+    return getattr(thread_random, "python_random", random)
+
+
+@contextlib.contextmanager
+def seeded_random(seed):
+    """Makes backends called in this thread draw random numbers from new
+    generators seeded with seed instead of the global ones, so that a call
+    in a background thread neither depends on nor changes the global state."""
+    thread_random.numpy_random = np.random.RandomState(seed)
+    thread_random.python_random = random.Random(seed)
+    try:
+        yield
+    finally:
+        del thread_random.numpy_random
+        del thread_random.python_random
+
+
+def to_test_suite_array(test_suite, parameter_count):
+    """Converts a test suite (e.g. a list of lists of ints) into a matrix
+    of shape (test count, parameter_count) with TEST_DTYPE entries."""
+    return np.asarray(test_suite, dtype=TEST_DTYPE).reshape(-1, parameter_count)
+
 
 class TestSuiteGenerator:
+    # Whether unseeded calls with different strengths can run concurrently
+    supports_concurrent_calls = False
+
     def __init__(self):
         # default values that can be changed with set_model
         self.road_section_count = None
@@ -43,6 +89,18 @@ class TestSuiteGenerator:
         lines = [first_line] + [separator.join([str(v) for v in test]) for test in seed_test_suite]
         return "\n".join(lines)
 
+    def get_backend_identity(self):
+        """Returns a string identifying the backend tool and its configuration.
+        Test suites generated by backends with different identities are
+        considered different (e.g. by CachedTestSuiteGenerator)."""
+        return f"{type(self).__module__}.{type(self).__name__}"
+
+    def precompute(self, strengths):
+        """Prepares unseeded test suites of given strengths in advance.
+        Backends generate test suites on demand by default, so nothing is
+        done here. See CachedTestSuiteGenerator for a backend that uses it."""
+        pass
+
     @abstractmethod
     def call_with_seed(self, strength, seed_test_suite):
         pass
@@ -53,9 +111,10 @@ class TestSuiteGenerator:
 
     def generate_test_suite(self, strength, seed_test_suite = None):
         """Given strength and potentially a seed test suite, generate
-        a new test suite by calling a backend tool."""
+        a new test suite by calling a backend tool. The test suite is
+        returned as a matrix with a row for every test."""
         if seed_test_suite is not None and len(seed_test_suite) == 0:
             seed_test_suite = None
 
         test_suite = self.call(strength) if seed_test_suite is None else self.call_with_seed(strength, seed_test_suite)
-        return test_suite
+        return to_test_suite_array(test_suite, 2 * self.road_section_count)
@@ -1,6 +1,9 @@
+import math
 import os.path
 import random as ra
 import subprocess
+import tempfile
+import numpy as np
 
 
 def has_m_match(array, other_arrays, m):
@@ -16,6 +19,27 @@ def has_m_match(array, other_arrays, m):
     return False
 
 
+def m_match_mask(test_suite, seed_test_suite, m, max_chunk_elements=1 << 24):
+    """Array version of has_m_match. Returns a boolean array telling for
+    every test of test_suite whether it has at least m same elements with
+    any one of the tests of seed_test_suite. Matches are counted with a
+    broadcast comparison against chunks of seeds, so that at most
+    max_chunk_elements elements are compared at once. Tests that already
+    have a match are not compared with later chunks."""
+    test_suite = np.asarray(test_suite)
+    seed_test_suite = np.asarray(seed_test_suite, dtype=test_suite.dtype).reshape(-1, test_suite.shape[1])
+    mask = np.zeros(len(test_suite), dtype=bool)
+    chunk_size = max(1, max_chunk_elements // max(1, test_suite.size))
+    for begin in range(0, len(seed_test_suite), chunk_size):
+        unmatched = np.flatnonzero(~mask)
+        if len(unmatched) == 0:
+            break
+        seeds = seed_test_suite[begin:begin + chunk_size]
+        match_counts = (test_suite[unmatched, None, :] == seeds[None, :, :]).sum(axis=2)
+        mask[unmatched] = (match_counts >= m).any(axis=1)
+    return mask
+
+
 def get_fullpath(filename):
     """Given a filename with a local path, this method returns
     the global filepath of the file."""
@@ -23,6 +47,23 @@ def get_fullpath(filename):
     return os.path.join(dirname, filename)
 
 
+def write_atomically(filepath, write, mode="wb"):
+    """Calls write with a temporary file opened with mode next to filepath,
+    and replaces filepath with it once it is on disk, so that readers never
+    see a partial file. The temporary file is removed if write fails."""
+    dirpath = os.path.dirname(os.path.abspath(filepath))
+    with tempfile.NamedTemporaryFile(mode, dir=dirpath, suffix=".tmp", delete=False) as f:
+        try:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    os.replace(f.name, filepath)
+
+
 def call_command(command):
     """Calls a given shell command and returns the output string."""
     return subprocess.getoutput(command).strip()
@@ -46,6 +87,16 @@ def divide_and_sample(min_value, max_value, n, i):
     return min_value + ra.uniform(i * size, (i + 1) * size)
 
 
+def divide_and_sample_array(min_value, max_value, n, indices):
+    """Array version of divide_and_sample. For every entry i of indices,
+    a uniformly distributed random number is sampled from the ith
+    subinterval of [min_value, max_value) divided into n subintervals.
+    All samples are drawn at once and returned with the shape of indices."""
+    size = (max_value - min_value) / n
+    indices = np.asarray(indices)
+    return min_value + np.random.uniform(indices * size, (indices + 1) * size)
+
+
 def update_average(average_dict, key_list, new_value):
     """This method provides a mechanism to aggregate fitness values
     (by averaging) for multiple roads generated with the same configuration."""
@@ -80,7 +131,7 @@ def update_maximum(maximum_dict, key_list, new_value):
     key_tuple = tuple(key_list)
     if key_tuple in maximum_dict:
         old_maximum, n = maximum_dict[key_tuple]
-        new_maximum = min([old_maximum, new_value])
+        new_maximum = max([old_maximum, new_value])
         maximum_dict[key_tuple] = (new_maximum, n + 1)
         return new_maximum
     else:
@@ -95,3 +146,8 @@ def take_best(lst, fun, best_size):
     Then the top best_size of the sorted list is returned."""
     size = len(lst)
     return [lst[j] for j in sorted(list(range(size)), key=fun)[:best_size]]
+
+
+def fitness_key(fitness):
+    """Sort key of fitness values, with non-finite values last."""
+    return fitness if math.isfinite(fitness) else math.inf
@@ -0,0 +1,137 @@
+"""
+This module provides the message formats of CRAG cli. In the JSON format
+roads and evaluations are JSON strings on separate lines. In the binary
+formats each road is sent as a length-prefixed frame
+
+    uint32 length of the rest of the frame
+    uint64 road id
+    uint8  flags (bit 0: is_in_map, bit 1: is_reframable)
+    float32 or float64 x, y pairs of road points
+
+and each evaluation is returned as a fixed-size reply
+
+    uint64 road id
+    float64 fitness
+    uint8  flags (bit 0: EXIT, bit 1: request)
+
+A reply with the request flag asks for its road id number of roads in
+flight instead of carrying an evaluation. All values are little-endian.
+"""
+
+import json
+import struct
+import numpy as np
+from . import roadrecord
+
+FRAME_LENGTH = struct.Struct("<I")
+FRAME_HEADER = struct.Struct("<QB")
+REPLY = struct.Struct("<QdB")
+
+IS_IN_MAP = 1
+IS_REFRAMABLE = 2
+EXIT = 1
+REQUEST = 2
+
+POINT_DTYPES = {"float32": np.dtype("<f4"), "float64": np.dtype("<f8")}
+
+
+def read_exactly(stream, size):
+    """Reads size bytes from a binary stream, with as many reads as needed
+    (raw streams may return fewer bytes than asked for). Returns None at the
+    end of the stream."""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def write_road_frame(stream, road_id, road, dtype):
+    (is_in_map, is_reframable) = (road[1], road[2])
+    points = roadrecord.road_points_array(road, dtype).tobytes()
+    flags = (IS_IN_MAP if is_in_map else 0) | (IS_REFRAMABLE if is_reframable else 0)
+    stream.write(FRAME_LENGTH.pack(FRAME_HEADER.size + len(points)))
+    stream.write(FRAME_HEADER.pack(road_id, flags))
+    stream.write(points)
+
+
+def read_road_frame(stream, dtype):
+    """Reads a road frame and returns (road_id, points, is_in_map, is_reframable),
+    where points is an array of shape (point count, 2) viewing the frame
+    bytes without copying. Returns None at the end of the stream."""
+    length = read_exactly(stream, FRAME_LENGTH.size)
+    if length is None:
+        return None
+    frame = read_exactly(stream, FRAME_LENGTH.unpack(length)[0])
+    if frame is None:
+        return None
+    (road_id, flags) = FRAME_HEADER.unpack_from(frame)
+    points = np.frombuffer(frame, dtype=dtype, offset=FRAME_HEADER.size).reshape(-1, 2)
+    return (road_id, points, bool(flags & IS_IN_MAP), bool(flags & IS_REFRAMABLE))
+
+
+def write_reply(stream, road_id, fitness, is_exit=False):
+    stream.write(REPLY.pack(road_id, fitness, EXIT if is_exit else 0))
+
+
+def write_request(stream, max_roads_in_flight):
+    stream.write(REPLY.pack(max_roads_in_flight, 0.0, REQUEST))
+
+
+def read_reply(stream):
+    """Reads a reply and returns (road_id, fitness, flags). Returns None at the end of the stream."""
+    reply = read_exactly(stream, REPLY.size)
+    if reply is None:
+        return None
+    return REPLY.unpack(reply)
+
+
+class JSONChannel:
+    """Exchanges roads and evaluations as JSON lines. With ids, roads are sent as
+    {"id": ..., "road": ...} and evaluations received as {"id": ..., "evaluation": [...]};
+    otherwise roads and evaluations are sent and received as they are."""
+
+    def __init__(self, input_stream, output_stream, with_ids):
+        self.input_stream = input_stream
+        self.output_stream = output_stream
+        self.with_ids = with_ids
+
+    def send_road(self, road_id, road):
+        road = tuple(road) # FrenetRoads are sent with their points
+        message = {"id": road_id, "road": road} if self.with_ids else road
+        print(json.dumps(message), file=self.output_stream, flush=True)
+
+    def receive(self):
+        """Returns the next message as a dictionary, or None at the end of input."""
+        line = self.input_stream.readline()
+        if not line.strip():
+            return None
+        message = json.loads(line)
+        return message if self.with_ids else {"evaluation": message}
+
+
+class BinaryChannel:
+    """Exchanges roads and evaluations in binary frames and replies."""
+
+    def __init__(self, input_stream, output_stream, dtype):
+        self.input_stream = input_stream
+        self.output_stream = output_stream
+        self.dtype = dtype
+
+    def send_road(self, road_id, road):
+        write_road_frame(self.output_stream, road_id, road, self.dtype)
+        self.output_stream.flush()
+
+    def receive(self):
+        """Returns the next message as a dictionary, or None at the end of input."""
+        reply = read_reply(self.input_stream)
+        if reply is None:
+            return None
+        (road_id, fitness, flags) = reply
+        if flags & REQUEST:
+            return {"request": road_id}
+        return {"id": road_id, "evaluation": [fitness, "EXIT"] if flags & EXIT else [fitness]}
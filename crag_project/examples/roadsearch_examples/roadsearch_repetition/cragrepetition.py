@@ -9,35 +9,6 @@ from crag.crag import CRAG
 from crag.pict import PictTestSuiteGenerator
 import crag.roadgeometry as rg
 
-import roadevolutionstrategy
-
-
-class CRAG1P1(CRAG):
-    def __init__(self):
-        super().__init__(core_params, geometry_params, test_suite_generator,
-                         road_evaluate_function, budget_availability_function)
-        self.road_evaluate_function = road_evaluate_function
-        self.global_evaluation_dict = {}
-        def test_and_road_evaluate_function((test, road)):
-            return self.global_evaluation_dict[tuple(test)]
-        self.evaluate_function = test_and_road_evaluate_function
-
-    def search_roads(self, test_suite):
-        roads = []
-        for test in test_suite:
-            lengths_indices = test[:self.road_section_count]
-            kappas_indices = test[self.road_section_count:]
-
-            length_min = [self.min_segment_count * self.ds + i * self.ds * (self.max_segment_count - self.min_segment_count) / self.param_value_count for i in range(self.road_section_count)]
-            kappa_min = [-self.global_curvature_bound + i * 2 * self.global_curvature_bound / self.param_value_count for i in range(self.road_section_count)]
-            length_max = [self.min_segment_count * self.ds + (i + 1) * self.ds * (self.max_segment_count - self.min_segment_count) / self.param_value_count for i in range(self.road_section_count)]
-            kappa_max = [-self.global_curvature_bound + (i + 1) * 2 * self.global_curvature_bound / self.param_value_count for i in range(self.road_section_count)]
-
-            best_road, best_evaluation = roadevolutionstrategy.get_best_road_and_evaluation(self.road_section_count, length_min, length_max, kappa_min, kappa_max, self.ds, self.lane_width, self.map_size, self.evaluate_function)
-            self.global_evaluation_dict[tuple(test)] = best_evaluation
-            roads.append((test, best_road))
-        return roads
-
 
 def get_arg(args, arg_name, convert_func, default):
     value = default
@@ -90,6 +61,9 @@ class CRAGExample:
         core_params["resample"] = True
         core_params["fitness_aggregation_method"] = "average"
         core_params["max_strength"] = get_arg(args, "--max_strength", int, 4)  # We stop increasing n in n-wise combinations when we reach n=MAX_STRENGTH
+        core_params["search_strategy"] = "repetition" # Evaluate 5 roads per road configuration and keep the best one
+        core_params["repetition_count"] = 5
+        core_params["repetition_workers"] = 1 # The executor of the competition runs one test at a time
 
         geometry_params = {}
         geometry_params["road_section_count"] = get_arg(args, "--road_param_count", int, 8) // 2 # 4 Road Piece Length values + 4 Kappa values
@@ -0,0 +1,235 @@
+"""Batched version of carlapidonbicycle.execute_carla_pid_on_bicycle. K
+vehicles drive on K roads in lockstep and the states of the vehicles, the
+PID error buffers and the waypoint indices are kept in NumPy arrays, so
+that one simulation step costs a few array operations for all vehicles.
+A vehicle stops when it reaches the last waypoint of its road, and the
+others continue without it.
+
+Running this file compares the batched simulator with the sequential one
+on random roads."""
+
+import numpy as np
+
+import carlapidonbicycle
+
+ERROR_BUFFER_LENGTH = 10 # maxlen of the error buffers of the PID controllers
+MAX_THROTTLE = 0.75
+MAX_BRAKE = 0.3
+MAX_STEERING = 0.8
+MAX_STEERING_CHANGE = 0.1
+
+
+def pinegpi(values):
+    """Array version of vehicle.pinegpi."""
+    values = values % (2 * np.pi)
+    return np.where(values > np.pi, values - 2 * np.pi, values)
+
+
+def pid_control(buffers, buffer_counts, errors, gains, dt):
+    """Appends errors to the error buffers (rows of buffers, oldest first)
+    and returns the PID outputs as in the controller module."""
+    buffers[:, :-1] = buffers[:, 1:]
+    buffers[:, -1] = errors
+    buffer_counts += 1
+    has_history = buffer_counts >= 2
+    de = np.where(has_history, (buffers[:, -1] - buffers[:, -2]) / dt, 0.0)
+    ie = np.where(has_history, buffers.sum(axis=1) * dt, 0.0)
+    return np.clip(gains["K_P"] * errors + gains["K_D"] * de + gains["K_I"] * ie, -1.0, 1.0)
+
+
+def execute_pid_on_bicycles(
+    roads_xs,
+    roads_ys,
+    desired_speed=20,
+    dt=0.1,
+    pid_gains_lat={"K_P": 0.5, "K_D": 0.01, "K_I": 0.01},
+    pid_gains_long={"K_P": 2, "K_D": 0.01, "K_I": 0.01},
+    max_steps=10000,
+):
+    """Simulates a vehicle on every road given by its x and y coordinates
+    and returns a list with the data of every vehicle, in the format of
+    Vehicle.data. A vehicle that has not reached the end of its road after
+    max_steps steps is stopped, and its data has "completed" False."""
+    road_count = len(roads_xs)
+    waypoint_counts = np.array([len(xs) for xs in roads_xs], dtype=int)
+    waypoints = np.zeros((road_count, waypoint_counts.max(initial=2), 2))
+    for (i, (xs, ys)) in enumerate(zip(roads_xs, roads_ys)):
+        waypoints[i, :len(xs), 0] = xs
+        waypoints[i, :len(ys), 1] = ys
+
+    px = waypoints[:, 0, 0].copy()
+    py = waypoints[:, 0, 1].copy()
+    psi = np.arctan2(waypoints[:, 1, 1] - waypoints[:, 0, 1], waypoints[:, 1, 0] - waypoints[:, 0, 0])
+    forward_x = np.cos(psi)
+    forward_y = np.sin(psi)
+    v = np.zeros(road_count)
+    past_steering = np.zeros(road_count)
+    long_buffers = np.zeros((road_count, ERROR_BUFFER_LENGTH))
+    lat_buffers = np.zeros((road_count, ERROR_BUFFER_LENGTH))
+    long_buffer_counts = np.zeros(road_count, dtype=int)
+    lat_buffer_counts = np.zeros(road_count, dtype=int)
+    waypoint_indices = np.zeros(road_count, dtype=int)
+    is_active = np.ones(road_count, dtype=bool)
+    reach_distance = desired_speed * dt
+
+    # Recorded states, one array over the vehicles active in a step per step
+    step_vehicles = []
+    records = {key: [] for key in ["pxs", "pys", "psis", "vs", "accels", "steers", "throttles", "brakes"]}
+    step = 0
+    while step < max_steps:
+        # Waypoints within reach are passed without a step, possibly several at once
+        active = np.flatnonzero(is_active)
+        while len(active) > 0:
+            targets = waypoints[active, waypoint_indices[active]]
+            distances = np.sqrt((targets[:, 0] - px[active]) ** 2 + (targets[:, 1] - py[active]) ** 2)
+            reached = active[distances <= reach_distance]
+            if len(reached) == 0:
+                break
+            waypoint_indices[reached] += 1
+            is_active[reached[waypoint_indices[reached] == waypoint_counts[reached]]] = False
+            active = reached[is_active[reached]]
+        active = np.flatnonzero(is_active)
+        if len(active) == 0:
+            break
+
+        # Longitudinal control
+        long_buffers_active = long_buffers[active]
+        long_counts_active = long_buffer_counts[active]
+        accelerations = pid_control(long_buffers_active, long_counts_active, desired_speed - v[active],
+                                    pid_gains_long, dt)
+        long_buffers[active] = long_buffers_active
+        long_buffer_counts[active] = long_counts_active
+
+        # Lateral control: signed angle between the heading and the direction to the waypoint
+        targets = waypoints[active, waypoint_indices[active]]
+        wx = targets[:, 0] - px[active]
+        wy = targets[:, 1] - py[active]
+        vx = forward_x[active]
+        vy = forward_y[active]
+        norms = np.sqrt(wx * wx + wy * wy) * np.sqrt(vx * vx + vy * vy)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            angles = np.where(norms == 0, 1.0, np.arccos(np.clip((wx * vx + wy * vy) / norms, -1.0, 1.0)))
+        angles = np.where(vx * wy - vy * wx < 0, -angles, angles)
+        lat_buffers_active = lat_buffers[active]
+        lat_counts_active = lat_buffer_counts[active]
+        steerings = pid_control(lat_buffers_active, lat_counts_active, angles, pid_gains_lat, dt)
+        lat_buffers[active] = lat_buffers_active
+        lat_buffer_counts[active] = lat_counts_active
+
+        # Vehicle controller: throttle/brake limits and steering regulation
+        throttles = np.where(accelerations >= 0.0, np.minimum(accelerations, MAX_THROTTLE), 0.0)
+        brakes = np.where(accelerations >= 0.0, 0.0, np.minimum(np.abs(accelerations), MAX_BRAKE))
+        steerings = np.clip(steerings, past_steering[active] - MAX_STEERING_CHANGE,
+                            past_steering[active] + MAX_STEERING_CHANGE)
+        steerings = np.clip(steerings, -MAX_STEERING, MAX_STEERING)
+        past_steering[active] = steerings
+        accels = np.where(brakes > 0, -brakes, throttles)
+
+        step_vehicles.append(active)
+        for (key, values) in [("pxs", px[active]), ("pys", py[active]), ("psis", psi[active]), ("vs", v[active]),
+                              ("accels", accels), ("steers", steerings), ("throttles", throttles),
+                              ("brakes", brakes)]:
+            records[key].append(values)
+
+        # Bicycle model
+        speeds = v[active]
+        headings = psi[active]
+        px[active] += dt * speeds * np.cos(headings + steerings)
+        py[active] += dt * speeds * np.sin(headings + steerings)
+        psi[active] = pinegpi(headings + dt * speeds * np.sin(steerings))
+        v[active] = speeds + dt * accels
+        forward_x[active] = np.cos(psi[active])
+        forward_y[active] = np.sin(psi[active])
+        step += 1
+
+    return vehicles_data(road_count, step_vehicles, records, is_active, dt)
+
+
+def vehicles_data(road_count, step_vehicles, records, is_active, dt):
+    """Splits the records of all steps by vehicle and derives the data of
+    Vehicle.data for every vehicle."""
+    vehicles = np.concatenate(step_vehicles) if step_vehicles else np.zeros(0, dtype=int)
+    steps = np.repeat(np.arange(len(step_vehicles)), [len(active) for active in step_vehicles])
+    order = np.lexsort((steps, vehicles))
+    bounds = np.searchsorted(vehicles[order], np.arange(road_count + 1))
+    flat_records = {key: (np.concatenate(values) if values else np.zeros(0))[order] for (key, values) in records.items()}
+    data = []
+    for i in range(road_count):
+        vehicle_records = {key: values[bounds[i]:bounds[i + 1]] for (key, values) in flat_records.items()}
+        data.append(vehicle_data(vehicle_records, dt, completed=not is_active[i]))
+    return data
+
+
+def vehicle_data(records, dt, completed=True):
+    """Array version of Vehicle.data for the records of a vehicle."""
+    # Time is accumulated step by step as in Vehicle.iterate
+    ts = np.cumsum(np.concatenate([[0.0], np.full(max(len(records["accels"]) - 1, 0), dt)]))[:len(records["accels"])]
+    accels = records["accels"]
+    jerks = (accels[1:] - accels[:-1]) / dt
+    jerks_sq = jerks * jerks
+    heading = records["psis"]
+    heading_diffs = pinegpi(heading[1:] - heading[:-1])
+    lat_accels = np.cos(heading_diffs) * accels[1:]
+    lat_jerks = (lat_accels[1:] - lat_accels[:-1]) / dt
+    lat_jerks_sq = lat_jerks * lat_jerks
+    return {
+        "ts": ts,
+        "short_ts": ts[:-1],
+        "short_short_ts": ts[:-2],
+        "pxs": records["pxs"],
+        "pys": records["pys"],
+        "speed": records["vs"],
+        "acceleration": accels,
+        "jerk": jerks,
+        "jerk_squared": jerks_sq,
+        "cost": dt * np.cumsum(jerks_sq),
+        "lat_acceleration": lat_accels,
+        "lat_jerk": lat_jerks,
+        "lat_jerk_squared": lat_jerks_sq,
+        "lat_cost": dt * np.cumsum(lat_jerks_sq),
+        "heading": heading,
+        "heading_diffs": heading_diffs,
+        "steering_control": records["steers"],
+        "throttle_control": records["throttles"],
+        "brake_control": records["throttles"], # As in Vehicle.data
+        "completed": completed,
+    }
+
+
+def random_road(rng, segment_count=100, ds=1.5, max_kappa=0.05):
+    """Random road made of constant-length segments with random curvatures."""
+    kappas = np.repeat(rng.uniform(-max_kappa, max_kappa, 5), segment_count // 5)
+    thetas = np.cumsum(np.concatenate([[rng.uniform(0, 2 * np.pi)], kappas * ds]))
+    xs = 100 + np.cumsum(np.concatenate([[0], ds * np.cos(thetas)]))
+    ys = 100 + np.cumsum(np.concatenate([[0], ds * np.sin(thetas)]))
+    return (xs, ys)
+
+
+def main():
+    import time
+    rng = np.random.default_rng(0)
+    roads = [random_road(rng) for _ in range(64)]
+
+    start = time.perf_counter()
+    sequential_data = [carlapidonbicycle.execute_carla_pid_on_bicycle(xs, ys) for (xs, ys) in roads]
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_data = execute_pid_on_bicycles([xs for (xs, _) in roads], [ys for (_, ys) in roads])
+    batch_time = time.perf_counter() - start
+
+    step_count_differences = sum(len(sequential["jerk"]) != len(batch["jerk"])
+                                 for (sequential, batch) in zip(sequential_data, batch_data))
+    max_difference = max(np.max(np.abs(sequential["jerk"] - batch["jerk"]), initial=0)
+                         for (sequential, batch) in zip(sequential_data, batch_data)
+                         if len(sequential["jerk"]) == len(batch["jerk"]))
+    max_total_jerk_difference = max(abs(np.sum(np.abs(sequential["jerk"])) - np.sum(np.abs(batch["jerk"])))
+                                    for (sequential, batch) in zip(sequential_data, batch_data))
+    print(f"sequential: {sequential_time:.3f} s, batched: {batch_time:.3f} s, "
+          f"speedup: {sequential_time / batch_time:.1f}")
+    print(f"roads with different step counts: {step_count_differences}, maximum jerk difference: {max_difference:.3g}, "
+          f"maximum total jerk difference: {max_total_jerk_difference:.3g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ import numpy as np
 import matplotlib.pyplot as pl
 import os
 import platform
+import sys
+from crag import wire # Binary formats of crag (see --wire-format in crag cli)
 
 def get_os():
     os = platform.system()
@@ -43,14 +45,38 @@ def plot_road(road, special_road=False):
         pl.plot(xs, ys, linewidth=10, color="#AAAAAA")
         pl.plot(xs, ys, linewidth=1, color="#FFFF40")
 
+def read_road(stream, wire_format):
+    """Reads a road from crag. In binary formats, the points are read
+    with numpy.frombuffer directly from the received frame (without copying)."""
+    if wire_format == "json":
+        return 0, np.array(json.loads(stream.readline())[0])
+    (road_id, points, _, _) = wire.read_road_frame(stream, wire.POINT_DTYPES[wire_format])
+    return road_id, points
+
+
+def write_evaluation(stream, wire_format, road_id, fitness, is_exit):
+    """Writes the evaluation of a road to crag."""
+    if wire_format == "json":
+        if is_exit:
+            stream.write(f"[{fitness}, \"EXIT\"]\n".encode())
+        else:
+            stream.write(f"[{fitness}]\n".encode())
+    else:
+        wire.write_reply(stream, road_id, fitness, is_exit)
+    stream.flush()
+
+
 def main():
     pict_executable = get_local_pict_executable()
+    wire_format = sys.argv[1] if len(sys.argv) > 1 else "json"
 
     p = subprocess.Popen(["crag",
                           "--backend",
                           "pict",
                           "--pict-executable-filepath",
-                          get_local_pict_executable()],
+                          get_local_pict_executable(),
+                          "--wire-format",
+                          wire_format],
                          stdin=subprocess.PIPE,
                          stdout=subprocess.PIPE)
 
@@ -59,20 +85,15 @@ def main():
 
     size = 100
     for i in range(size):
-        line = p.stdout.readline()
-        crag_road = json.loads(line)[0]
-        xs = [pos[0] for pos in crag_road]
-        ys = [pos[0] for pos in crag_road]
+        road_id, crag_road = read_road(p.stdout, wire_format)
+        xs = crag_road[:, 0]
+        ys = crag_road[:, 1]
         jerks = carlapidonbicycle.execute_carla_pid_on_bicycle(xs, ys)["jerk"]
         max_jerk = np.sum(np.abs(jerks))
         if max_jerk > max_max_jerk:
             max_max_jerk = max_jerk
             road_with_max_max_jerk = crag_road
-        if i >= size-2:
-            p.stdin.write(f"[{-max_jerk}, \"EXIT\"]\n".encode())
-        else:
-            p.stdin.write(f"[{-max_jerk}]\n".encode())
-        p.stdin.flush()
+        write_evaluation(p.stdin, wire_format, road_id, -max_jerk, i == size-1)
         plot_road(crag_road)
     p.stdin.close()
 
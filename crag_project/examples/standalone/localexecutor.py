@@ -0,0 +1,185 @@
+"""Local stand-in for the test executor of the SBFT CPS tool competition
+(https://github.com/sbft-cps-tool-competition/cps-tool-competition), which
+the library and roadsearch examples use through execute_test and is_over.
+Instead of running BeamNG, a road is driven by the PID-controlled bicycle
+model of carlapidonbicycle, and the distance of the vehicle to the lane
+boundary is recorded at every step. The execution stops as soon as the
+vehicle leaves the lane.
+
+Running this file generates roads with CRAG (IPOG backend) and evaluates
+them with the local executor as in the library example."""
+
+import heapq
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import controller as co
+import util
+import vehicle as ve
+
+# Subset of the fields of the simulation data records of the competition tool
+ExecutionRecord = namedtuple("ExecutionRecord", ["timer", "pos", "vel", "steering", "is_oob", "oob_distance"])
+
+
+class RoadTest:
+    """Stand-in for the road tests of the competition tool."""
+
+    def __init__(self, road_points):
+        self.road_points = [tuple(point[:2]) for point in road_points]
+        self.interpolated_points = self.road_points
+
+
+class RoadTestFactory:
+    """Stand-in for code_pipeline.tests_generation.RoadTestFactory."""
+
+    @staticmethod
+    def create_road_test(road_points):
+        return RoadTest(road_points)
+
+
+def distances_to_polyline(positions, polyline):
+    """Returns the distance of every position (array of shape (P, 2)) to
+    the polyline (array of shape (S + 1, 2)), computed for all positions
+    and segments at once."""
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+    polyline = np.asarray(polyline, dtype=np.float64).reshape(-1, 2)
+    starts = polyline[:-1]
+    directions = polyline[1:] - starts
+    lengths_sq = (directions * directions).sum(axis=1)
+    offsets = positions[:, None, :] - starts[None, :, :]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratios = np.where(lengths_sq > 0, (offsets * directions).sum(axis=2) / lengths_sq, 0.0)
+    ratios = np.clip(ratios, 0.0, 1.0)
+    nearest = offsets - ratios[:, :, None] * directions[None, :, :]
+    return np.sqrt((nearest * nearest).sum(axis=2)).min(axis=1)
+
+
+def oob_distances(positions, road_points, lane_width):
+    """Distances of positions to the boundary of the lane of given width
+    centered on the road. Negative values mean that a position is out of the lane."""
+    return lane_width / 2 - distances_to_polyline(positions, road_points)
+
+
+class LocalExecutor:
+    """Executes road tests with the bicycle model. The executor is over when
+    time_budget seconds have been spent in execute_test, or test_budget tests
+    have been executed (no bound if None)."""
+
+    def __init__(self, time_budget=None, test_budget=None, map_size=200, lane_width=4.0,
+                 desired_speed=20, dt=0.1, max_steps=10000, min_road_length=20):
+        self.time_budget = time_budget
+        self.test_budget = test_budget
+        self.map_size = map_size
+        self.lane_width = lane_width
+        self.desired_speed = desired_speed
+        self.dt = dt
+        self.max_steps = max_steps
+        self.min_road_length = min_road_length
+        self.elapsed_time = 0.0
+        self.test_count = 0
+        self.outcome_counts = {}
+
+    def is_over(self):
+        return ((self.time_budget is not None and self.elapsed_time >= self.time_budget)
+                or (self.test_budget is not None and self.test_count >= self.test_budget))
+
+    def get_remaining_time(self):
+        return None if self.time_budget is None else max(0.0, self.time_budget - self.elapsed_time)
+
+    def validate_road(self, road_points):
+        """Returns a description of why a road is invalid, or None for valid roads."""
+        if len(road_points) < 2:
+            return "Road has less than two points."
+        if np.any(road_points < 0) or np.any(road_points > self.map_size):
+            return "Road is not inside the map."
+        if np.sum(np.linalg.norm(np.diff(road_points, axis=0), axis=1)) < self.min_road_length:
+            return "Road is too short."
+        return None
+
+    def execute_test(self, the_test):
+        """Returns (test_outcome, description, execution_data) as the
+        executors of the competition tool. test_outcome is "INVALID" (with
+        empty execution_data), "FAIL" if the vehicle left the lane, "PASS"
+        if it reached the end of the road, or "ERROR" if it did not within
+        max_steps steps."""
+        start = time.perf_counter()
+        road_points = np.asarray(the_test.interpolated_points, dtype=np.float64).reshape(-1, 2)
+        description = self.validate_road(road_points)
+        if description is not None:
+            (test_outcome, execution_data) = ("INVALID", [])
+        else:
+            self.test_count += 1
+            (test_outcome, description, execution_data) = self.drive(road_points)
+        self.outcome_counts[test_outcome] = self.outcome_counts.get(test_outcome, 0) + 1
+        self.elapsed_time += time.perf_counter() - start
+        return (test_outcome, description, execution_data)
+
+    def drive(self, road_points):
+        """Drives the vehicle along the road points until it reaches the end
+        or leaves the lane, and records every step."""
+        (xs, ys) = (road_points[:, 0], road_points[:, 1])
+        pid_gains_lat = {"K_P": 0.5, "K_D": 0.01, "K_I": 0.01, "dt": self.dt}
+        pid_gains_long = {"K_P": 2, "K_D": 0.01, "K_I": 0.01, "dt": self.dt}
+        vehicle = ve.Vehicle(xs[0], ys[0], np.arctan2(ys[1] - ys[0], xs[1] - xs[0]), 0)
+        pid_controller = co.VehiclePIDController(vehicle, pid_gains_lat, pid_gains_long)
+        execution_data = []
+        for (x, y) in zip(xs.tolist(), ys.tolist()):
+            waypoint = util.Waypoint(x, y)
+            while vehicle.distance_to(waypoint.transform.location) > self.desired_speed * self.dt:
+                if len(execution_data) >= self.max_steps:
+                    return ("ERROR", "Vehicle did not reach the end of the road.", execution_data)
+                control = pid_controller.run_step(self.desired_speed, waypoint)
+                vehicle.iterate(control, self.dt)
+                oob_distance = float(oob_distances([(vehicle.px, vehicle.py)], road_points, self.lane_width)[0])
+                execution_data.append(ExecutionRecord(vehicle.t, (vehicle.px, vehicle.py), vehicle.v,
+                                                      control.steer, oob_distance < 0, oob_distance))
+                if oob_distance < 0:
+                    return ("FAIL", "Vehicle left the lane.", execution_data)
+        return ("PASS", "Vehicle reached the end of the road.", execution_data)
+
+
+def main():
+    import sys
+    from crag.crag import CRAG
+    from crag.ipog import IPOGTestSuiteGenerator
+    import crag.roadgeometry as rg
+
+    test_budget = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    executor = LocalExecutor(test_budget=test_budget)
+    min_oob_sample_size = 5
+
+    core_params = {"use_seed": True, "seed_best": True, "best_ratio": 0.1, "resample": True,
+                   "fitness_aggregation_method": "average", "max_strength": 4}
+    geometry_params = {"road_section_count": 5, "param_value_count": 4, "max_road_scalar": 1.2,
+                       "min_road_scalar": 0.6, "lane_width": 10, "map_size": 200, "min_radius": 15}
+
+    def evaluate_function(road):
+        """The evaluate function of the library example."""
+        (road_points, is_in_map, is_reframable) = road
+        if (not is_in_map) and (not is_reframable):
+            return [1000]
+        if rg.is_likely_self_intersecting(road_points, geometry_params["lane_width"]):
+            return [1000]
+        if not is_reframable:
+            return [1000]
+        the_test = RoadTestFactory.create_road_test(road_points)
+        test_outcome, description, execution_data = executor.execute_test(the_test)
+        if execution_data:
+            min_oob_distances = heapq.nsmallest(min_oob_sample_size,
+                                                [getattr(x, 'oob_distance') for x in execution_data])
+            return [sum(min_oob_distances) / len(min_oob_distances)]
+        else:
+            return [100]
+
+    crag = CRAG(core_params, geometry_params, IPOGTestSuiteGenerator(), evaluate_function,
+                lambda: not executor.is_over())
+    roads_and_evaluations = crag.generate()
+    print(f"executed tests: {executor.test_count}, outcomes: {executor.outcome_counts}, "
+          f"time: {executor.elapsed_time:.1f} s")
+    print(f"smallest fitness: {min(evaluation[0] for (_, evaluation) in roads_and_evaluations):.3f}")
+
+
+if __name__ == "__main__":
+    main()
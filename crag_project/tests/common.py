@@ -0,0 +1,50 @@
+import random
+from crag import tsgenerator as tsgen
+
+CORE_PARAMS = {"use_seed": True, "seed_best": True, "best_ratio": 0.1, "resample": True,
+               "fitness_aggregation_method": "average", "max_strength": 3}
+GEOMETRY_PARAMS = {"road_section_count": 5, "param_value_count": 5, "max_road_scalar": 1.2, "min_road_scalar": 0.6,
+                   "lane_width": 10, "map_size": 200, "min_radius": 15}
+
+
+class RandomTestSuiteGenerator(tsgen.TestSuiteGenerator):
+    """Backend returning 10 * strength random tests, after the seeds."""
+
+    def call(self, strength):
+        return [[random.randrange(self.param_value_count) for _ in range(2 * self.road_section_count)]
+                for _ in range(10 * strength)]
+
+    def call_with_seed(self, strength, seed_test_suite):
+        return [list(test) for test in seed_test_suite] + self.call(strength)
+
+
+def real_evaluate_function(road):
+    (road_points, _, is_reframable) = road
+    return [road_points[-1][0] if is_reframable else 1000.0]
+
+
+def count_budget(count):
+    def budget_availability_function():
+        nonlocal count
+        count -= 1
+        return count >= 0
+    return budget_availability_function
+
+
+class CountedEvaluateFunction:
+    """real_evaluate_function with a budget of evaluation_count calls."""
+
+    def __init__(self, evaluation_count):
+        self.evaluation_count = evaluation_count
+        self.call_count = 0
+
+    def __call__(self, road):
+        self.call_count += 1
+        return real_evaluate_function(road)
+
+    def is_budget_available(self):
+        return self.call_count < self.evaluation_count
+
+
+def record_list(roads_and_evaluations):
+    return [(tuple(road), list(evaluation)) for (road, evaluation) in roads_and_evaluations]
@@ -0,0 +1,33 @@
+import random
+import numpy as np
+from crag import crag
+from .common import CORE_PARAMS, GEOMETRY_PARAMS, CountedEvaluateFunction, RandomTestSuiteGenerator
+
+
+def cached_generator(cache_filepath):
+    random.seed(1)
+    np.random.seed(1)
+    core_params = dict(CORE_PARAMS, evaluation_cache_filepath=str(cache_filepath))
+    evaluate_function = CountedEvaluateFunction(40)
+    return crag.CRAG(core_params, GEOMETRY_PARAMS, RandomTestSuiteGenerator(), evaluate_function,
+                     evaluate_function.is_budget_available)
+
+
+def test_cache_is_closed_when_generation_ends(tmp_path):
+    generator = cached_generator(tmp_path / "cache.db")
+    records = generator.iter_generate()
+    next(records)
+    assert generator.evaluation_cache.connection is not None
+    records.close()
+    assert generator.evaluation_cache.connection is None
+
+    generator.generate()
+    assert generator.evaluation_cache.connection is None
+    stored_count = len(generator.evaluation_cache)
+    assert stored_count > 0
+
+    # A later run reads the evaluations stored by the earlier ones
+    generator = cached_generator(tmp_path / "cache.db")
+    generator.generate()
+    assert generator.evaluation_cache.hit_count > 0
+    assert generator.evaluation_cache.connection is None
@@ -0,0 +1,29 @@
+import random
+import numpy as np
+import pytest
+from crag import crag
+from .common import CORE_PARAMS, GEOMETRY_PARAMS, CountedEvaluateFunction, RandomTestSuiteGenerator, record_list
+
+
+def evolution_generator(checkpoint_filepath, evaluation_count, **params):
+    random.seed(1)
+    np.random.seed(1)
+    core_params = dict(CORE_PARAMS, search_strategy="evolution", evolution_generation_count=4,
+                       checkpoint_filepath=str(checkpoint_filepath), checkpoint_interval=3, **params)
+    evaluate_function = CountedEvaluateFunction(evaluation_count)
+    return crag.CRAG(core_params, GEOMETRY_PARAMS, RandomTestSuiteGenerator(), evaluate_function,
+                     evaluate_function.is_budget_available)
+
+
+@pytest.mark.parametrize("params", [{}, {"evolution_mutant_count": 3}, {"evolution_mutant_count": 3,
+                                                                        "screen_roads": True}])
+@pytest.mark.parametrize("stop_count", [37, 61])
+def test_resumed_run_matches_uninterrupted_run(tmp_path, params, stop_count):
+    full_records = record_list(evolution_generator(tmp_path / "full.bin", 400, **params).generate())
+    partial_records = record_list(evolution_generator(tmp_path / "split.bin", stop_count, **params).generate())
+    # The test whose evolution was cut short is not reported
+    assert partial_records == full_records[:len(partial_records)]
+    resumed_records = record_list(evolution_generator(tmp_path / "split.bin", 400, **params).resume())
+    common_count = min(len(full_records), len(resumed_records))
+    assert common_count > len(partial_records)
+    assert resumed_records[:common_count] == full_records[:common_count]
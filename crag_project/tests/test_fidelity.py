@@ -0,0 +1,43 @@
+import random
+import numpy as np
+from crag import crag, fidelity
+from .common import (CORE_PARAMS, GEOMETRY_PARAMS, RandomTestSuiteGenerator, count_budget,
+                     real_evaluate_function)
+
+
+def test_top_k_keeps_only_roads_evaluated_on_the_highest_level():
+    random.seed(0)
+    np.random.seed(0)
+    ladder_calls = []
+
+    def cheap_evaluate_function(road):
+        # The cheap level scores every road better than any real evaluation
+        ladder_calls.append(road)
+        return [-1000.0]
+
+    generator = crag.CRAG(dict(CORE_PARAMS, fidelity_promotion_ratio=0.2), GEOMETRY_PARAMS,
+                          RandomTestSuiteGenerator(), real_evaluate_function, count_budget(50),
+                          fidelity_levels=[fidelity.FidelityLevel(cheap_evaluate_function)])
+    top_roads_and_evaluations = generator.generate(top_k=10)
+    assert ladder_calls
+    assert len(top_roads_and_evaluations) == 10
+    for (_, evaluation) in top_roads_and_evaluations:
+        assert not fidelity.is_low_fidelity(evaluation)
+        assert evaluation[0] > -1000.0
+
+
+def test_ladder_evaluations_do_not_use_the_budget_of_crag():
+    random.seed(0)
+    np.random.seed(0)
+    evaluated_roads = []
+
+    def counted_evaluate_function(road):
+        evaluated_roads.append(road)
+        return real_evaluate_function(road)
+
+    generator = crag.CRAG(dict(CORE_PARAMS, fidelity_promotion_ratio=0.5), GEOMETRY_PARAMS,
+                          RandomTestSuiteGenerator(), counted_evaluate_function, lambda: len(evaluated_roads) < 40,
+                          fidelity_levels=[fidelity.FidelityLevel(lambda road: [0.0], count_budget(1000))])
+    generator.generate()
+    assert len(evaluated_roads) == 40
+    assert generator.fidelity_statistics[0]["evaluated_count"] > 40
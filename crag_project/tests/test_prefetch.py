@@ -0,0 +1,45 @@
+import random
+import time
+import numpy as np
+import pytest
+from crag import crag, ipog
+from .common import CORE_PARAMS, GEOMETRY_PARAMS, CountedEvaluateFunction, record_list
+
+
+class SlowIPOGTestSuiteGenerator(ipog.IPOGTestSuiteGenerator):
+    """IPOG backend that takes a while, so that it overlaps with road sampling."""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def generate_test_suite(self, strength, seed_test_suite=None):
+        time.sleep(self.delay)
+        return super().generate_test_suite(strength, seed_test_suite)
+
+
+def prefetch_generator(evaluation_count, backend_delay, checkpoint_filepath=None, **params):
+    random.seed(3)
+    np.random.seed(3)
+    # Repetitions are sampled throughout the steps, while the backend runs in the background
+    core_params = dict(CORE_PARAMS, max_strength=4, prefetch=True, search_strategy="repetition", repetition_count=3,
+                       repetition_workers=1, checkpoint_filepath=checkpoint_filepath, checkpoint_interval=5, **params)
+    evaluate_function = CountedEvaluateFunction(evaluation_count)
+    return crag.CRAG(core_params, GEOMETRY_PARAMS, SlowIPOGTestSuiteGenerator(backend_delay), evaluate_function,
+                     evaluate_function.is_budget_available)
+
+
+@pytest.mark.parametrize("prefetch_ratio", [0.3, 1.0])
+def test_prefetch_does_not_depend_on_thread_timing(prefetch_ratio):
+    records = [record_list(prefetch_generator(600, backend_delay, prefetch_ratio=prefetch_ratio).generate())
+               for backend_delay in [0.0, 0.01, 0.05]]
+    assert records[0] == records[1] == records[2]
+
+
+def test_prefetch_resumed_run_matches_uninterrupted_run(tmp_path):
+    checkpoint_filepath = str(tmp_path / "prefetch.bin")
+    full_records = record_list(prefetch_generator(600, 0.0, prefetch_ratio=0.3).generate())
+    partial_records = record_list(prefetch_generator(250, 0.02, checkpoint_filepath, prefetch_ratio=0.3).generate())
+    resumed_records = record_list(prefetch_generator(350, 0.0, checkpoint_filepath, prefetch_ratio=0.3).resume())
+    assert len(partial_records) < len(resumed_records) <= len(full_records)
+    assert resumed_records == full_records[:len(resumed_records)]
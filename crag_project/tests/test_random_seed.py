@@ -0,0 +1,20 @@
+import random
+import numpy as np
+from crag import crag
+from .common import CORE_PARAMS, GEOMETRY_PARAMS, CountedEvaluateFunction, RandomTestSuiteGenerator, record_list
+
+
+def seeded_records(random_seed, global_seed):
+    random.seed(global_seed)
+    np.random.seed(global_seed)
+    core_params = dict(CORE_PARAMS, random_seed=random_seed)
+    evaluate_function = CountedEvaluateFunction(50)
+    return record_list(crag.CRAG(core_params, GEOMETRY_PARAMS, RandomTestSuiteGenerator(), evaluate_function,
+                                 evaluate_function.is_budget_available).generate())
+
+
+def test_random_seed_seeds_both_generators():
+    # Roads are sampled with np.random and the backend draws from random
+    records = seeded_records(7, 1)
+    assert records == seeded_records(7, 2)
+    assert records != seeded_records(8, 1)
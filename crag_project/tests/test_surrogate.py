@@ -0,0 +1,41 @@
+import tracemalloc
+import numpy as np
+from crag import surrogate
+
+
+def trained_knn_surrogate(sample_count=4096, seed=0):
+    random_state = np.random.RandomState(seed)
+    model = surrogate.KNNSurrogate(max_sample_count=sample_count)
+    for _ in range(sample_count):
+        model.update(random_state.random_sample(len(surrogate.FEATURE_NAMES)), random_state.random_sample())
+    return model
+
+
+def brute_force_knn_prediction(model, features):
+    (sample_features, fitness_values) = model.buffer.samples()
+    standardized_samples = model.standardize(sample_features)
+    standardized_features = model.standardize(features)
+    distances = ((standardized_features[:, None, :] - standardized_samples[None, :, :]) ** 2).sum(axis=2)
+    nearest = np.argsort(distances, axis=1)[:, :model.neighbor_count]
+    return fitness_values[nearest].mean(axis=1)
+
+
+def test_knn_predict_large_batch_in_bounded_memory():
+    model = trained_knn_surrogate()
+    features = np.random.RandomState(1).random_sample((3000, len(surrogate.FEATURE_NAMES)))
+    tracemalloc.start()
+    try:
+        predicted_fitness_values = model.predict(features)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert predicted_fitness_values.shape == (3000,)
+    # The full 3000 x 4096 x 7 difference tensor alone would take about 690 MB
+    assert peak_bytes < 100 * 1024 * 1024
+    np.testing.assert_allclose(predicted_fitness_values[:200], brute_force_knn_prediction(model, features[:200]))
+
+
+def test_knn_predict_does_not_depend_on_chunk_size():
+    model = trained_knn_surrogate(sample_count=500)
+    features = np.random.RandomState(2).random_sample((300, len(surrogate.FEATURE_NAMES)))
+    np.testing.assert_allclose(model.predict(features, max_chunk_elements=1000), model.predict(features))
@@ -0,0 +1,16 @@
+from crag import utils
+
+
+def test_update_maximum_keeps_the_largest_value():
+    maximum_dict = {}
+    assert utils.update_maximum(maximum_dict, [1, 2], 3.0) == 3.0
+    assert utils.update_maximum(maximum_dict, [1, 2], 5.0) == 5.0
+    assert utils.update_maximum(maximum_dict, [1, 2], 4.0) == 5.0
+    assert maximum_dict[(1, 2)] == (5.0, 3)
+
+
+def test_update_minimum_keeps_the_smallest_value():
+    minimum_dict = {}
+    for value in [3.0, 5.0, 1.0]:
+        utils.update_minimum(minimum_dict, [1, 2], value)
+    assert minimum_dict[(1, 2)] == (1.0, 3)
@@ -0,0 +1,36 @@
+import io
+import numpy as np
+from crag import wire
+
+
+class ShortReadStream(io.RawIOBase):
+    """Raw stream returning at most chunk_size bytes per read, like an unbuffered pipe."""
+
+    def __init__(self, data, chunk_size):
+        self.buffer = io.BytesIO(data)
+        self.chunk_size = chunk_size
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self.buffer.read(min(size, self.chunk_size))
+
+
+def test_read_exactly_collects_short_reads():
+    stream = ShortReadStream(bytes(range(10)), 3)
+    assert wire.read_exactly(stream, 7) == bytes(range(7))
+    assert wire.read_exactly(stream, 4) is None
+
+
+def test_road_frame_and_reply_survive_short_reads():
+    points = [(0.0, 0.0), (1.5, 2.5), (3.0, 4.0)]
+    output = io.BytesIO()
+    wire.write_road_frame(output, 7, (points, True, False), wire.POINT_DTYPES["float64"])
+    wire.write_reply(output, 7, 1.25, is_exit=True)
+    stream = ShortReadStream(output.getvalue(), 2)
+    (road_id, road_points, is_in_map, is_reframable) = wire.read_road_frame(stream, wire.POINT_DTYPES["float64"])
+    assert (road_id, is_in_map, is_reframable) == (7, True, False)
+    np.testing.assert_array_equal(road_points, np.array(points))
+    assert wire.read_reply(stream) == (7, 1.25, wire.EXIT)
+    assert wire.read_reply(stream) is None